@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+#
+# Finds exact and near duplicates in a photo library, replacing calculate_photo_hash.sh (one file at a
+# time, a full PNG render through convert per photo) and photo-normalization/list_rclone_dupes.sh (only
+# copies with an rclone `{id}` suffix).
+#
+# Every file is hashed in a pool of one process per core:
+#   - sha256_bytes: SHA-256 of the file, streamed in 1 MiB chunks
+#   - dhash: 64-bit difference hash of the auto-oriented photo, computed from a reduced decode (JPEGs
+#     are decoded at 1/8 scale), so re-encoded, resized or re-tagged copies get the same or a close hash
+#   - pixel_sha256_rgb: SHA-256 of the raw RGB bytes of the decoded pixels; it needs a full decode,
+#     --no-pixel-hash skips it (NA) when only the duplicate groups are needed. calculate_photo_hash.sh's
+#     pixel_sha256 hashed the PNG stream of `convert`, so the two never match and old TSVs cannot be compared
+#
+# Near duplicates are the photos whose dhashes differ in at most --threshold bits. They are looked up in a
+# multi-index: the hash is cut into threshold + 1 chunks, and two hashes within the threshold share at least
+# one chunk exactly, so only photos in the same chunk buckets are compared.
+#
+# Output: the columns of calculate_photo_hash.sh (path, sha256_bytes, then pixel_sha256_rgb) plus dhash on
+# stdout, and with --clusters a TSV of the duplicate groups with the copy to keep (largest resolution, then size).
+#
+# Usage:
+#   python3 dedupe_photos.py /mnt/photo-frame/Home/Original --clusters dupes.tsv > hashes.tsv
+#   python3 dedupe_photos.py /mnt/photo-frame/Home/Original --no-pixel-hash --clusters dupes.tsv > /dev/null
+#
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from resize_photos import ORIENTATION_TAG, TRANSPOSE, format_duration, sha256_file
+
+DEFAULT_THRESHOLD = 4
+HASH_BITS = 64
+# dHash compares neighbouring pixels of a 9x8 grayscale thumbnail
+DHASH_WIDTH, DHASH_HEIGHT = 9, 8
+# Long side of the pixel hash render, as the '4096x4096>' of calculate_photo_hash.sh
+PIXEL_HASH_MAX_SIDE = 4096
+# `photo {abc123}.jpg`, the copies rclone makes of duplicates; the original name is kept rather than them
+RCLONE_COPY = re.compile(r' \{[^}]+\}\.[^.]+$')
+
+PhotoHash = namedtuple('PhotoHash', 'path size sha256 pixel_sha256_rgb dhash width height error')
+
+
+def _oriented(image):
+    orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    return image.transpose(TRANSPOSE[orientation]) if orientation in TRANSPOSE else image
+
+
+def dhash(image):
+    """64-bit difference hash: one bit per horizontally neighbouring pair of a 9x8 thumbnail."""
+    pixels = image.convert('L').resize((DHASH_WIDTH, DHASH_HEIGHT), Image.Resampling.BILINEAR).tobytes()
+    value = 0
+    for row in range(DHASH_HEIGHT):
+        offset = row * DHASH_WIDTH
+        for column in range(DHASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def pixel_sha256_rgb(path):
+    """SHA-256 of the auto-oriented RGB pixels, limited to PIXEL_HASH_MAX_SIDE like the shell script."""
+    with Image.open(path) as image:
+        pixels = _oriented(image).convert('RGB')
+        pixels.thumbnail((PIXEL_HASH_MAX_SIDE, PIXEL_HASH_MAX_SIDE))
+        return hashlib.sha256(pixels.tobytes()).hexdigest()
+
+
+def hash_file(path, with_pixel_hash=True):
+    """Hashes one file; runs in the worker processes and never raises. Non-photos only get sha256."""
+    try:
+        size = os.path.getsize(path)
+        sha256 = sha256_file(path)
+    except OSError as e:
+        return PhotoHash(path, None, None, 'NA', None, None, None, f"{type(e).__name__}: {e}")
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if image.getexif().get(ORIENTATION_TAG, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            # The smallest DCT scale is plenty for a 9x8 thumbnail
+            image.draft('L', (DHASH_WIDTH * 8, DHASH_HEIGHT * 8))
+            value = dhash(_oriented(image))
+        pixel = pixel_sha256_rgb(path) if with_pixel_hash else 'NA'
+        return PhotoHash(path, size, sha256, pixel, value, width, height, None)
+    except Exception as e:
+        # Not a photo Pillow can read (videos, sidecars, HEIC without pillow-heif)
+        return PhotoHash(path, size, sha256, 'NA', None, None, None, f"{type(e).__name__}: {e}")
+
+
+def iter_files(path):
+    """The file itself, or every file under the folder (hidden ones too, as `find -type f`)."""
+    if os.path.isfile(path):
+        yield path
+        return
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path
+
+
+def hash_files(paths, workers=None, with_pixel_hash=True, on_result=None):
+    """PhotoHash of every path, hashed in a process pool; `on_result` is called as each one finishes."""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(hash_file, path, with_pixel_hash) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results
+
+
+class MultiIndex:
+    """
+    Hamming-distance index of 64-bit hashes. With `threshold` + 1 chunks, two hashes within the threshold
+    agree exactly on at least one chunk (pigeonhole), so a query only compares the hashes sharing a chunk.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, bits=HASH_BITS):
+        self.threshold = threshold
+        chunks = threshold + 1
+        widths = [bits // chunks + (1 if index < bits % chunks else 0) for index in range(chunks)]
+        self._chunks = []
+        shift = bits
+        for width in widths:
+            shift -= width
+            self._chunks.append((shift, (1 << width) - 1))
+        self._buckets = [{} for _ in self._chunks]
+        self._values = []
+
+    def add(self, value):
+        """Adds a hash and returns its number."""
+        number = len(self._values)
+        self._values.append(value)
+        for buckets, (shift, mask) in zip(self._buckets, self._chunks):
+            buckets.setdefault((value >> shift) & mask, []).append(number)
+        return number
+
+    def query(self, value):
+        """[(number, distance)] of the added hashes within the threshold of `value`."""
+        candidates = set()
+        for buckets, (shift, mask) in zip(self._buckets, self._chunks):
+            candidates.update(buckets.get((value >> shift) & mask, ()))
+        matches = []
+        for number in candidates:
+            distance = bin(value ^ self._values[number]).count('1')
+            if distance <= self.threshold:
+                matches.append((number, distance))
+        return matches
+
+
+def find_clusters(hashes, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups of duplicates, each a list of PhotoHash with more than one member: files with the same
+    sha256, joined with photos whose dhashes are within `threshold` bits.
+    """
+    parents = list(range(len(hashes)))
+
+    def root(number):
+        while parents[number] != number:
+            parents[number] = parents[parents[number]]
+            number = parents[number]
+        return number
+
+    def union(first, second):
+        first, second = root(first), root(second)
+        if first != second:
+            parents[second] = first
+
+    by_sha256 = {}
+    index = MultiIndex(threshold)
+    photo_numbers = []
+    for number, photo in enumerate(hashes):
+        if photo.sha256 is None:
+            continue
+        if photo.sha256 in by_sha256:
+            union(by_sha256[photo.sha256], number)
+            continue  # the same bytes, its dhash is already in the index
+        by_sha256[photo.sha256] = number
+        if photo.dhash is not None:
+            for match, _ in index.query(photo.dhash):
+                union(photo_numbers[match], number)
+            index.add(photo.dhash)
+            photo_numbers.append(number)
+
+    groups = {}
+    for number in range(len(hashes)):
+        if hashes[number].sha256 is not None:
+            groups.setdefault(root(number), []).append(hashes[number])
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def keeper(cluster):
+    """The copy to keep: the largest resolution, then the largest file, then not an rclone copy, then the shortest path."""
+    return min(cluster, key=lambda photo: (-(photo.width or 0) * (photo.height or 0), -(photo.size or 0),
+                                           bool(RCLONE_COPY.search(photo.path)), len(photo.path), photo.path))
+
+
+def duplicate_kind(photo, keep):
+    """`exact` for the same bytes as the kept copy, `near` for a similar photo."""
+    return 'exact' if photo.sha256 == keep.sha256 else 'near'
+
+
+def write_clusters(file, clusters):
+    file.write("cluster\tkind\tkeep\tpath\tsize\twidth\theight\tdistance\n")
+    for number, cluster in enumerate(sorted(clusters, key=lambda members: keeper(members).path), 1):
+        keep = keeper(cluster)
+        for photo in sorted(cluster, key=lambda member: (member is not keep, member.path)):
+            distance = (bin(photo.dhash ^ keep.dhash).count('1')
+                        if photo.dhash is not None and keep.dhash is not None else '')
+            file.write(f"{number}\t{duplicate_kind(photo, keep)}\t{int(photo is keep)}\t{photo.path}\t{photo.size}\t"
+                       f"{photo.width or ''}\t{photo.height or ''}\t{distance}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hash photos in parallel and group exact and near duplicates')
+    parser.add_argument('path', help='File or folder')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help='Most dhash bits two near duplicates may differ in (0 only finds re-encoded copies)')
+    parser.add_argument('--clusters', help='Write the duplicate groups to this TSV file')
+    parser.add_argument('--no-pixel-hash', dest='pixel_hash', action='store_false',
+                        help='Leave pixel_sha256_rgb NA instead of decoding every photo fully')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes, one per core by default')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"ERROR: '{args.path}' is neither a file nor a directory.", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    print("path\tsha256_bytes\tpixel_sha256_rgb\tdhash", flush=True)
+
+    def write_row(photo):
+        value = f"{photo.dhash:016x}" if photo.dhash is not None else 'NA'
+        print(f"{photo.path}\t{photo.sha256 or 'NA'}\t{photo.pixel_sha256_rgb}\t{value}", flush=True)
+
+    hashes = hash_files(list(iter_files(args.path)), args.workers, args.pixel_hash, on_result=write_row)
+    clusters = find_clusters(hashes, args.threshold)
+    if args.clusters:
+        with open(args.clusters, 'w') as file:
+            write_clusters(file, clusters)
+
+    kinds = {'exact': 0, 'near': 0}
+    for cluster in clusters:
+        keep = keeper(cluster)
+        for photo in cluster:
+            if photo is not keep:
+                kinds[duplicate_kind(photo, keep)] += 1
+    print(f"{len(hashes)} files hashed in {format_duration(time.perf_counter() - started)} with {args.workers} workers,"
+          f" {sum(1 for photo in hashes if photo.dhash is None)} without a perceptual hash", file=sys.stderr)
+    print(f"{len(clusters)} groups of duplicates: {kinds['exact']} exact copies and {kinds['near']} near duplicates"
+          f" (threshold {args.threshold} bits) besides the copies to keep", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
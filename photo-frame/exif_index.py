@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+#
+# Indexes the EXIF of a photo library into SQLite, replacing list_all_images_without_gps.sh (one exiftool
+# process per JPEG on every run), get_exif_data_from_photo.py (PIL `_getexif`, one hard-coded file) and
+# read_exif_data.py (exifread, one hard-coded file).
+#
+# Only the EXIF header is read: each JPEG is memory-mapped, its markers are walked up to the APP1 `Exif`
+# segment (whatever APPn segments come first, like the APP4 that made exifread give up in
+# ResizedFileError.txt) and the IFD0, Exif and GPS directories are parsed in place. No pixel is decoded,
+# and only the pages holding the header are read from disk; the walk ends at the frame header (SOF), which
+# gives the pixel size. TIFFs are parsed the same way from the start of the file; HEIC and PNG are not indexed.
+#
+# `update` reads the new and changed photos (size or mtime differ from their row) in a process pool and
+# forgets the removed ones, so after the first run it only stats the folder. The queries then run on the
+# indexes of the `exif` table and do not touch the photos:
+#   no-gps       photos without GPS coordinates (was list_all_images_without_gps.sh)
+#   on-this-day  photos taken on a day of the year, today by default
+#   rotated      photos with an EXIF orientation other than 1, that viewers have to rotate
+#   show         every indexed field of one file, read directly (does the resized photo still have its EXIF?)
+#
+# Usage:
+#   python3 exif_index.py --index exif_index.db update /home/ivan.cherednychok/Pictures/PhotoFrameOriginal
+#   python3 exif_index.py --index exif_index.db no-gps
+#   python3 exif_index.py --index exif_index.db on-this-day --date 01-16
+#   python3 exif_index.py show /home/ivan.cherednychok/Pictures/PhotoFrame/20220116_210743_resized.jpg
+#
+
+import argparse
+import mmap
+import os
+import pathlib
+import re
+import sqlite3
+import struct
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from photo_manifest import scan_tree
+from resize_photos import format_duration
+
+EXIF_INDEX_FILENAME = 'exif_index.db'
+EXIF_EXTENSIONS = ('jpg', 'jpeg', 'tif', 'tiff')
+# Photos handed to a worker at a time; parsing a header takes well under a millisecond
+CHUNK_SIZE = 64
+# Rows written per transaction
+BATCH_SIZE = 500
+# Sanity limit of the entries of one IFD, a corrupt count would otherwise walk the whole file
+MAX_IFD_ENTRIES = 1000
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_SOS, JPEG_EOI, JPEG_APP1 = 0xDA, 0xD9, 0xE1
+# Start of frame markers, SOF0-SOF15 but DHT, JPG and DAC
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field: TEM, RST0-7
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+EXIF_HEADER = b'Exif\x00\x00'
+TIFF_HEADERS = {b'II*\x00': '<', b'MM\x00*': '>'}
+
+# IFD0
+IMAGE_WIDTH, IMAGE_LENGTH = 0x0100, 0x0101
+MAKE, MODEL, ORIENTATION, DATE_TIME = 0x010F, 0x0110, 0x0112, 0x0132
+RATING = 0x4746
+EXIF_IFD, GPS_IFD = 0x8769, 0x8825
+# Exif IFD
+DATE_TIME_ORIGINAL, DATE_TIME_DIGITIZED = 0x9003, 0x9004
+EXPOSURE_TIME, F_NUMBER, ISO, FOCAL_LENGTH, LENS_MODEL = 0x829A, 0x829D, 0x8827, 0x920A, 0xA434
+# GPS IFD
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+GPS_ALTITUDE_REF, GPS_ALTITUDE = 5, 6
+
+BYTE, ASCII, SHORT, LONG, RATIONAL, UNDEFINED, SLONG, SRATIONAL = 1, 2, 3, 4, 5, 7, 9, 10
+TYPE_FORMATS = {BYTE: 'B', ASCII: 's', SHORT: 'H', LONG: 'I', RATIONAL: 'II', UNDEFINED: 'B', SLONG: 'i', SRATIONAL: 'ii'}
+TYPE_SIZES = {BYTE: 1, ASCII: 1, SHORT: 2, LONG: 4, RATIONAL: 8, UNDEFINED: 1, SLONG: 4, SRATIONAL: 8}
+
+EXIF_DATE = re.compile(rb'(\d{4}):(\d{2}):(\d{2}) (\d{2}):(\d{2}):(\d{2})')
+
+# `taken`: 'YYYY-MM-DD HH:MM:SS' from DateTimeOriginal, DateTimeDigitized or DateTime; `width`/`height`: the
+# stored pixels, before the orientation is applied; `exposure_time` in seconds, `focal_length` in mm; `error`: why
+# the header could not be read. A photo without EXIF has only its size and no error.
+ExifRecord = namedtuple('ExifRecord', 'path size mtime_ns make model taken orientation latitude longitude altitude'
+                                      ' width height f_number exposure_time iso focal_length lens rating error')
+# Columns of the exif table after the path, size and mtime_ns key
+EXIF_COLUMNS = ('make', 'model', 'taken', 'taken_md', 'orientation', 'latitude', 'longitude', 'altitude', 'width',
+                'height', 'f_number', 'exposure_time', 'iso', 'focal_length', 'lens', 'rating', 'error')
+
+
+def has_exif_extension(name):
+    return not name.startswith('.') and name.rsplit('.', 1)[-1].lower() in EXIF_EXTENSIONS
+
+
+def find_tiff(data):
+    """
+    (offset of the TIFF header holding the EXIF or None, (width, height) of a JPEG or None). Stops at the
+    frame header of a JPEG, the APPn segments come before it.
+    """
+    if data[:4] in TIFF_HEADERS:
+        return 0, None
+    if data[:2] != JPEG_SOI:
+        raise ValueError('neither a JPEG nor a TIFF')
+    tiff = None
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError(f'no JPEG marker at {position}')
+        marker = data[position + 1]
+        if marker == 0xFF:  # fill byte
+            position += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in (JPEG_SOS, JPEG_EOI):
+            break
+        length, = struct.unpack_from('>H', data, position + 2)
+        segment = position + 4
+        if marker in JPEG_SOF:
+            height, width = struct.unpack_from('>HH', data, segment + 1)
+            return tiff, (width, height)
+        if tiff is None and marker == JPEG_APP1 and data[segment:segment + len(EXIF_HEADER)] == EXIF_HEADER:
+            tiff = segment + len(EXIF_HEADER)
+        position += 2 + length
+    return tiff, None
+
+
+class TiffReader:
+    """The IFDs of a TIFF structure starting at `base` of `data`, read in place."""
+
+    def __init__(self, data, base):
+        self.data = data
+        self.base = base
+        self.endian = TIFF_HEADERS.get(data[base:base + 4])
+        if self.endian is None:
+            raise ValueError('bad TIFF header')
+
+    def first_ifd(self):
+        return struct.unpack_from(self.endian + 'I', self.data, self.base + 4)[0]
+
+    def ifd(self, offset):
+        """{tag: value} of the IFD at `offset` (from the TIFF header). Values are tuples, ASCII values bytes."""
+        data, endian = self.data, self.endian
+        position = self.base + offset
+        count, = struct.unpack_from(endian + 'H', data, position)
+        if count > MAX_IFD_ENTRIES:
+            raise ValueError(f'{count} entries in the IFD at {offset}')
+        entries = {}
+        for entry in range(position + 2, position + 2 + count * 12, 12):
+            tag, kind, number = struct.unpack_from(endian + 'HHI', data, entry)
+            if kind not in TYPE_FORMATS:
+                continue
+            size = TYPE_SIZES[kind] * number
+            start = entry + 8 if size <= 4 else self.base + struct.unpack_from(endian + 'I', data, entry + 8)[0]
+            if start + size > len(data):
+                continue  # points past the end, skip the tag rather than the photo
+            if kind == ASCII:
+                entries[tag] = bytes(data[start:start + size]).split(b'\x00', 1)[0].strip()
+            elif number <= MAX_IFD_ENTRIES:
+                entries[tag] = struct.unpack_from(endian + TYPE_FORMATS[kind] * number, data, start)
+        return entries
+
+
+def _text(entries, tag):
+    value = entries.get(tag)
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) and value else None
+
+
+def _rationals(value):
+    """(numerator, denominator, ...) as floats, None with a zero denominator."""
+    if not value or len(value) % 2:
+        return None
+    pairs = [(value[index], value[index + 1]) for index in range(0, len(value), 2)]
+    if any(denominator == 0 for _, denominator in pairs):
+        return None
+    return [numerator / denominator for numerator, denominator in pairs]
+
+
+def _rational(value):
+    parts = _rationals(value)
+    return parts[0] if parts else None
+
+
+def _number(value):
+    return value[0] if value else None
+
+
+def _degrees(value, reference, negative):
+    parts = _rationals(value)
+    if not parts or len(parts) != 3:
+        return None
+    degrees = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return -degrees if reference == negative else degrees
+
+
+def _taken(*values):
+    """The first valid EXIF date as 'YYYY-MM-DD HH:MM:SS'; cameras write 0000:00:00 when the clock is unset."""
+    for value in values:
+        match = EXIF_DATE.match(value) if isinstance(value, bytes) else None
+        if match and match.group(1) != b'0000' and match.group(2) != b'00':
+            year, month, day, hour, minute, second = (part.decode() for part in match.groups())
+            return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+    return None
+
+
+def parse_exif(data):
+    """
+    {make, model, taken, orientation, latitude, longitude, altitude, width, height, f_number, exposure_time, iso,
+    focal_length, lens, rating} of a memory-mapped file.
+    """
+    base, size = find_tiff(data)
+    if base is None:
+        return {'width': size[0], 'height': size[1]} if size else {}
+    reader = TiffReader(data, base)
+    ifd0 = reader.ifd(reader.first_ifd())
+    if size is None and IMAGE_WIDTH in ifd0 and IMAGE_LENGTH in ifd0:
+        size = ifd0[IMAGE_WIDTH][0], ifd0[IMAGE_LENGTH][0]
+    exif = reader.ifd(ifd0[EXIF_IFD][0]) if EXIF_IFD in ifd0 else {}
+    gps = reader.ifd(ifd0[GPS_IFD][0]) if GPS_IFD in ifd0 else {}
+
+    altitude = _rationals(gps.get(GPS_ALTITUDE))
+    if altitude and gps.get(GPS_ALTITUDE_REF) == (1,):  # below sea level
+        altitude = [-altitude[0]]
+    return {
+        'make': _text(ifd0, MAKE),
+        'model': _text(ifd0, MODEL),
+        'taken': _taken(exif.get(DATE_TIME_ORIGINAL), exif.get(DATE_TIME_DIGITIZED), ifd0.get(DATE_TIME)),
+        'orientation': _number(ifd0.get(ORIENTATION)),
+        'latitude': _degrees(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF), b'S'),
+        'longitude': _degrees(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF), b'W'),
+        'altitude': altitude[0] if altitude else None,
+        'width': size[0] if size else None,
+        'height': size[1] if size else None,
+        'f_number': _rational(exif.get(F_NUMBER)),
+        'exposure_time': _rational(exif.get(EXPOSURE_TIME)),
+        'iso': _number(exif.get(ISO)),
+        'focal_length': _rational(exif.get(FOCAL_LENGTH)),
+        'lens': _text(exif, LENS_MODEL),
+        'rating': _number(ifd0.get(RATING)),
+    }
+
+
+def read_exif(path, stat=None):
+    """ExifRecord of one file; runs in the worker processes and never raises."""
+    fields = dict.fromkeys(ExifRecord._fields)
+    fields['path'] = path
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            fields['size'], fields['mtime_ns'] = stat or (size, os.fstat(file.fileno()).st_mtime_ns)
+            if size == 0:
+                raise ValueError('empty file')
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                fields.update(parse_exif(data))
+    except struct.error:
+        fields['error'] = 'ValueError: truncated EXIF header'
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        fields['error'] = f"{type(e).__name__}: {e}"
+    return ExifRecord(**fields)
+
+
+def read_all(paths, stats, workers=None):
+    """ExifRecord of every path, read in a process pool in chunks of CHUNK_SIZE."""
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        yield from executor.map(read_exif, paths, stats, chunksize=CHUNK_SIZE)
+
+
+class ExifIndex:
+    """
+    The `exif` table, keyed by absolute path. `taken_md` (MM-DD) serves the on-this-day query. With
+    `read_only` the index is only queried: nothing is created and the file is not changed.
+    """
+
+    def __init__(self, path, read_only=False):
+        if read_only:
+            self._connection = sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", uri=True)
+            return
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS exif ('
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' make TEXT,'
+            ' model TEXT,'
+            ' taken TEXT,'
+            ' taken_md TEXT,'
+            ' orientation INTEGER,'
+            ' latitude REAL,'
+            ' longitude REAL,'
+            ' altitude REAL,'
+            ' width INTEGER,'
+            ' height INTEGER,'
+            ' f_number REAL,'
+            ' exposure_time REAL,'
+            ' iso INTEGER,'
+            ' focal_length REAL,'
+            ' lens TEXT,'
+            ' rating INTEGER,'
+            ' error TEXT)'
+        )
+        # Partial indexes: each query reads only its own entries, however large the library
+        self._connection.execute('CREATE INDEX IF NOT EXISTS exif_no_gps ON exif (path) WHERE latitude IS NULL')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS exif_rotated ON exif (path) WHERE orientation != 1')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS exif_taken_md ON exif (taken_md, taken)')
+
+    def stats(self, root):
+        """{path: (size, mtime_ns)} of the indexed files under `root`."""
+        cursor = self._connection.execute(
+            'SELECT path, size, mtime_ns FROM exif WHERE path >= ? AND path < ?',
+            (root + os.sep, root + chr(ord(os.sep) + 1)),
+        )
+        return {path: (size, mtime_ns) for path, size, mtime_ns in cursor}
+
+    def records(self, root):
+        """{path relative to `root`: ExifRecord} of the indexed files under `root`."""
+        cursor = self._connection.execute(
+            f"SELECT {', '.join(ExifRecord._fields)} FROM exif WHERE path >= ? AND path < ?",
+            (root + os.sep, root + chr(ord(os.sep) + 1)),
+        )
+        return {os.path.relpath(row[0], root): ExifRecord(*row) for row in cursor}
+
+    def store(self, records):
+        """Upserts the records, BATCH_SIZE per transaction. Returns how many were written."""
+        written = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == BATCH_SIZE:
+                written += self._store_batch(batch)
+                batch = []
+        return written + self._store_batch(batch)
+
+    def _store_batch(self, batch):
+        if not batch:
+            return 0
+        self._connection.execute('BEGIN')
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO exif (path, size, mtime_ns, {', '.join(EXIF_COLUMNS)})"
+            f" VALUES ({', '.join('?' * (3 + len(EXIF_COLUMNS)))})",
+            ((record.path, record.size, record.mtime_ns, record.make, record.model, record.taken,
+              record.taken[5:10] if record.taken else None, record.orientation, record.latitude,
+              record.longitude, record.altitude, record.width, record.height, record.f_number,
+              record.exposure_time, record.iso, record.focal_length, record.lens, record.rating, record.error)
+             for record in batch),
+        )
+        self._connection.execute('COMMIT')
+        return len(batch)
+
+    def forget(self, paths):
+        self._connection.execute('BEGIN')
+        self._connection.executemany('DELETE FROM exif WHERE path = ?', ((path,) for path in paths))
+        self._connection.execute('COMMIT')
+
+    def without_gps(self):
+        return self._connection.execute(
+            'SELECT path, taken, make, model, error FROM exif WHERE latitude IS NULL ORDER BY path').fetchall()
+
+    def taken_on(self, month_day):
+        return self._connection.execute(
+            'SELECT path, taken, latitude, longitude FROM exif WHERE taken_md = ? ORDER BY taken',
+            (month_day,)).fetchall()
+
+    def rotated(self):
+        return self._connection.execute(
+            'SELECT path, orientation, make, model FROM exif WHERE orientation != 1 ORDER BY path').fetchall()
+
+    def close(self):
+        self._connection.close()
+
+
+def update(index, root, workers=None):
+    """Reads the new and changed photos under `root` and forgets the removed ones. Returns (scanned, read, removed)."""
+    root = os.path.abspath(root)
+    files = {os.path.join(root, path): stat for path, stat in scan_tree(root, accept=has_exif_extension).items()}
+    rows = index.stats(root)
+    todo = [path for path, stat in files.items() if rows.get(path) != tuple(stat)]
+    gone = [path for path in rows if path not in files]
+    read = index.store(read_all(todo, [files[path] for path in todo], workers))
+    index.forget(gone)
+    return len(files), read, len(gone)
+
+
+def _month_day(value):
+    """MM-DD of 'MM-DD' or 'YYYY-MM-DD'."""
+    match = re.fullmatch(r'(?:\d{4}-)?(\d{2})-(\d{2})', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"expected MM-DD or YYYY-MM-DD, got '{value}'")
+    return f"{match.group(1)}-{match.group(2)}"
+
+
+def _print_rows(rows, started):
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+    print(f"{len(rows)} photos in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the EXIF of photos and query it')
+    parser.add_argument('--index', default=EXIF_INDEX_FILENAME, help='Index database (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help='Index the new and changed photos of a folder')
+    update_parser.add_argument('photo_dir')
+    update_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes, one per core by default')
+    commands.add_parser('no-gps', help='Photos without GPS coordinates')
+    on_this_day = commands.add_parser('on-this-day', help='Photos taken on a day of any year')
+    on_this_day.add_argument('--date', type=_month_day, default=date.today().strftime('%m-%d'), help='MM-DD, today by default')
+    commands.add_parser('rotated', help='Photos with an orientation other than 1')
+    show = commands.add_parser('show', help='Read the EXIF of one file, without the index')
+    show.add_argument('file')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        record = read_exif(args.file)
+        for field in ExifRecord._fields:
+            print(f"{field}: {'' if getattr(record, field) is None else getattr(record, field)}")
+        return 1 if record.error else 0
+
+    started = time.perf_counter()
+    index = ExifIndex(args.index)
+    try:
+        if args.command == 'update':
+            if not os.path.isdir(args.photo_dir):
+                print(f"ERROR: Directory '{args.photo_dir}' does not exist.", file=sys.stderr)
+                return 2
+            scanned, read, removed = update(index, args.photo_dir, args.workers)
+            print(f"{scanned} photos in {args.photo_dir}: {read} read, {removed} removed from {args.index}"
+                  f" in {format_duration(time.perf_counter() - started)}")
+        elif args.command == 'no-gps':
+            _print_rows(index.without_gps(), started)
+        elif args.command == 'on-this-day':
+            _print_rows(index.taken_on(args.date), started)
+        elif args.command == 'rotated':
+            _print_rows(index.rotated(), started)
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
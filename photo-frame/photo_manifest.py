@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+#
+# Persistent manifest of one photo library location (Home, Batanovs, Cherednychoks): a SQLite table with
+# every original's path, size, mtime, SHA-256 and the resized photo derived from it.
+#
+# It replaces the _lastSyncedTimestamp file and `find -cnewer`:
+#   - a row is written as soon as its photo is done, so a crash only loses the photos in flight
+#   - a photo copied in with an old ctime is still new, because it has no row
+#   - a photo whose mtime changed but whose content did not (re-synced, touched) is not resized again
+# and remove_missing_photos.sh / compare_missing_files.sh: one os.scandir pass over each folder tells
+# which photos are new, changed or unchanged, which resized photos went missing and which are orphaned.
+#
+# The first run adopts resized photos that already exist and are newer than their original, so
+# switching from the timestamp file does not resize the whole library again. Their hash stays empty
+# until the original changes.
+#
+# Usage (report only, changes nothing; resize_photos.py --manifest does the work):
+#   python3 photo_manifest.py <original dir> <resized dir> --manifest photo_manifest.db [--list]
+#
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from resize_photos import is_photo, output_name, sha256_file
+
+MANIFEST_FILENAME = 'photo_manifest.db'
+HASH_WORKERS = 4
+# Orphan removal is refused above this share of the resized photos, unless forced
+MAX_ORPHAN_SHARE = 0.2
+
+# A file found by scan_tree; `mtime_ns` as in os.stat
+FileStat = namedtuple('FileStat', 'size mtime_ns')
+ManifestRow = namedtuple('ManifestRow', 'path size mtime_ns sha256 output output_size output_mtime_ns processed_at error')
+
+# new/changed/retry/unchanged/adopted: relative paths of originals; orphaned_rows: rows whose original is
+# gone; orphaned_outputs: resized photos no original maps to
+Plan = namedtuple('Plan', 'new changed retry unchanged adopted orphaned_rows orphaned_outputs')
+
+
+def hash_files(paths, workers=HASH_WORKERS):
+    """{path: sha256} hashed in threads; hashlib releases the GIL, so they run in parallel."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(sha256_file, paths)))
+
+
+def scan_tree(root, accept=is_photo, recursive=True):
+    """{path relative to root: FileStat} of the accepted files, one os.scandir pass, hidden entries skipped."""
+    files = {}
+    if not os.path.isdir(root):
+        return files
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.is_file() and accept(entry.name):
+                    stat = entry.stat()
+                    files[os.path.relpath(entry.path, root)] = FileStat(stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class PhotoManifest:
+    """The `photos` table of one location. Every write is committed right away."""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS photos ('
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' sha256 TEXT,'
+            ' output TEXT,'
+            ' output_size INTEGER,'
+            ' output_mtime_ns INTEGER,'
+            ' processed_at REAL,'
+            ' error TEXT)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS photos_sha256 ON photos (sha256)')
+
+    def rows(self):
+        """{path: ManifestRow} of the whole manifest."""
+        cursor = self._connection.execute(f"SELECT {', '.join(ManifestRow._fields)} FROM photos")
+        return {row[0]: ManifestRow(*row) for row in cursor}
+
+    def record(self, path, stat, sha256=None, output=None, output_stat=None, error=None):
+        """Writes the state of one original after it was processed (or failed with `error`)."""
+        self._connection.execute(
+            'INSERT INTO photos (path, size, mtime_ns, sha256, output, output_size, output_mtime_ns, processed_at, error)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,'
+            ' sha256 = COALESCE(excluded.sha256, photos.sha256), output = excluded.output,'
+            ' output_size = excluded.output_size, output_mtime_ns = excluded.output_mtime_ns,'
+            ' processed_at = excluded.processed_at, error = excluded.error',
+            (path, stat.size, stat.mtime_ns, sha256, output,
+             output_stat.size if output_stat else None, output_stat.mtime_ns if output_stat else None,
+             time.time(), error),
+        )
+
+    def touch(self, path, stat):
+        """The original's size/mtime changed but its content did not."""
+        self._connection.execute('UPDATE photos SET size = ?, mtime_ns = ? WHERE path = ?',
+                                 (stat.size, stat.mtime_ns, path))
+
+    def forget(self, paths):
+        self._connection.execute('BEGIN')
+        self._connection.executemany('DELETE FROM photos WHERE path = ?', ((path,) for path in paths))
+        self._connection.execute('COMMIT')
+
+    def close(self):
+        self._connection.close()
+
+
+def make_plan(manifest, watch_dir, output_dir):
+    """Compares both folders with the manifest, one scan of each."""
+    sources = scan_tree(watch_dir)
+    # The resized photos are flat, like the output names; folders someone added there are left alone
+    outputs = scan_tree(output_dir, recursive=False)
+    rows = manifest.rows()
+    plan = Plan([], [], [], [], [], [], [])
+
+    claimed = set()
+    for path, stat in sources.items():
+        output = output_name(os.path.basename(path))
+        claimed.add(output)
+        row = rows.get(path)
+        if row is None:
+            resized = outputs.get(output)
+            if resized is not None and resized.mtime_ns >= stat.mtime_ns:
+                plan.adopted.append(path)
+            else:
+                plan.new.append(path)
+        elif (row.size, row.mtime_ns) != stat:
+            plan.changed.append(path)
+        elif row.error or row.output not in outputs:
+            plan.retry.append(path)
+        else:
+            plan.unchanged.append(path)
+
+    plan.orphaned_rows.extend(path for path in rows if path not in sources)
+    plan.orphaned_outputs.extend(path for path in outputs if path not in claimed)
+    return plan, sources, outputs
+
+
+def split_changed(manifest, watch_dir, changed, sources, outputs, workers=HASH_WORKERS):
+    """
+    Hashes the changed originals and returns the ones to process again. The ones with the same content
+    and a resized photo in place only get their new size/mtime recorded.
+    """
+    rows = manifest.rows()
+    hashes = hash_files([os.path.join(watch_dir, path) for path in changed], workers)
+    modified = []
+    for path in changed:
+        row = rows[path]
+        if row.sha256 == hashes[os.path.join(watch_dir, path)] and not row.error and row.output in outputs:
+            manifest.touch(path, sources[path])
+        else:
+            modified.append(path)
+    return modified
+
+
+def adopt(manifest, adopted, sources, outputs):
+    """Records resized photos made before the manifest existed, without reading them."""
+    for path in adopted:
+        output = output_name(os.path.basename(path))
+        manifest.record(path, sources[path], output=output, output_stat=outputs[output])
+
+
+def orphan_check(plan, sources, outputs, max_share=MAX_ORPHAN_SHARE):
+    """
+    None when removing the orphans looks safe, otherwise the reason it does not: no originals at all, or more
+    than `max_share` of the resized photos orphaned, looks like an unmounted share or a half-finished sync.
+    """
+    if not plan.orphaned_outputs and not plan.orphaned_rows:
+        return None
+    if not sources:
+        return "no originals were found"
+    if outputs and len(plan.orphaned_outputs) > max_share * len(outputs):
+        return (f"{len(plan.orphaned_outputs)} of {len(outputs)} resized photos are orphaned,"
+                f" more than {max_share:.0%}")
+    return None
+
+
+def remove_orphans(manifest, plan, output_dir):
+    """Deletes the orphaned resized photos and forgets the originals that are gone. Returns the removed paths."""
+    removed = []
+    for path in plan.orphaned_outputs:
+        try:
+            os.remove(os.path.join(output_dir, path))
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    manifest.forget(plan.orphaned_rows)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show what is new, changed or orphaned in a photo location')
+    parser.add_argument('watch_dir', help='Folder with the original photos')
+    parser.add_argument('output_dir', help='Folder with the resized photos')
+    parser.add_argument('--manifest', help=f'Manifest database, {MANIFEST_FILENAME} next to the two folders by default')
+    parser.add_argument('--list', action='store_true', help='Also list the paths of every group but unchanged')
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or os.path.join(os.path.dirname(os.path.abspath(args.watch_dir)), MANIFEST_FILENAME)
+    manifest = PhotoManifest(manifest_path)
+    started = time.perf_counter()
+    plan, _, _ = make_plan(manifest, args.watch_dir, args.output_dir)
+    manifest.close()
+
+    print(f"Manifest: {manifest_path}, scanned in {time.perf_counter() - started:.2f}s")
+    for group in Plan._fields:
+        paths = getattr(plan, group)
+        print(f"{group.replace('_', ' ')}: {len(paths)}")
+        if args.list and group != 'unchanged':
+            for path in sorted(paths):
+                print(f"  {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+#
+# Resize engine of the photo frames: resizes every new photo of WATCH_DIR into OUTPUT_DIR so it covers
+# the frame's 1280x1024 box, the way resize_new_photos.sh did with convert/identify/bc, but
+#   - each photo is decoded once; JPEGs are decoded at the smallest DCT scale (1/2, 1/4, 1/8) that still
+#     covers the box (Pillow's draft mode), which skips most of the decoding work for camera photos
+#   - auto-orientation is a transpose of the decoded pixels, and the EXIF block is written with the
+#     resized image (orientation reset to 1), so there is no separate exif copy step
+#   - photos that are already small enough and upright are copied byte for byte
+#   - the photos are processed by a pool of one process per core
+#
+# With --manifest only the new and changed photos are processed, and each one is recorded in the location's
+# photo_manifest.py database as soon as it is done; --remove-orphans also deletes the resized photos whose
+# original is gone. It refuses when no originals were found or more than a fifth of the resized photos would
+# go, which looks like an unmounted share or a half-finished sync; --force removes them anyway.
+# Without --manifest every photo of WATCH_DIR is processed.
+#
+# Rules, as before: photos larger than the box in either direction are scaled by
+# max(width / W, height / H) + 0.01 (so both sides stay at or above the box), smaller ones are copied.
+# Unlike convert, a photo that would have to be enlarged to cover the box (e.g. a 3000x800 panorama) is
+# copied as it is, the frame scales it anyway.
+# HEIC and TIFF become JPEG (JPG when the original extension was upper case); HEIC needs pillow-heif.
+#
+# Usage:
+#   python3 resize_photos.py <watch dir> <output dir> [--manifest photo_manifest.db --remove-orphans [--force]]
+#                            [--workers 4]
+#
+# Prints one line per photo with its timings and the totals at the end. The exit code is 0 also when
+# single photos failed (they are reported with ERROR), like the shell script.
+#
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from PIL import Image
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass  # HEIC photos are reported as failed
+
+RESIZE_WIDTH = 1280
+RESIZE_HEIGHT = 1024
+# Added to the scale factor, so rounding never leaves a side below the box
+SCALE_MARGIN = 0.01
+JPEG_QUALITY = 95
+HASH_CHUNK_SIZE = 1024 * 1024
+
+PHOTO_EXTENSIONS = ('jpg', 'jpeg', 'png', 'heic', 'tif', 'tiff')
+CONVERT_TO_JPEG = ('heic', 'tif', 'tiff')
+
+ORIENTATION_TAG = 0x0112
+TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+SWAPS_SIDES = (5, 6, 7, 8)
+SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG'}
+
+# action: resized, copied, converted (re-encoded without resizing) or failed
+ResizeResult = namedtuple(
+    'ResizeResult',
+    'path output action original_size output_size draft decode_seconds resize_seconds save_seconds seconds error sha256'
+)
+
+
+def log(message):
+    print(f"[{datetime.now():%d-%m-%Y %H:%M:%S}] {message}", flush=True)
+
+
+def format_duration(seconds):
+    """`1h 2m 3s`, `2m 3s` or `3.4s`, as the shell scripts printed it."""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m {seconds % 60}s"
+    return f"{seconds // 60}m {seconds % 60}s"
+
+
+def sha256_file(path):
+    """Hex SHA-256 of the file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_photo(name):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return extension in PHOTO_EXTENSIONS
+
+
+def iter_photos(watch_dir):
+    """Paths of the photos under `watch_dir`, skipping hidden files and folders."""
+    stack = [watch_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and is_photo(entry.name):
+                    yield entry.path
+
+
+def output_name(filename):
+    """`IMG_1.HEIC` -> `IMG_1.JPG`, `a.tif` -> `a.jpg`; other extensions are kept."""
+    stem, extension = filename.rsplit('.', 1)
+    if extension.lower() in CONVERT_TO_JPEG:
+        extension = 'JPG' if any(char.isupper() for char in extension) else 'jpg'
+    return f"{stem}.{extension}"
+
+
+def cover_size(width, height, box_width=RESIZE_WIDTH, box_height=RESIZE_HEIGHT):
+    """
+    Size that covers the box, or None when the photo is not larger than it or would have to be
+    enlarged to cover it.
+    """
+    if width <= box_width and height <= box_height:
+        return None
+    scale = max(box_width / width, box_height / height) + SCALE_MARGIN
+    if scale >= 1:
+        return None
+    return int(width * scale), int(height * scale)
+
+
+def resize_photo(path, output_dir, box_width=RESIZE_WIDTH, box_height=RESIZE_HEIGHT, with_hash=False):
+    """
+    Resizes or copies one photo into `output_dir`, with the SHA-256 of the original when `with_hash`.
+    Runs in the worker processes, never raises.
+    """
+    started = time.perf_counter()
+    output = os.path.join(output_dir, output_name(os.path.basename(path)))
+    decode_seconds = resize_seconds = save_seconds = 0.0
+    original_size = output_size = sha256 = None
+    draft = 1
+    try:
+        if with_hash:
+            sha256 = sha256_file(path)
+        with Image.open(path) as image:
+            exif = image.getexif()
+            orientation = exif.get(ORIENTATION_TAG, 1)
+            original_size = image.size
+            width, height = image.size
+            if orientation in SWAPS_SIDES:
+                width, height = height, width
+            target = cover_size(width, height, box_width, box_height)
+            extension = output.rsplit('.', 1)[-1].lower()
+            converts = extension != path.rsplit('.', 1)[-1].lower()
+
+            if target is None and orientation not in TRANSPOSE and not converts:
+                # Nothing to change: the original bytes, with their EXIF, are the result
+                output_size = (width, height)
+                tmp_output = _tmp_path(output)
+                shutil.copy2(path, tmp_output)
+                os.replace(tmp_output, output)
+                return ResizeResult(path, output, 'copied', original_size, output_size, draft,
+                                    0.0, 0.0, 0.0, time.perf_counter() - started, None, sha256)
+
+            decode_started = time.perf_counter()
+            if target is not None and image.format == 'JPEG':
+                stored_target = target[::-1] if orientation in SWAPS_SIDES else target
+                image.draft(image.mode, stored_target)
+                draft = original_size[0] // image.size[0]
+            image.load()
+            decode_seconds = time.perf_counter() - decode_started
+
+            resize_started = time.perf_counter()
+            pixels = image
+            if orientation in TRANSPOSE:
+                pixels = pixels.transpose(TRANSPOSE[orientation])
+            if target is not None:
+                pixels = pixels.resize(target, Image.Resampling.LANCZOS)
+            save_format = SAVE_FORMATS[extension]
+            if save_format == 'JPEG' and pixels.mode not in ('RGB', 'L', 'CMYK'):
+                pixels = pixels.convert('RGB')
+            resize_seconds = time.perf_counter() - resize_started
+
+            save_started = time.perf_counter()
+            if orientation in TRANSPOSE:
+                exif[ORIENTATION_TAG] = 1
+            options = {'exif': exif.tobytes()} if exif else {}
+            if image.info.get('icc_profile'):
+                options['icc_profile'] = image.info['icc_profile']
+            if save_format == 'JPEG':
+                options['quality'] = JPEG_QUALITY
+            tmp_output = _tmp_path(output)
+            pixels.save(tmp_output, save_format, **options)
+            os.replace(tmp_output, output)
+            save_seconds = time.perf_counter() - save_started
+            output_size = pixels.size
+
+        action = 'resized' if target is not None else 'converted'
+        return ResizeResult(path, output, action, original_size, output_size, draft,
+                            decode_seconds, resize_seconds, save_seconds, time.perf_counter() - started, None, sha256)
+    except Exception as e:
+        _remove_quietly(_tmp_path(output))
+        return ResizeResult(path, output, 'failed', original_size, None, draft, decode_seconds, resize_seconds,
+                            save_seconds, time.perf_counter() - started, f"{type(e).__name__}: {e}", sha256)
+
+
+def _tmp_path(output):
+    # Hidden, so neither rclone nor the next scan picks up a half-written photo
+    directory, filename = os.path.split(output)
+    return os.path.join(directory, f".{filename}.tmp")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def describe(result):
+    name = os.path.basename(result.path)
+    if result.error:
+        return f"ERROR: Failed to resize {name}: {result.error}"
+    size = f"{result.original_size[0]}x{result.original_size[1]}"
+    if result.action == 'resized':
+        size += f" -> {result.output_size[0]}x{result.output_size[1]}"
+        if result.draft > 1:
+            size += f" (decoded at 1/{result.draft})"
+    timings = f"{result.seconds:.2f}s"
+    if result.action != 'copied':
+        timings += (f" (decode {result.decode_seconds:.2f}s, resize {result.resize_seconds:.2f}s,"
+                    f" save {result.save_seconds:.2f}s)")
+    return f"[{name}] {result.action} {size} in {timings}"
+
+
+def resize_photos(paths, output_dir, workers=None, box_width=RESIZE_WIDTH, box_height=RESIZE_HEIGHT, on_result=None,
+                  with_hash=False):
+    """
+    Resizes `paths` into `output_dir` in a pool of `workers` processes (one per core by default).
+    Calls `on_result(result)` in this process as each photo finishes and returns all the results.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(resize_photo, path, output_dir, box_width, box_height, with_hash) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results
+
+
+def summarize(results, wall_seconds, workers):
+    counts = {}
+    for result in results:
+        counts[result.action] = counts.get(result.action, 0) + 1
+    busy = sum(result.seconds for result in results)
+    stages = {
+        'decode': sum(result.decode_seconds for result in results),
+        'resize': sum(result.resize_seconds for result in results),
+        'save': sum(result.save_seconds for result in results),
+    }
+    rate = len(results) / wall_seconds if wall_seconds else 0.0
+    lines = [
+        f"Total time: {format_duration(wall_seconds)} for {len(results)} photos ({rate:.1f}/s, {workers} workers)",
+        f"Worker time: {format_duration(busy)} ("
+        + ", ".join(f"{stage} {format_duration(seconds)}" for stage, seconds in stages.items()) + ")",
+        f"Total converted files: {counts.get('resized', 0) + counts.get('converted', 0)}"
+        f" (resized {counts.get('resized', 0)}, converted {counts.get('converted', 0)}),"
+        f" copied {counts.get('copied', 0)}, failed {counts.get('failed', 0)}",
+    ]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resize new photos for the photo frame on all cores')
+    parser.add_argument('watch_dir', help='Folder with the original photos')
+    parser.add_argument('output_dir', help='Folder for the resized photos')
+    parser.add_argument('--manifest', help='Manifest database of the location: only new and changed photos are processed')
+    parser.add_argument('--remove-orphans', action='store_true',
+                        help='With --manifest, delete resized photos whose original is gone')
+    parser.add_argument('--force', action='store_true',
+                        help='Remove the orphans even when no originals were found or many photos would go')
+    parser.add_argument('--width', type=int, default=RESIZE_WIDTH)
+    parser.add_argument('--height', type=int, default=RESIZE_HEIGHT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes, one per core by default')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.watch_dir):
+        print(f"ERROR: {args.watch_dir} is not a folder", file=sys.stderr)
+        return 2
+
+    log("Initializing resizing...")
+    manifest = sources = None
+    if args.manifest:
+        from photo_manifest import FileStat, PhotoManifest, adopt, make_plan, split_changed
+
+        manifest = PhotoManifest(args.manifest)
+        plan, sources, outputs = make_plan(manifest, args.watch_dir, args.output_dir)
+        adopt(manifest, plan.adopted, sources, outputs)
+        modified = split_changed(manifest, args.watch_dir, plan.changed, sources, outputs)
+        log(f"Manifest: {len(plan.new)} new, {len(modified)} changed, {len(plan.retry)} to retry,"
+            f" {len(plan.unchanged) + len(plan.changed) - len(modified)} unchanged, {len(plan.adopted)} adopted,"
+            f" {len(plan.orphaned_outputs)} orphaned")
+        paths = [os.path.join(args.watch_dir, path) for path in plan.new + modified + plan.retry]
+    else:
+        paths = list(iter_photos(args.watch_dir))
+    log(f"{len(paths)} photos to process with {args.workers} workers")
+
+    started = time.perf_counter()
+    done = 0
+
+    def report(result):
+        nonlocal done
+        done += 1
+        log(f"#{done} of {len(paths)} {describe(result)}")
+        if manifest is not None:
+            # Recorded right away, so an interrupted run resumes after the last finished photo
+            path = os.path.relpath(result.path, args.watch_dir)
+            output_stat = None
+            if not result.error:
+                stat = os.stat(result.output)
+                output_stat = FileStat(stat.st_size, stat.st_mtime_ns)
+            manifest.record(path, sources[path], result.sha256, os.path.basename(result.output), output_stat, result.error)
+
+    try:
+        results = resize_photos(paths, args.output_dir, args.workers, args.width, args.height, on_result=report,
+                                with_hash=manifest is not None)
+        print(summarize(results, time.perf_counter() - started, args.workers), flush=True)
+
+        if manifest is not None and args.remove_orphans:
+            from photo_manifest import orphan_check, remove_orphans
+
+            refusal = None if args.force else orphan_check(plan, sources, outputs)
+            if refusal:
+                log(f"WARNING: Not removing orphans, {refusal}. Is {args.watch_dir} mounted and synced?"
+                    f" --force removes them anyway")
+            else:
+                for path in remove_orphans(manifest, plan, args.output_dir):
+                    log(f"Removing {os.path.join(args.output_dir, path)}")
+                log(f"Forgot {len(plan.orphaned_rows)} originals that are gone")
+    finally:
+        if manifest is not None:
+            manifest.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+#
+# Seeds picframe's database with the photos of a frame right after a sync, so they are shown within seconds.
+# Left alone, picframe walks the photo folder, opens every new photo with PIL and writes it to its
+# `file` and `meta` tables one at a time before showing it.
+#
+# In one WAL transaction, this script:
+#   1. removes duplicate rows, keeping the smallest file_id of each folder, basename and lowercased
+#      extension (as photo-normalization/normalize_photo_extensions_in_db.sh did)
+#   2. removes the rows of photos that are no longer in the folder (rclone sync deletes them)
+#   3. spells each extension as the file on disk does, lowercase for files outside the folder
+#   4. upserts the file and meta rows of the new and changed JPEGs
+#   5. marks the folders as scanned when picframe has nothing left to read in them
+# It also adds the expression index that steps 1 and 3 need.
+#
+# The EXIF comes from the exif_index.py index the NAS builds over Resized/, matched by the path relative to
+# `--indexed-dir` and the file size. Photos missing from it are read here with the same header-only reader
+# on all cores. picframe only fills in what is left: PNG, HEIC and videos, and photos whose EXIF could not
+# be read. The meta rows hold what picframe would store from the EXIF, but a photo without DateTimeOriginal is
+# dated by its EXIF DateTime rather than the file time, which a sync changes. Title, caption and tags come from
+# IPTC, which the header-only reader does not parse: they stay empty, so picframe's text overlay and tag filters
+# do not see them for seeded photos.
+#
+# picframe creates the database on its first start. The paths must be written as picframe's `pic_dir`.
+#
+# Usage:
+#   python3 seed_picframe_db.py ~/Pictures/PhotoFrame --db ~/picframe_data/data/pictureframe.db3 \
+#       --exif-index ~/Pictures/exif_index.db --indexed-dir /mnt/photo-frame/Home/Resized
+#   python3 seed_picframe_db.py ~/Pictures/PhotoFrame --dry-run     # show what would change
+#   python3 seed_picframe_db.py ~/Pictures/PhotoFrame --backup      # copy the database first
+#
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from exif_index import ExifIndex, read_all
+from resize_photos import format_duration, log
+
+PICFRAME_DB = '~/picframe_data/data/pictureframe.db3'
+# ImageCache.EXTENSIONS + VIDEO_EXTENSIONS of picframe, the files it shows
+PICFRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.heif', '.heic', '.mp4', '.mkv', '.flv', '.mov', '.avi', '.webm', '.hevc')
+# The ones exif_index.py reads
+SEEDED_EXTENSIONS = ('jpg', 'jpeg')
+# Orientations that swap width and height, picframe stores the displayed size
+SWAPS_SIDES = (5, 6, 7, 8)
+# picframe's write lock is held for single inserts, waiting for it is enough
+LOCK_TIMEOUT = 30
+
+# One photo on disk; `mtime` as os.path.getmtime, which picframe compares with file.last_modified
+DiskFile = namedtuple('DiskFile', 'folder basename extension mtime size')
+# A row of picframe's `file` table, with whether it has a meta row
+FileRow = namedtuple('FileRow', 'file_id folder_id basename extension last_modified has_meta')
+# The meta columns seeded from the EXIF; title, caption and tags are IPTC
+META_COLUMNS = ('orientation', 'exif_datetime', 'f_number', 'exposure_time', 'iso', 'focal_length', 'make', 'model',
+                'lens', 'rating', 'latitude', 'longitude', 'width', 'height')
+SeedReport = namedtuple('SeedReport', 'duplicates removed renamed inserted updated unchanged left_to_picframe folders')
+
+
+def file_key(folder, basename, extension):
+    return folder, basename, extension.lower()
+
+
+def scan_picture_dir(root):
+    """
+    ({folder: int mtime}, {(folder, basename, lowercased extension): DiskFile}) of the files picframe shows,
+    hidden files and folders skipped as picframe does. Folder names are built like os.walk's.
+    """
+    folders = {}
+    files = {}
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        folders[folder] = int(os.stat(folder).st_mtime)
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):  # picframe's follow_links is off by default
+                    stack.append(entry.path)
+                    continue
+                basename, extension = os.path.splitext(entry.name)
+                if extension.lower() in PICFRAME_EXTENSIONS and entry.is_file():
+                    stat = entry.stat()
+                    extension = extension.lstrip('.')
+                    files[file_key(folder, basename, extension)] = DiskFile(
+                        folder, basename, extension, stat.st_mtime, stat.st_size)
+    return folders, files
+
+
+def load_rows(connection):
+    """{(folder name, basename, lowercased extension): FileRow}, the row with the smallest file_id of each key."""
+    cursor = connection.execute(
+        'SELECT folder.name, file.file_id, file.folder_id, file.basename, file.extension, file.last_modified,'
+        ' meta.file_id IS NOT NULL FROM file JOIN folder ON folder.folder_id = file.folder_id'
+        ' LEFT JOIN meta ON meta.file_id = file.file_id ORDER BY file.file_id DESC'
+    )
+    return {file_key(name, row[2], row[3]): FileRow(*row) for name, *row in cursor}
+
+
+def is_unchanged(row, disk):
+    """What picframe checks before reading a photo again, and a meta row to show it with."""
+    return row is not None and row.extension == disk.extension and row.last_modified >= disk.mtime and row.has_meta
+
+
+def exposure(seconds):
+    """'1/250' below a second, as cameras and picframe's overlay write it, '2.5' otherwise."""
+    if seconds is None or seconds <= 0:
+        return None
+    return f"1/{round(1 / seconds)}" if seconds < 1 else f"{seconds:g}"
+
+
+def meta_values(record, disk):
+    """The meta columns picframe fills from a photo's EXIF, from an ExifRecord, in META_COLUMNS order."""
+    orientation = record.orientation or 1
+    width, height = record.width or 0, record.height or 0
+    if orientation in SWAPS_SIDES:
+        width, height = height, width
+    taken = time.mktime(time.strptime(record.taken, '%Y-%m-%d %H:%M:%S')) if record.taken else disk.mtime
+    return (orientation, taken,
+            round(record.f_number, 1) if record.f_number else 0, exposure(record.exposure_time), record.iso or 0,
+            f"{record.focal_length:g}" if record.focal_length else None,
+            record.make, record.model, record.lens, record.rating,
+            round(record.latitude, 4) if record.latitude is not None else None,
+            round(record.longitude, 4) if record.longitude is not None else None,
+            width, height)
+
+
+def collect_records(to_seed, exif_index, indexed_dir, root, workers=None):
+    """{key: ExifRecord} of the photos to seed, from the index where the size matches, read here otherwise."""
+    indexed = {}
+    if exif_index:
+        # Read only: the copy just downloaded from the NAS is queried as it is, also on a dry run
+        index = ExifIndex(exif_index, read_only=True)
+        indexed = index.records(os.path.abspath(indexed_dir))
+        index.close()
+
+    records = {}
+    to_read = {}
+    for key, disk in to_seed.items():
+        path = os.path.join(disk.folder, f"{disk.basename}.{disk.extension}")
+        record = indexed.get(os.path.relpath(path, root))
+        if record is not None and record.size == disk.size and not record.error:
+            records[key] = record
+        else:
+            to_read[path] = key
+    for record in read_all(list(to_read), [None] * len(to_read), workers):
+        if not record.error:
+            records[to_read[record.path]] = record
+    return records, len(to_read)
+
+
+def seed(connection, folders, files, records):
+    """Applies the five steps in the current transaction. Returns a SeedReport."""
+    connection.execute('CREATE INDEX IF NOT EXISTS file_folder_basename_lower_extension'
+                       ' ON file (folder_id, basename, lower(extension))')
+    duplicates = connection.execute(
+        'DELETE FROM file WHERE file_id NOT IN'
+        ' (SELECT MIN(file_id) FROM file GROUP BY folder_id, basename, lower(extension))').rowcount
+    # picframe's Clean_Meta_Trigger does this too
+    connection.execute('DELETE FROM meta WHERE file_id NOT IN (SELECT file_id FROM file)')
+
+    connection.executemany('INSERT OR IGNORE INTO folder (name) VALUES (?)', ((folder,) for folder in folders))
+    folder_ids = {name: folder_id for folder_id, name in connection.execute('SELECT folder_id, name FROM folder')}
+    rows = load_rows(connection)
+
+    gone = [row.file_id for key, row in rows.items() if key[0] in folders and key not in files]
+    connection.executemany('DELETE FROM file WHERE file_id = ?', ((file_id,) for file_id in gone))
+    connection.executemany('DELETE FROM meta WHERE file_id = ?', ((file_id,) for file_id in gone))
+
+    renamed = []
+    for key, row in rows.items():
+        if key[0] in folders and key not in files:
+            continue  # removed above
+        disk = files.get(key)
+        extension = disk.extension if disk else row.extension.lower()
+        if row.extension != extension:
+            renamed.append((extension, row.file_id))
+    connection.executemany('UPDATE file SET extension = ? WHERE file_id = ?', renamed)
+
+    inserted = updated = unchanged = left_to_picframe = 0
+    unfinished_folders = set()
+    for key, disk in files.items():
+        row = rows.get(key)
+        if is_unchanged(row, disk):
+            unchanged += 1
+            continue
+        record = records.get(key)
+        if record is None:
+            left_to_picframe += 1
+            unfinished_folders.add(disk.folder)
+            continue
+        if row is None:
+            file_id = connection.execute(
+                'INSERT INTO file (folder_id, basename, extension, last_modified) VALUES (?, ?, ?, ?)',
+                (folder_ids[disk.folder], disk.basename, disk.extension, disk.mtime)).lastrowid
+            inserted += 1
+        else:
+            file_id = row.file_id
+            connection.execute('UPDATE file SET extension = ?, last_modified = ? WHERE file_id = ?',
+                               (disk.extension, disk.mtime, file_id))
+            updated += 1
+        connection.execute(
+            f"INSERT OR REPLACE INTO meta (file_id, {', '.join(META_COLUMNS)})"
+            f" VALUES ({', '.join('?' * (1 + len(META_COLUMNS)))})",
+            (file_id, *meta_values(record, disk)))
+
+    # A folder newer than its row makes picframe list it again; one with photos left to read has to be
+    done = [(mtime, folder) for folder, mtime in folders.items() if folder not in unfinished_folders]
+    connection.executemany('UPDATE folder SET last_modified = ?, missing = 0 WHERE name = ?', done)
+    return SeedReport(duplicates, len(gone), len(renamed), inserted, updated, unchanged, left_to_picframe, len(done))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed picframe's database with the photos of a frame")
+    parser.add_argument('picture_dir', help="picframe's pic_dir, written the same way")
+    parser.add_argument('--db', default=PICFRAME_DB, help="picframe's database (default: %(default)s)")
+    parser.add_argument('--exif-index', help='exif_index.py index of the photos, built on the NAS')
+    parser.add_argument('--indexed-dir', help='Folder the index was built from, the picture folder by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes reading EXIF, one per core by default')
+    parser.add_argument('--backup', action='store_true', help='Copy the database to <db>.bak.<timestamp> first')
+    parser.add_argument('--dry-run', action='store_true', help='Show what would change, change nothing')
+    args = parser.parse_args()
+
+    root = os.path.expanduser(args.picture_dir).rstrip(os.sep) or os.sep
+    db = os.path.expanduser(args.db)
+    if not os.path.isdir(root):
+        print(f"ERROR: Directory '{root}' does not exist.", file=sys.stderr)
+        return 2
+    if not os.path.isfile(db):
+        print(f"ERROR: Database '{db}' does not exist, start picframe once to create it.", file=sys.stderr)
+        return 2
+    if args.exif_index and not os.path.isfile(args.exif_index):
+        print(f"ERROR: EXIF index '{args.exif_index}' does not exist.", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    connection = sqlite3.connect(db, isolation_level=None, timeout=LOCK_TIMEOUT)
+    try:
+        tables = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not {'folder', 'file', 'meta'} <= tables:
+            print(f"ERROR: '{db}' is not a picframe database.", file=sys.stderr)
+            return 2
+        if args.backup and not args.dry_run:
+            backup = f"{db}.bak.{datetime.now():%Y%m%d%H%M%S}"
+            copy = sqlite3.connect(backup)
+            connection.backup(copy)
+            copy.close()
+            log(f"Backup: {backup}")
+        if not args.dry_run:
+            # Persistent, so a dry run leaves it as picframe set it
+            connection.execute('PRAGMA journal_mode=WAL')
+
+        folders, files = scan_picture_dir(root)
+        rows = load_rows(connection)
+        to_seed = {key: disk for key, disk in files.items()
+                   if disk.extension.lower() in SEEDED_EXTENSIONS and not is_unchanged(rows.get(key), disk)}
+        records, read_here = collect_records(to_seed, args.exif_index, args.indexed_dir or root, root, args.workers)
+        log(f"{len(files)} photos in {root}, {len(to_seed)} to seed: {len(to_seed) - read_here} from the index,"
+            f" {read_here} read here")
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            report = seed(connection, folders, files, records)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('ROLLBACK' if args.dry_run else 'COMMIT')
+    finally:
+        connection.close()
+
+    for field in SeedReport._fields:
+        log(f"{field.replace('_', ' ')}: {getattr(report, field)}")
+    log(f"{'Dry run, nothing changed' if args.dry_run else 'Done'} in {format_duration(time.perf_counter() - started)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
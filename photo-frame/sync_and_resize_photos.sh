@@ -34,5 +34,16 @@ rclone sync -v "nasikphotos:/Photo-Frames/${PHOTOS_SUBDIR}/Resized" "$HOME/Pictu
   --checkers=8
 
 # Process images
-# /home/ivan.cherednychok/Documents/Scripts/PhotoFrame/resize_new_photos.sh
-# /home/ivan.cherednychok/Documents/Scripts/PhotoFrame/remove_missing_photos.sh
\ No newline at end of file
+# /home/ivan.cherednychok/Documents/Scripts/PhotoFrame/resize_new_photos.sh  # also removes photos whose original is gone
+
+# Seed picframe's database with the synced photos, so it shows them without rescanning the folder.
+# The EXIF comes from the index resize_new_photos_lxc.sh builds next to Resized on the NAS; without it the
+# photos are read here.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+EXIF_INDEX="$HOME/Pictures/exif_index.db"
+seed_args=(--db "$HOME/picframe_data/data/pictureframe.db3")
+if rclone copyto "nasikphotos:/Photo-Frames/${PHOTOS_SUBDIR}/exif_index.db" "$EXIF_INDEX"; then
+  seed_args+=(--exif-index "$EXIF_INDEX" --indexed-dir "/mnt/photo-frame/${PHOTOS_SUBDIR}/Resized")
+fi
+python3 "$SCRIPT_DIR/seed_picframe_db.py" "$HOME/Pictures/PhotoFrame" "${seed_args[@]}" \
+  || echo "WARNING: Seeding picframe's database failed, picframe will scan the folder itself"
@@ -0,0 +1,112 @@
+#
+# Manifest of what the book parsers generated, so a regeneration only touches what changed.
+#
+# It lives next to the articles (<output_dir>/.manifest.json) and records:
+#   rules      hash of the parsing rules (the parser's RULES_VERSION, backend and book profile) of the last run
+#   documents  per EPUB document: hash of its source, the day file it produced and that file's hash
+#
+# A document is parsed again only when its source or the rules changed, and a day file is written
+# only when its text changed. A day file whose hash differs from the recorded one was fixed by hand
+# and is left alone unless the run is forced. Without a manifest (first run) an existing file that
+# differs from the generated text is treated as hand-fixed as well.
+#
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = '.manifest.json'
+MANIFEST_VERSION = 1
+
+UNCHANGED = 'unchanged'
+WRITTEN = 'written'
+HAND_EDITED = 'hand-edited'
+
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def rules_hash(*rules):
+    """Hash of the given plain values (a rules version, the parser backend, a profile's settings)."""
+    digest = hashlib.sha256()
+    for rule in rules:
+        digest.update(repr(rule).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def atomic_write(path, data):
+    """Writes `data` to a temporary file next to `path` and renames it over, so readers never see half a file."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as file:
+            file.write(data.encode('utf-8') if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as file:
+            return content_hash(file.read())
+    except FileNotFoundError:
+        return None
+
+
+class ArticleManifest:
+    """Decides per document whether it has to be parsed and per day file whether it may be written."""
+
+    def __init__(self, output_dir, rules):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.rules = rules
+        self.documents = {}
+        previous = {}
+        if os.path.isfile(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                previous = json.load(file)
+        # Entries made under other rules still tell which files were hand-edited
+        self.previous = previous.get('documents', {}) if previous.get('version') == MANIFEST_VERSION else {}
+        self.same_rules = previous.get('rules') == rules
+
+    def is_unchanged(self, file_name, source):
+        """True when the document can be skipped: same source, same rules, nothing to redo."""
+        entry = self.previous.get(file_name)
+        if (self.same_rules and entry and entry['source'] == source
+                and (entry['day'] is None or os.path.exists(os.path.join(self.output_dir, entry['day'])))):
+            self.documents[file_name] = entry
+            return True
+        return False
+
+    def save_day(self, file_name, source, day_file, text, force=False):
+        """Writes the parsed day unless it is unchanged or was edited by hand. Returns what happened."""
+        entry = self.previous.get(file_name, {})
+        if day_file is None:
+            self.documents[file_name] = {'source': source, 'day': None, 'output': None}
+            return UNCHANGED
+
+        path = os.path.join(self.output_dir, day_file)
+        generated = content_hash(text)
+        on_disk = file_hash(path)
+        # What we wrote last time, or for a first run just what we would write now
+        recorded = entry.get('output') if entry.get('day') == day_file else generated
+
+        if on_disk is not None and on_disk != recorded and not force:
+            # Keep the recorded hash, so the file is recognised as hand-edited on the next run too
+            self.documents[file_name] = {'source': source, 'day': day_file, 'output': recorded}
+            return HAND_EDITED
+
+        self.documents[file_name] = {'source': source, 'day': day_file, 'output': generated}
+        if on_disk == generated:
+            return UNCHANGED
+        atomic_write(path, text)
+        return WRITTEN
+
+    def save(self):
+        manifest = {'version': MANIFEST_VERSION, 'rules': self.rules, 'documents': self.documents}
+        atomic_write(self.path, json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True) + '\n')
@@ -0,0 +1,358 @@
+#
+# Splits a book into daily articles (daily_articles/<book>/MM-DD (D month).txt), driven by a
+# book profile from book_profiles.py: which tags hold the content, the date and the title, how
+# tags are rewritten and how the day's text is assembled. Adding a book means adding a profile.
+#
+#   python book_parser.py stoic parent --workers 4
+#   python book_parser.py stoic --force     # empty the output folder and rewrite every day, hand-edited ones too
+#
+# The EPUB is read entry by entry straight from the zip, in the order of its package manifest,
+# and handed to a process pool a few documents at a time. Only the tags the profile reads are
+# parsed (SoupStrainer), with lxml when it is installed.
+#
+# Regeneration is incremental (see article_manifest.py): only days whose chapter or parsing
+# rules (RULES_VERSION, the backend and the profile) changed are rewritten, and days fixed by hand are kept.
+#
+# Notes: This is not generating the end clean result for all files and may require some manual adjutments
+# so when regenerating articles keep that in mind
+#
+
+import argparse
+import os
+import posixpath
+import shutil
+import time
+import warnings
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+from xml.etree import ElementTree
+
+from bs4 import BeautifulSoup, SoupStrainer, XMLParsedAsHTMLWarning
+
+from article_manifest import HAND_EDITED, UNCHANGED, WRITTEN, ArticleManifest, content_hash, rules_hash
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PARSER = 'lxml' if find_spec('lxml') else 'html.parser'
+# Part of the manifest's rules hash: bump it when a change to the parsing code changes the articles it
+# writes, so the next run parses every book again. Comments and refactorings leave it alone.
+RULES_VERSION = 1
+DOCUMENT_MEDIA_TYPE = 'application/xhtml+xml'
+# Months in the genitive, as in the books' `D month` dates
+MONTH_NUMBERS = {
+    'січня': '01', 'лютого': '02', 'березня': '03', 'квітня': '04',
+    'травня': '05', 'червня': '06', 'липня': '07', 'серпня': '08',
+    'вересня': '09', 'жовтня': '10', 'листопада': '11', 'грудня': '12'
+}
+
+# The books are XHTML, parsing them as HTML is intended
+warnings.filterwarnings('ignore', category=XMLParsedAsHTMLWarning)
+
+
+class BookProfile:
+    """
+    Declarative description of a book. Selectors are `tag` or `tag.class`, as in the book's markup.
+
+    content   the element that holds the day
+    date      where the `D month` date is: inside the rewritten content (`date_in_content`) or anywhere
+    title     optional title element, rendered before the blocks
+    rewrites  tag rewrites applied to the content in order, see REWRITES
+    render    'markup' keeps the rewritten content's children as HTML, one per line;
+              'blocks' renders the content's children through `blocks` templates
+    """
+
+    def __init__(self, name, epub, output, content, date, date_in_content=False, title=None,
+                 rewrites=(), render='markup', header='', title_template='', blocks=()):
+        self.name = name
+        self.epub = epub
+        self.output = output
+        self.content = content
+        self.date = date
+        self.date_in_content = date_in_content
+        self.title = title
+        self.rewrites = tuple(rewrites)
+        self.render = render
+        self.header = header
+        self.title_template = title_template
+        self.blocks = tuple(blocks)
+
+    def rules(self):
+        """Everything that shapes the output, for the manifest's rules hash."""
+        return (self.content, self.date, self.date_in_content, self.title, self.rewrites, self.render,
+                self.header, self.title_template, self.blocks)
+
+    def strainer(self):
+        """Parse only the tags read outside of the content element."""
+        selectors = [self.content] + ([] if self.date_in_content else [self.date]) + ([self.title] if self.title else [])
+        names, classes = zip(*(split_selector(selector) for selector in selectors))
+        return SoupStrainer(sorted(set(names)), class_=sorted({cls for cls in classes if cls}) or None)
+
+
+def split_selector(selector):
+    name, _, cls = selector.partition('.')
+    return name, cls or None
+
+
+def find(root, selector):
+    name, cls = split_selector(selector)
+    return root.find(name, class_=cls) if cls else root.find(name)
+
+
+def find_all(root, selector):
+    name, cls = split_selector(selector)
+    return root.find_all(name, class_=cls) if cls else root.find_all(name)
+
+
+def matches(element, selector):
+    name, cls = split_selector(selector)
+    return element.name == name and (cls is None or cls in element.get('class', []))
+
+
+def clean_text(tag):
+    for s in tag.select('span, a'):
+        s.decompose()  # Remove all span and a tags, including nested ones
+    return ' '.join(tag.stripped_strings)  # Combine strings and strip extra whitespace
+
+
+# Tag rewrites a profile can use, each `(name, selector, ...)`
+def _decompose(content, selector):
+    for tag in find_all(content, selector):
+        tag.decompose()
+
+
+def _unwrap(content, selector):
+    for tag in find_all(content, selector):
+        tag.unwrap()
+
+
+def _rename(content, selector, name, keep_class=False):
+    for tag in find_all(content, selector):
+        tag.name = name
+        if not keep_class:
+            del tag['class']
+
+
+def _append_text(content, source, target, separator):
+    """Moves the text of every `source` tag to the end of every `target` tag, each part after `separator`."""
+    parts = []
+    for tag in find_all(content, source):
+        parts.append(separator + tag.get_text())
+        tag.decompose()
+    text = ''.join(parts)
+    for tag in find_all(content, target):
+        tag.append(text)
+
+
+def _flatten(content, selector):
+    """Replaces the tag with its plain text."""
+    for tag in find_all(content, selector):
+        text_only = tag.get_text()
+        tag.clear()
+        tag.append(text_only)
+        tag.unwrap()
+
+
+REWRITES = {
+    'decompose': _decompose,
+    'unwrap': _unwrap,
+    'rename': _rename,
+    'append_text': _append_text,
+    'flatten': _flatten,
+}
+
+
+def parse_date(date_text):
+    """'5 січня' -> '01-05', None when it is not a date."""
+    parts = date_text.split()
+    if len(parts) == 2 and parts[1] in MONTH_NUMBERS:
+        return f"{MONTH_NUMBERS[parts[1]]}-{parts[0].zfill(2)}"
+    return None
+
+
+def render_markup(content):
+    # Every child on its own line, trailing whitespace dropped, all in one buffer
+    return ''.join(str(child).rstrip() + '\n' for child in content.children).strip()
+
+
+def render_blocks(profile, soup, content, date_text):
+    parts = [profile.header.format(date=date_text)]
+    title = find(soup, profile.title) if profile.title else None
+    if title:
+        parts.append(profile.title_template.format(text=clean_text(title)))
+
+    # Elements in the order they appear, each with the first block template that matches
+    for element in content.children:
+        for block in profile.blocks:
+            if not matches(element, block['select']):
+                continue
+            text = clean_text(element)
+            if block.get('skip_empty') and not text:
+                break
+            sibling = None
+            if block.get('sibling'):
+                name, cls = split_selector(block['sibling'])
+                sibling = element.find_next_sibling(name, class_=cls)
+            if sibling:
+                parts.append(block['with_sibling'].format(text=text, sibling=clean_text(sibling)))
+            else:
+                parts.append(block['template'].format(text=text))
+            break
+    return ''.join(parts).rstrip()
+
+
+def parse_document(profile, file_name, content, parser=DEFAULT_PARSER):
+    """
+    Turns one EPUB document into (filename, text) of its day, or (None, message) when it holds no day.
+    Runs in the worker processes, so it only takes and returns picklable values.
+    """
+    soup = BeautifulSoup(content, parser, parse_only=profile.strainer())
+    content_tag = find(soup, profile.content)
+    if not content_tag:
+        return None, f"Content division not found in {file_name}"
+
+    for name, *args in profile.rewrites:
+        REWRITES[name](content_tag, *args)
+
+    date_tag = find(content_tag if profile.date_in_content else soup, profile.date)
+    if not date_tag:
+        return None, f"Date not found in {file_name}"
+    date_text = date_tag.text.strip()
+    mm_dd = parse_date(date_text)
+    if not mm_dd:
+        return None, f"Invalid date format found in {file_name}"
+
+    if profile.render == 'blocks':
+        text = render_blocks(profile, soup, content_tag, date_text)
+    else:
+        text = render_markup(content_tag)
+    return f"{mm_dd} ({date_text}).txt", text
+
+
+def _parse_document(args):
+    return parse_document(*args)
+
+
+def iter_documents(epub_path):
+    """Yields (file_name, content) of the EPUB's XHTML documents in manifest order, one entry at a time."""
+    with zipfile.ZipFile(epub_path) as book:
+        container = ElementTree.fromstring(book.read('META-INF/container.xml'))
+        opf_path = container.find('.//{*}rootfile').get('full-path')
+        package = ElementTree.fromstring(book.read(opf_path))
+        opf_dir = posixpath.dirname(opf_path)
+
+        for item in package.iterfind('{*}manifest/{*}item'):
+            if item.get('media-type') != DOCUMENT_MEDIA_TYPE or 'nav' in (item.get('properties') or '').split():
+                continue
+            file_name = posixpath.normpath(item.get('href'))
+            yield file_name, book.read(posixpath.join(opf_dir, file_name) if opf_dir else file_name)
+
+
+def ordered_map(pool, function, items, window):
+    """pool.map that keeps at most `window` tasks in flight, so the input is consumed lazily."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def clear_directory(directory):
+    """Deletes all files in the specified directory."""
+    for filename in os.listdir(directory):
+        file_path = os.path.join(directory, filename)
+        try:
+            if os.path.isfile(file_path) or os.path.islink(file_path):
+                os.unlink(file_path)  # Remove file or link
+            elif os.path.isdir(file_path):
+                shutil.rmtree(file_path)  # Remove directory and all its contents
+        except Exception as e:
+            print(f'Failed to delete {file_path}. Reason: {e}')
+
+
+def extract_and_save_content(profile, epub_path=None, output_dir=None, workers=None, parser=DEFAULT_PARSER,
+                             force=False):
+    """
+    Regenerates the daily articles of the profile's book. Only documents whose source or parsing rules
+    changed are parsed and days fixed by hand are kept, unless `force` is set: then the output folder is
+    emptied first and every day is written anew, for every book alike.
+    """
+    epub_path = epub_path or os.path.join(SCRIPT_DIR, profile.epub)
+    output_dir = output_dir or os.path.join(SCRIPT_DIR, profile.output)
+    started = time.perf_counter()
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = ArticleManifest(output_dir, rules_hash(RULES_VERSION, parser, profile.rules()))
+    if force:
+        clear_directory(output_dir)
+
+    documents = 0
+    todo = []
+
+    def changed_documents():
+        nonlocal documents
+        for file_name, content in iter_documents(epub_path):
+            documents += 1
+            source = content_hash(content)
+            if force or not manifest.is_unchanged(file_name, source):
+                todo.append((file_name, source))
+                yield profile, file_name, content, parser
+
+    if workers == 1:
+        results = (parse_document(*task) for task in changed_documents())
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = ordered_map(pool, _parse_document, changed_documents(), 4 * (workers or os.cpu_count()))
+
+    statuses = Counter()
+    try:
+        for index, (filename, result) in enumerate(results):
+            file_name, source = todo[index]
+            if filename is None:
+                print(result)
+                manifest.save_day(file_name, source, None, None)
+                continue
+
+            filepath = os.path.join(output_dir, filename)
+            status = manifest.save_day(file_name, source, filename, result, force)
+            statuses[status] += 1
+            if status == WRITTEN:
+                print(f"Saved: {filepath}")
+            elif status == HAND_EDITED:
+                print(f"Kept hand-edited: {filepath}")
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    manifest.save()
+
+    print(
+        f"{profile.name}: {len(todo)} of {documents} documents parsed with {parser} on {workers or os.cpu_count()} "
+        f"workers, days: {statuses[WRITTEN]} written, {statuses[UNCHANGED]} unchanged, "
+        f"{statuses[HAND_EDITED]} hand-edited kept, {time.perf_counter() - started:.2f}s"
+    )
+    return statuses
+
+
+def add_arguments(arg_parser):
+    arg_parser.add_argument('--workers', type=int, help='Parser processes, 1 parses in this process (default: CPU count)')
+    arg_parser.add_argument('--parser', default=DEFAULT_PARSER, help='BeautifulSoup backend: lxml or html.parser')
+    arg_parser.add_argument('--force', action='store_true', help='Empty the output folder and rewrite every day, including hand-edited ones')
+
+
+def main():
+    from book_profiles import PROFILES
+
+    arg_parser = argparse.ArgumentParser(description='Split books into daily articles')
+    arg_parser.add_argument('books', nargs='*', default=sorted(PROFILES), help=f"Any of: {', '.join(sorted(PROFILES))}")
+    add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    for name in args.books:
+        extract_and_save_content(PROFILES[name], workers=args.workers, parser=args.parser, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
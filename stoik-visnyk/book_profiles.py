@@ -0,0 +1,51 @@
+#
+# Book profiles for book_parser.py. A new book needs a profile here and nothing else:
+# where its content, date and title are, how its tags are rewritten and how a day is rendered.
+#
+
+from book_parser import BookProfile
+
+STOIC = BookProfile(
+    name='stoic',
+    epub='book/stoic/stoitsyzm-na-kozhen-den-366.epub',
+    output='daily_articles/stoic',
+    content='div.Базовий-текстовий-кадр',
+    # The first bold text after the rewrites is the date
+    date='b',
+    date_in_content=True,
+    rewrites=[
+        ('decompose', 'a'),
+        ('unwrap', 'span'),
+        ('rename', 'em', 'b'),
+        ('unwrap', 'h4.Розділ-номер'),
+        ('rename', 'h3.Розділ-назва', 'b'),
+        # The quote's signature goes inside the quote, which becomes a blockquote
+        ('append_text', 'p.цитата-підпис', 'p.Цитата-1-й', '\n\n'),
+        ('rename', 'p.Цитата-1-й', 'blockquote', True),
+        ('flatten', 'p'),
+    ],
+    render='markup',
+)
+
+PARENT = BookProfile(
+    name='parent',
+    epub='book/parents/tatovi-na-schoden-366.epub',
+    output='daily_articles/parent',
+    content='div.idGenObjectStyleOverride-1',
+    date='h4.running-headers_running-number',
+    title='h4.running-headers_running-header',
+    render='blocks',
+    # Write the date and title in bold tags
+    header='<b>{date}</b>\n\n',
+    title_template='<b>{text}</b>\n\n',
+    blocks=[
+        # Handle verses specially to avoid extra new lines
+        {'select': 'p.quote_verse', 'template': '<i>{text}</i>\n'},
+        {'select': 'p', 'template': '{text}\n\n', 'skip_empty': True},
+        {'select': 'h6.additional_epigraph', 'template': '<blockquote>{text}</blockquote>\n\n',
+         'sibling': 'h6.additional_epigraph-author',
+         'with_sibling': '<blockquote>{text}\n\n<i><b>{sibling}</b></i></blockquote>\n\n'},
+    ],
+)
+
+PROFILES = {profile.name: profile for profile in (STOIC, PARENT)}
@@ -0,0 +1,60 @@
+#
+# Packs the parsed articles (daily_articles/<topic>/MM-DD (...).txt) into one bundle file that
+# the lambdas memory-map, so reading the article of the day needs no S3 request.
+#
+# Run it after regenerating or hand-fixing articles and before `sam build`:
+#   python build_article_bundle.py
+#
+# Without the bundle the lambdas keep reading the articles from S3.
+#
+
+import argparse
+import os
+import re
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(SCRIPT_DIR, 'dailyMotivationApp', 'shared')
+sys.path.append(SHARED_DIR)
+
+from article_bundle import BUNDLE_FILENAME, load_bundle, write_bundle
+
+ARTICLE_FILENAME = re.compile(r'^(\d{2})-(\d{2}) .*\.txt$')
+
+
+def collect_articles(articles_dir):
+    """{'stoic/': {(month, day): text}, ...} for every topic folder of articles_dir."""
+    articles = {}
+    for topic in sorted(os.listdir(articles_dir)):
+        topic_dir = os.path.join(articles_dir, topic)
+        if not os.path.isdir(topic_dir):
+            continue
+        days = {}
+        for filename in os.listdir(topic_dir):
+            match = ARTICLE_FILENAME.match(filename)
+            if not match:
+                continue
+            with open(os.path.join(topic_dir, filename), 'rb') as file:
+                days[(int(match.group(1)), int(match.group(2)))] = file.read().decode('utf-8')
+        articles[f"{topic}/"] = days
+    return articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the memory-mappable article bundle')
+    parser.add_argument('--articles', default=os.path.join(SCRIPT_DIR, 'daily_articles'))
+    parser.add_argument('--output', default=os.path.join(SHARED_DIR, BUNDLE_FILENAME))
+    args = parser.parse_args()
+
+    articles = collect_articles(args.articles)
+    size = write_bundle(args.output, articles)
+
+    bundle = load_bundle(args.output)
+    for prefix, days in articles.items():
+        print(f"{prefix}: {len(days)} days")
+    print(f"Saved: {args.output} ({size / 1024:.0f} KiB, topics: {', '.join(bundle.prefixes)})")
+    bundle.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#
+# Builds the search index of the /search bot command from the parsed articles
+# (daily_articles/<topic>/MM-DD (...).txt), next to the article bundle in the shared layer.
+#
+# Run it together with build_article_bundle.py, after regenerating or hand-fixing articles and before `sam build`:
+#   python build_search_index.py
+#   python build_search_index.py --query "гнів і спокій"   # also try a query against the new index
+#
+# Without the index the bot answers /search with a "not available" message.
+#
+
+import argparse
+import os
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(SCRIPT_DIR, 'dailyMotivationApp', 'shared')
+sys.path.append(SHARED_DIR)
+
+from article_search import INDEX_FILENAME, load_index, write_index
+from build_article_bundle import collect_articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the full-text search index of the articles')
+    parser.add_argument('--articles', default=os.path.join(SCRIPT_DIR, 'daily_articles'))
+    parser.add_argument('--output', default=os.path.join(SHARED_DIR, INDEX_FILENAME))
+    parser.add_argument('--query', help='Search the new index for this text')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    documents, terms, size = write_index(args.output, collect_articles(args.articles))
+    print(f"Saved: {args.output} ({documents} articles, {terms} terms, {size / 1024:.0f} KiB) "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    if args.query:
+        index = load_index(args.output)
+        started = time.perf_counter()
+        results = index.search(args.query)
+        print(f"{len(results)} results in {(time.perf_counter() - started) * 1000:.2f} ms:")
+        for result in results:
+            print(f"  {result.prefix}{result.day:%m-%d} {result.score:6.2f}  {result.title}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#
+# Compares serving articles from the memory-mapped bundle with fetching them from S3.
+#
+# S3 is simulated by the in-memory fake with a per-request latency (30 ms by default,
+# roughly a same-region GET from lambda); pass --s3-latency 0 to compare pure CPU cost.
+#
+#   python ../build_article_bundle.py && python benchmarks/bench_article_bundle.py
+#
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'fakes')]
+
+from article_bundle import BUNDLE_FILENAME, load_bundle
+from articles import get_filename_with_cyrillic_month
+from fake_s3 import FakeS3Client
+
+BUCKET = 'daily-motivation-messages'
+
+
+def timed(function, days, prefixes):
+    timings = []
+    for day in days:
+        for prefix in prefixes:
+            started = time.perf_counter()
+            function(prefix, day)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summary(timings):
+    ordered = sorted(timings)
+    return {
+        'lookups': len(ordered),
+        'p50Micros': round(statistics.median(ordered) * 1e6, 1),
+        'p99Micros': round(ordered[int(len(ordered) * 0.99)] * 1e6, 1),
+        'totalSeconds': round(sum(ordered), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bundle vs S3 article lookups')
+    parser.add_argument('--bundle', default=os.path.join(APP_DIR, 'shared', BUNDLE_FILENAME))
+    parser.add_argument('--s3-latency', type=float, default=0.03)
+    parser.add_argument('--days', type=int, default=366)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    bundle = load_bundle(args.bundle)
+    if bundle is None:
+        raise SystemExit(f"No bundle at {args.bundle}, run build_article_bundle.py first")
+    open_seconds = time.perf_counter() - started
+
+    days = [date(2024, 1, 1) + timedelta(days=offset) for offset in range(min(args.days, 366))]
+    prefixes = bundle.prefixes
+
+    s3 = FakeS3Client()
+    for day in days:
+        for prefix in prefixes:
+            text = bundle.get(prefix, day)
+            if text is not None:
+                s3.put_object(Bucket=BUCKET, Key=prefix + get_filename_with_cyrillic_month(day), Body=text)
+    s3.latency = args.s3_latency
+
+    def from_s3(prefix, day):
+        key = prefix + get_filename_with_cyrillic_month(day)
+        try:
+            return s3.get_object(Bucket=BUCKET, Key=key)['Body'].read().decode('utf-8')
+        except Exception:
+            return None
+
+    print(json.dumps({
+        'bundleOpenMillis': round(open_seconds * 1000, 3),
+        'bundle': summary(timed(bundle.get, days, prefixes)),
+        's3': summary(timed(from_s3, days, prefixes)),
+        's3LatencySeconds': args.s3_latency,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#
+# Cold-start vs warm-start benchmark for the webhook lambda (daily_message_bot/app_bot.py).
+#
+# Reports how long importing the module takes in a fresh interpreter, the latency of the
+# first update (lazy imports, application.initialize(), first S3 read) and of the warm updates
+# that follow. Everything runs against local fakes, no AWS or Telegram access is needed:
+#
+#   python benchmarks/bench_bot_warm_start.py --updates 200
+#
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_DIR = os.path.join(APP_DIR, 'daily_message_bot')
+sys.path[:0] = [BOT_DIR, os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'fakes')]
+
+from fake_s3 import FakeS3Client
+from fake_telegram import FakeTelegramServer
+
+
+def command_update(update_id, chat_id, command):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': command,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}],
+        },
+    }
+
+
+def measure_import(runs):
+    """Seconds to import app_bot in a fresh interpreter, once per run."""
+    code = 'import time; t = time.perf_counter(); import app_bot; print(time.perf_counter() - t)'
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=BOT_DIR, env=os.environ)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return timings
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold/warm start benchmark of the bot lambda')
+    parser.add_argument('--updates', type=int, default=100, help='Warm updates to send')
+    parser.add_argument('--import-runs', type=int, default=5)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-bot-')
+    server = FakeTelegramServer(latency=args.telegram_latency).start()
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:bench',
+        'TELEGRAM_BASE_URL': server.base_url,
+        'SUBSCRIPTION_STORE': f"sqlite:///{os.path.join(workdir, 'bot.db')}",
+        'DELIVERY_JOURNAL': f"sqlite:///{os.path.join(workdir, 'journal.db')}",
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'eu-north-1'),
+    })
+
+    import_times = measure_import(args.import_runs)
+
+    import logging
+    import app_bot
+    from articles import ARTICLE_PREFIXES, get_filename_with_cyrillic_month
+    from content_cache import ContentCache
+    logging.getLogger().setLevel(logging.WARNING)
+
+    s3 = FakeS3Client()
+    for prefix in ARTICLE_PREFIXES:
+        s3.put_object(Bucket=app_bot.BUCKET_NAME, Key=prefix + get_filename_with_cyrillic_month(), Body='Article')
+    app_bot.content_cache = ContentCache(s3, app_bot.BUCKET_NAME)
+
+    latencies = []
+    # Every invocation prints its metrics record, keep stdout for the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        for update_id in range(1, args.updates + 2):
+            event = {'body': json.dumps(command_update(update_id, 1000 + update_id % 10, '/stoic'))}
+            started = time.perf_counter()
+            response = app_bot.lambda_handler(event, None)
+            latencies.append(time.perf_counter() - started)
+            if response['statusCode'] != 200:
+                raise SystemExit(f"Update {update_id} failed: {response['body']}")
+
+    server.stop()
+    cold, warm = latencies[0], latencies[1:]
+    print(json.dumps({
+        'importSeconds': {'median': round(statistics.median(import_times), 4), 'runs': len(import_times)},
+        'firstUpdateSeconds': round(cold, 4),
+        'warmUpdateSeconds': {
+            'p50': round(percentile(warm, 0.50), 4),
+            'p95': round(percentile(warm, 0.95), 4),
+            'count': len(warm),
+        },
+        'telegramRequests': len(server.messages),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
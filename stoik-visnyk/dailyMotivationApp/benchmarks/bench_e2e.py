@@ -0,0 +1,290 @@
+#
+# End-to-end benchmark of the bot against local fakes, for comparing commits:
+#
+#   parsers    both book profiles on a synthetic 366-day EPUB: full and no-op incremental runs,
+#              plus the latency of parsing one document
+#   broadcast  send_message() to 1k/10k/100k subscribers read from the fake DynamoDB index
+#   webhooks   a burst of /stoic updates from different chats through app_bot.lambda_handler
+#
+# Telegram is the fake HTTP server, S3 and DynamoDB the in-memory fakes; all three take a latency
+# and an error rate (502s, SlowDown and ProvisionedThroughputExceeded errors the code has to retry).
+# Prints one JSON document with throughput, p50/p95/p99 latencies and the errors injected:
+#
+#   python benchmarks/bench_e2e.py --output before.json
+#   python benchmarks/bench_e2e.py --subscribers 1000,10000 --scenarios broadcast --telegram-latency 0.02
+#
+# The fake Telegram API runs in this process, so on small machines it is part of what is measured.
+#
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(APP_DIR)
+sys.path[:0] = [
+    os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'fakes'),
+    os.path.join(APP_DIR, 'daily_message'), os.path.join(APP_DIR, 'daily_message_bot'), REPO_DIR,
+]
+
+from bench_bot_warm_start import command_update, percentile
+from fake_dynamodb import FakeTable
+from fake_s3 import FakeS3Client
+from fake_telegram import FakeTelegramServer
+from synthetic_epub import write_synthetic_epub
+
+SCENARIOS = ('parsers', 'broadcast', 'webhooks')
+
+# Every fake S3 client and DynamoDB table of the run, for the injected error counts
+s3_clients = []
+tables = []
+
+
+def latency_summary(seconds):
+    """Milliseconds at p50/p95/p99 of a list of durations in seconds."""
+    if not seconds:
+        return {'count': 0}
+    return {
+        'count': len(seconds),
+        'p50Millis': round(percentile(seconds, 0.50) * 1000, 3),
+        'p95Millis': round(percentile(seconds, 0.95) * 1000, 3),
+        'p99Millis': round(percentile(seconds, 0.99) * 1000, 3),
+    }
+
+
+def article_store(args, bucket):
+    from articles import ARTICLE_PREFIXES, get_filename_with_cyrillic_month
+    s3 = FakeS3Client()
+    for prefix in ARTICLE_PREFIXES:
+        s3.put_object(Bucket=bucket, Key=prefix + get_filename_with_cyrillic_month(), Body='<b>Benchmark</b> article')
+    s3.latency, s3.error_rate = args.s3_latency, args.s3_error_rate
+    s3_clients.append(s3)
+    return s3
+
+
+def fake_table(args, **options):
+    table = FakeTable(page_size=args.page_size, error_rate=args.dynamodb_error_rate, seed=1, **options)
+    tables.append(table)
+    return table
+
+
+class TimedBot:
+    """Wraps a Bot and records how long every send_message call took."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.latencies = []
+
+    async def send_message(self, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self.bot.send_message(**kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def bench_parsers(args):
+    from book_parser import extract_and_save_content, parse_document, iter_documents
+    from book_profiles import PROFILES
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, profile in sorted(PROFILES.items()):
+            epub_path = os.path.join(workdir, f"{name}.epub")
+            write_synthetic_epub(epub_path, name)
+            output_dir = os.path.join(workdir, name)
+
+            runs = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                for run in ('full', 'incremental'):
+                    started = time.perf_counter()
+                    statuses = extract_and_save_content(profile, epub_path, output_dir, workers=args.parser_workers)
+                    elapsed = time.perf_counter() - started
+                    runs[run] = {'seconds': round(elapsed, 3), 'written': statuses['written'],
+                                 'daysPerSecond': round(366 / elapsed, 1)}
+
+            # Latency of one document, parsed in this process
+            latencies = []
+            for file_name, content in iter_documents(epub_path):
+                started = time.perf_counter()
+                parse_document(profile, file_name, content)
+                latencies.append(time.perf_counter() - started)
+            results[name] = dict(runs, document=latency_summary(latencies))
+    return results
+
+
+async def broadcast(module, subscribers, args):
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    request = HTTPXRequest(connection_pool_size=args.concurrency)
+    module.bot = TimedBot(Bot(token=module.bot_token, base_url=os.environ['TELEGRAM_BASE_URL'], request=request))
+    started = time.perf_counter()
+    stats = await module.send_message()
+    elapsed = time.perf_counter() - started
+    await request.shutdown()
+    return stats, elapsed, module.bot.latencies
+
+
+def bench_broadcast(args, server):
+    import app_daily_message
+    from content_cache import ContentCache
+    from delivery_journal import DynamoDeliveryJournal
+    from subscription_store import TOPIC_STOIC, DynamoSubscriptionStore, chat_shard, shard_attribute, subscribed_attribute
+
+    app_daily_message.broadcast_concurrency = args.concurrency
+    app_daily_message.broadcast_global_rate = args.global_rate
+    results = {}
+    for subscribers in args.subscribers:
+        table = fake_table(args)
+        for chat_id in range(1, subscribers + 1):
+            # Straight into the table, the index attributes set the way the store sets them
+            table.items[str(chat_id)] = {
+                'ChatId': str(chat_id),
+                subscribed_attribute(TOPIC_STOIC): True,
+                shard_attribute(TOPIC_STOIC): chat_shard(chat_id),
+            }
+        table.latency = args.dynamodb_latency
+        journal = fake_table(args, hash_key='Date', range_key='Delivery')
+        journal.latency = args.dynamodb_latency
+
+        app_daily_message.subscription_store = DynamoSubscriptionStore(table)
+        app_daily_message.delivery_journal = DynamoDeliveryJournal(journal)
+        app_daily_message.content_cache = ContentCache(article_store(args, app_daily_message.BUCKET_NAME),
+                                                       app_daily_message.BUCKET_NAME)
+
+        received = len(server.messages)
+        stats, elapsed, latencies = asyncio.run(broadcast(app_daily_message, subscribers, args))
+        results[str(subscribers)] = {
+            'sent': stats['sent'],
+            'retried': stats['retried'],
+            'dropped': stats['dropped'],
+            'received': len(server.messages) - received,
+            'seconds': round(elapsed, 3),
+            'messagesPerSecond': round(stats['sent'] / elapsed, 1),
+            'send': latency_summary(latencies),
+            'dynamodbRequests': table.request_count + journal.request_count,
+        }
+    return results
+
+
+def bench_webhooks(args, server):
+    import app_bot
+    from content_cache import ContentCache
+    from delivery_journal import DynamoDeliveryJournal
+    from subscription_store import DynamoSubscriptionStore
+
+    table = fake_table(args)
+    table.latency = args.dynamodb_latency
+    journal = fake_table(args, hash_key='Date', range_key='Delivery')
+    journal.latency = args.dynamodb_latency
+    app_bot.subscription_store = DynamoSubscriptionStore(table)
+    app_bot.delivery_journal = DynamoDeliveryJournal(journal)
+    app_bot.content_cache = ContentCache(article_store(args, app_bot.BUCKET_NAME), app_bot.BUCKET_NAME)
+
+    # The first update pays for the lazy imports and application.initialize(), it is reported apart
+    latencies = []
+    received = len(server.messages)
+    failures = 0
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for update_id in range(1, args.webhooks + 2):
+            event = {'body': json.dumps(command_update(update_id, 10_000 + update_id, '/stoic'))}
+            update_started = time.perf_counter()
+            response = app_bot.lambda_handler(event, None)
+            latencies.append(time.perf_counter() - update_started)
+            failures += response['statusCode'] != 200
+    elapsed = time.perf_counter() - started - latencies[0]
+
+    return {
+        'updates': len(latencies) - 1,
+        'failed': failures,
+        'firstUpdateMillis': round(latencies[0] * 1000, 3),
+        'updatesPerSecond': round((len(latencies) - 1) / elapsed, 1),
+        'update': latency_summary(latencies[1:]),
+        'telegramMessages': len(server.messages) - received,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark against local fakes')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument('--subscribers', default='1000,10000,100000', help='Comma separated broadcast sizes')
+    parser.add_argument('--webhooks', type=int, default=200, help='/stoic updates in the burst')
+    parser.add_argument('--parser-workers', type=int, help='Parser processes (default: CPU count)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Broadcast senders')
+    parser.add_argument('--global-rate', type=float, default=1000,
+                        help="Broadcast msg/s; the fake API has no limit, Telegram's is 30")
+    parser.add_argument('--page-size', type=int, default=500, help='Items per fake DynamoDB page')
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help='Share of sends answered with 502')
+    parser.add_argument('--s3-latency', type=float, default=0.0)
+    parser.add_argument('--s3-error-rate', type=float, default=0.0)
+    parser.add_argument('--dynamodb-latency', type=float, default=0.0)
+    parser.add_argument('--dynamodb-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Also write the JSON here')
+    args = parser.parse_args()
+    args.subscribers = [int(size) for size in args.subscribers.split(',') if size]
+    scenarios = [name for name in args.scenarios.split(',') if name]
+
+    server = FakeTelegramServer(latency=args.telegram_latency, error_rate=args.telegram_error_rate, seed=1).start()
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:bench',
+        'TELEGRAM_BASE_URL': server.base_url,
+        'SUBSCRIPTION_STORE': '',
+        'DELIVERY_JOURNAL': '',
+        'ARTICLE_BUNDLE_PATH': os.path.join(workdir, 'no.bundle'),  # measure the S3 path, not a local bundle
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'eu-north-1'),
+    })
+    logging.disable(logging.WARNING)  # per-message warnings would dominate the timings
+
+    results = {}
+    try:
+        if 'parsers' in scenarios:
+            results['parsers'] = bench_parsers(args)
+        if 'broadcast' in scenarios:
+            results['broadcast'] = bench_broadcast(args, server)
+        if 'webhooks' in scenarios:
+            results['webhooks'] = bench_webhooks(args, server)
+    finally:
+        server.stop()
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'injected': {
+            'telegram502s': server.server_errors,
+            's3Errors': sum(s3.error_count for s3 in s3_clients),
+            'dynamodbErrors': sum(table.error_count for table in tables),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
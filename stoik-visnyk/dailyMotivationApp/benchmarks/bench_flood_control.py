@@ -0,0 +1,66 @@
+#
+# Broadcast against a fake Telegram API that enforces a lower rate than we send at.
+#
+# The fake answers everything above --server-rate msg/s with 429 and retry_after; the broadcaster
+# starts at --global-rate, so it has to back off, retry the rejected messages and still deliver
+# every one of them exactly once:
+#
+#   python benchmarks/bench_flood_control.py --chats 300 --server-rate 15
+#
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'fakes')]
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from broadcast import Broadcaster
+from fake_telegram import FakeTelegramServer
+
+
+async def broadcast(base_url, chats, global_rate, concurrency):
+    bot = Bot('123:fake', base_url=base_url, request=HTTPXRequest(connection_pool_size=concurrency))
+    async with bot:
+        broadcaster = Broadcaster(bot, concurrency=concurrency, global_rate=global_rate)
+        stats = await broadcaster.run((chat_id, f"Message for {chat_id}") for chat_id in range(1, chats + 1))
+    return stats, broadcaster.client
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Broadcast through injected flood control')
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--global-rate', type=float, default=30)
+    parser.add_argument('--server-rate', type=int, default=15, help='Messages per second the fake accepts')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    with FakeTelegramServer(rate_limit=args.server_rate, retry_after=args.retry_after) as server:
+        started = time.monotonic()
+        stats, client = asyncio.run(broadcast(server.base_url, args.chats, args.global_rate, args.concurrency))
+        elapsed = time.monotonic() - started
+
+    received = collections.Counter(message['chat_id'] for message in server.messages)
+    print(json.dumps({
+        'broadcast': stats.as_dict(),
+        'client': client.stats.as_dict(),
+        'finalGlobalRate': client.rate_limiter.rate,
+        'server429s': server.flood_errors,
+        'chatsReached': len(received),
+        'duplicates': sum(count - 1 for count in received.values()),
+        'missing': args.chats - len(received),
+        'idealSeconds': round(args.chats / args.server_rate, 1),
+        'elapsedSeconds': round(elapsed, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#
+# Generates a synthetic 366-day EPUB in the markup of one of the real books, so the parsers can
+# be benchmarked without the (copyrighted) originals:
+#
+#   python benchmarks/synthetic_epub.py /tmp/stoic.epub --book stoic
+#   python ../book_parser.py ... (or bookParserStoic.py --epub /tmp/stoic.epub --output /tmp/out)
+#
+
+import argparse
+import random
+import zipfile
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+MONTHS_UK = ['січня', 'лютого', 'березня', 'квітня', 'травня', 'червня',
+             'липня', 'серпня', 'вересня', 'жовтня', 'листопада', 'грудня']
+WORDS = ('стоїк', 'розум', 'день', 'мета', 'спокій', 'діти', 'батько', 'шлях', 'вибір', 'думка',
+         'сьогодні', 'завжди', 'важливо', 'людина', 'життя', 'світ', 'час', 'сила', 'воля', 'знання')
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+
+PAGE = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml">
+	<head><title>{name}</title></head>
+	<body>
+{body}
+	</body>
+</html>
+"""
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraph(rng):
+    return ' '.join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5)))
+
+
+def stoic_day(rng, date_text, paragraphs):
+    body = [
+        '<div class="Базовий-текстовий-кадр">',
+        f'<h4 class="Розділ-номер"><em class="Italic">{date_text}</em></h4>',
+        f'\t\t\t<h3 class="Розділ-назва">{escape(sentence(rng, 4))}</h3>',
+        f'\t\t\t<p class="Цитата-1-й">{escape(sentence(rng))}</p>',
+        f'\t\t\t<p class="цитата-підпис">Сенека<em class="Italic">, «Листи», {rng.randint(1, 120)}</em>'
+        f'<span><span><a href="1.xhtml#note">{rng.randint(1, 99)}</a></span></span></p>',
+    ]
+    for index in range(paragraphs):
+        body.append(f'\t\t\t<p class="{"Без-абзаца" if index == 0 else "Основа"}">{escape(paragraph(rng))}</p>')
+    body.append('</div>')
+    return '\n'.join(body)
+
+
+def parent_day(rng, date_text, paragraphs):
+    body = [
+        '\t\t<div class="idGenObjectStyleOverride-1">',
+        f'\t\t\t<h4 class="running-headers_running-number"><a id="a1"></a>{date_text}</h4>',
+        f'\t\t\t<h4 class="running-headers_running-header"><a id="a2"></a>{escape(sentence(rng, 4).upper())}</h4>',
+        '\t\t\t<p class="main_1st">&#160;</p>',
+        f'\t\t\t<h6 class="additional_epigraph">{escape(sentence(rng))}</h6>',
+        '\t\t\t<h6 class="additional_epigraph-author">Марк Аврелій</h6>',
+    ]
+    for index in range(paragraphs):
+        body.append(f'\t\t\t<p class="main_block"><strong class="bold">{escape(sentence(rng, 3))}</strong> '
+                    f'{escape(paragraph(rng))}</p>')
+        if index == 1:
+            body.extend(f'\t\t\t<p class="quote_verse">{escape(sentence(rng, 5))}</p>' for _ in range(4))
+    body.append('\t\t</div>')
+    return '\n'.join(body)
+
+
+BOOKS = {'stoic': stoic_day, 'parent': parent_day}
+
+
+def write_synthetic_epub(path, book='stoic', paragraphs=6, seed=0):
+    """Writes a 366-day EPUB (a leap year) plus a cover page; returns the number of day documents."""
+    rng = random.Random(seed)
+    render_day = BOOKS[book]
+    documents = [('cover.xhtml', PAGE.format(name='cover', body='<p>Cover</p>'))]
+    day = date(2024, 1, 1)
+    for index in range(366):
+        current = day + timedelta(days=index)
+        date_text = f"{current.day} {MONTHS_UK[current.month - 1]}"
+        name = f"day-{index + 1:03d}.xhtml"
+        documents.append((name, PAGE.format(name=name, body=render_day(rng, date_text, paragraphs))))
+
+    manifest = '\n'.join(
+        f'    <item id="d{index}" href="{name}" media-type="application/xhtml+xml"/>'
+        for index, (name, _) in enumerate(documents))
+    spine = '\n'.join(f'    <itemref idref="d{index}"/>' for index in range(len(documents)))
+    opf = f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="id">synthetic-{book}</dc:identifier><dc:title>Synthetic {book}</dc:title><dc:language>uk</dc:language>
+  </metadata>
+  <manifest>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+"""
+    with zipfile.ZipFile(path, 'w') as epub:
+        epub.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        epub.writestr('META-INF/container.xml', CONTAINER, compress_type=zipfile.ZIP_DEFLATED)
+        epub.writestr('OEBPS/content.opf', opf, compress_type=zipfile.ZIP_DEFLATED)
+        for name, page in documents:
+            epub.writestr(f"OEBPS/{name}", page, compress_type=zipfile.ZIP_DEFLATED)
+    return len(documents) - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic 366-day EPUB')
+    parser.add_argument('path')
+    parser.add_argument('--book', choices=sorted(BOOKS), default='stoic')
+    parser.add_argument('--paragraphs', type=int, default=6, help='Paragraphs per day')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    days = write_synthetic_epub(args.path, args.book, args.paragraphs, args.seed)
+    print(f"Saved: {args.path} ({days} days)")
+
+
+if __name__ == '__main__':
+    main()
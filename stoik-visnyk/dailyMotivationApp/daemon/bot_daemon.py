@@ -0,0 +1,160 @@
+#
+# Self-hosted, long-running bot: polls Telegram with the command handlers of app_bot and delivers the
+# daily articles of app_daily_message from jobs of the same process.
+#
+# Every chat gets its articles at its own delivery time (the /time command); the rest arrive spread over
+# an hour after --time. A DeliveryScheduler releases the due bucket every minute and the subscriptions are
+# re-read every few minutes, so new subscribers and changed times are picked up without a restart.
+#
+# There are no cold starts, and everything the two lambdas create per container exists once:
+#   - one telegram Application, whose HTTP connection pool carries both the replies and the broadcast
+#   - one DeliveryClient, so replies and the broadcast share one adaptive rate limit
+#   - one ContentCache with the article bundle, one subscription store and one Metrics
+#
+# Usage:
+#   TELEGRAM_TOKEN=... python daemon/bot_daemon.py --data-dir /var/lib/stoik-visnyk --time 07:00
+#   TELEGRAM_TOKEN=... python daemon/bot_daemon.py --data-dir ./data --broadcast-now   # send today's articles to all now
+#
+# --data-dir keeps the subscriptions and the delivery journal in SQLite files in that folder;
+# without it SUBSCRIPTION_STORE/DELIVERY_JOURNAL decide, as in the lambdas.
+# Polling removes the webhook, so do not run the daemon next to the webhook lambda of the same bot.
+#
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'daily_message'), os.path.join(APP_DIR, 'daily_message_bot'),
+]
+
+from delivery_schedule import (
+    DEFAULT_DELIVERY_TIME, DEFAULT_TIMEZONE, DeliveryScheduler, parse_delivery_time, parse_timezone,
+)
+
+BROADCAST_TIME_KEY = 'BROADCAST_TIME'
+BROADCAST_TIMEZONE_KEY = 'BROADCAST_TIMEZONE'
+SUBSCRIPTIONS_DB = 'subscriptions.db'
+JOURNAL_DB = 'journal.db'
+
+# Connections kept for the bot's replies on top of one per concurrent broadcast sender
+REPLY_CONNECTIONS = 4
+METRICS_INTERVAL_SECONDS = 60
+REPLAN_INTERVAL_SECONDS = 300
+
+logger = logging.getLogger()
+
+
+def use_sqlite(data_dir):
+    """Points the stores at SQLite files in `data_dir`; must run before the app modules are imported."""
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ['SUBSCRIPTION_STORE'] = f"sqlite:///{os.path.join(data_dir, SUBSCRIPTIONS_DB)}"
+    os.environ['DELIVERY_JOURNAL'] = f"sqlite:///{os.path.join(data_dir, JOURNAL_DB)}"
+
+
+def share_resources(app_bot, app_daily_message, application):
+    """
+    Makes both modules use the application's bot and the same content cache, subscription store,
+    delivery journal, delivery client and metrics. Returns the delivery client for the broadcast job.
+    """
+    from delivery import DeliveryClient
+
+    metrics = app_daily_message.metrics
+    metrics.service = 'Daemon'
+    client = DeliveryClient(application.bot, app_daily_message.broadcast_global_rate, metrics=metrics)
+
+    app_daily_message.bot = application.bot
+    app_bot.metrics = metrics
+    app_bot.content_cache = app_daily_message.content_cache
+    app_bot.subscription_store = app_daily_message.subscription_store
+    app_bot.delivery_journal = app_daily_message.delivery_journal
+    app_bot.delivery_client = client
+    return client
+
+
+class ScheduledDelivery:
+    """Job callbacks around one DeliveryScheduler, sending through the shared delivery client."""
+
+    def __init__(self, app_daily_message, scheduler, client):
+        self.app = app_daily_message
+        self.scheduler = scheduler
+        self.client = client
+        # Journal of the recent dates, loaded once instead of for every bucket
+        self.journal_cache = {}
+        self._planned = False
+
+    async def replan(self, context):
+        # The first plan also sends what fell due today before the start, the journal skips what was sent
+        await self.app.plan_deliveries(self.scheduler, catch_up=not self._planned)
+        self._planned = True
+
+    async def tick(self, context):
+        due = self.scheduler.release_due()
+        if not due:
+            return
+        stats = await self.app.send_scheduled(due, self.client, self.journal_cache)
+        logger.info(f"Delivered a bucket of {len(due)}: {stats}")
+
+
+async def broadcast_now(context):
+    """Job callback: sends today's articles to every subscriber at once, like the lambda's daily run."""
+    import app_daily_message
+
+    logger.info("Starting the broadcast")
+    stats = await app_daily_message.send_message(client=context.job.data)
+    logger.info(f"Broadcast finished: {stats}")
+
+
+async def emit_metrics(context):
+    metrics = context.job.data
+    if metrics.counters or metrics.histograms:
+        metrics.emit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the bot and the daily broadcast as one long-running process')
+    parser.add_argument('--data-dir', help='Keep subscriptions and the delivery journal in SQLite files here')
+    parser.add_argument('--time', default=os.getenv(BROADCAST_TIME_KEY, DEFAULT_DELIVERY_TIME),
+                        help='Delivery time, HH:MM, of the chats that did not pick their own')
+    parser.add_argument('--timezone', default=os.getenv(BROADCAST_TIMEZONE_KEY, DEFAULT_TIMEZONE))
+    parser.add_argument('--broadcast-now', action='store_true', help="Also send today's articles right after start")
+    args = parser.parse_args()
+    default_time, default_timezone = parse_delivery_time(args.time), parse_timezone(args.timezone)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    if args.data_dir:
+        use_sqlite(args.data_dir)
+
+    # Imported only now, the modules build their stores from the environment on import
+    import app_bot
+    import app_daily_message
+
+    app_bot.configure_bot(connection_pool_size=app_daily_message.broadcast_concurrency + REPLY_CONNECTIONS)
+    application = app_bot.application
+    if application.job_queue is None:
+        raise SystemExit("The job queue is missing: pip install -r daemon/requirements.txt")
+
+    client = share_resources(app_bot, app_daily_message, application)
+    scheduler = DeliveryScheduler(time.time, default_time=default_time, default_timezone=default_timezone)
+    delivery = ScheduledDelivery(app_daily_message, scheduler, client)
+
+    job_queue = application.job_queue
+    # An interval job moves a start in the past to its next interval, so the first plan is a one-off job
+    job_queue.run_once(delivery.replan, 0, name='plan')
+    job_queue.run_repeating(delivery.replan, REPLAN_INTERVAL_SECONDS, name='replan')
+    # Aligned to the wheel, so a bucket goes out at the start of its minute
+    job_queue.run_repeating(delivery.tick, scheduler.wheel.tick, name='deliveries',
+                            first=max(scheduler.wheel.next_tick_at() - time.time(), 1))
+    job_queue.run_repeating(emit_metrics, METRICS_INTERVAL_SECONDS, name='metrics', data=app_daily_message.metrics)
+    if args.broadcast_now:
+        job_queue.run_once(broadcast_now, 0, name='broadcast_now', data=client)
+
+    logger.info(f"Polling for updates, default delivery at {default_time} {default_timezone}")
+    application.run_polling()
+
+
+if __name__ == '__main__':
+    main()
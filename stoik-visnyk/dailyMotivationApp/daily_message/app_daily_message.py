@@ -1,107 +1,388 @@
 import asyncio
 import os
+import sys
 import boto3
 import logging
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import TelegramError, Forbidden, BadRequest
+from telegram.request import HTTPXRequest
 
-# Constants for attribute keys
-IS_SUBSCRIBED_TO_KEY = 'IsSubscribedTo'
-IS_SUBSCRIBED_TO_STOIC_KEY = 'IsSubscribedToStoic'
-IS_SUBSCRIBED_TO_PARENT_KEY = 'IsSubscribedToParent'
+# Shared modules come from the SharedLayer in lambda, locally they live next to this folder
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(SHARED_DIR):
+    sys.path.append(SHARED_DIR)
+
+from article_bundle import load_bundle
+from articles import get_filename_with_cyrillic_month
+from broadcast import Broadcaster, DEFAULT_CONCURRENCY
+from content_cache import ContentCache
+from delivery_journal import create_delivery_journal
+from delivery_schedule import DeliveryScheduler, group_by_day
+from metrics import Metrics, configure_logging, log_payload
+from rate_limiter import TELEGRAM_GLOBAL_RATE
+from subscription_store import TOPICS, TOPIC_PREFIXES, INDEX_SHARDS, create_subscription_store
 
 TELEGRAM_TOKEN_KEY = 'TELEGRAM_TOKEN'
-CHAT_ID_KEY = 'ChatId'
-TABLE_NAME = 'UserPreferences'
+TELEGRAM_BASE_URL_KEY = 'TELEGRAM_BASE_URL'
+BROADCAST_CONCURRENCY_KEY = 'BROADCAST_CONCURRENCY'
+BROADCAST_GLOBAL_RATE_KEY = 'BROADCAST_GLOBAL_RATE'
+FANOUT_WORKERS_KEY = 'FANOUT_WORKERS'
 BUCKET_NAME = 'daily-motivation-messages'
-S3_PREFIX_STOIC = 'stoic/'
-S3_PREFIX_PARENT = 'parent/'
 
-STOIC_EMOJI = '📖'
-PARENT_EMOJI = '👶🏻'
+# Stop handing out new messages this long before the lambda times out, so the journal gets flushed
+DEADLINE_MARGIN_SECONDS = 3
+# Workers must be done this long before their coordinator times out, so it still collects their stats
+WORKER_DEADLINE_MARGIN_SECONDS = 10
+# A scheduled run sends what fell due this long ago at most: its own period plus one missed run
+SCHEDULE_LOOKBACK_SECONDS_KEY = 'SCHEDULE_LOOKBACK_SECONDS'
+DEFAULT_SCHEDULE_LOOKBACK_SECONDS = 1800
+
+# Stage timings and counters of the current invocation, emitted as one EMF record at its end
+metrics = Metrics('DailyMessage')
 
-# Create a boto3 client for DynamoDB and S3
-dynamodb = boto3.resource('dynamodb')
+# Create a boto3 client for S3; the stores create their DynamoDB tables unless configured for SQLite
 s3_client = boto3.client('s3')
+# Module level, so the articles survive warm invocations; the bundle spares the S3 reads entirely
+content_cache = ContentCache(s3_client, BUCKET_NAME, bundle=load_bundle(), metrics=metrics)
 
 # Bot Configs
 bot_token = os.getenv(TELEGRAM_TOKEN_KEY)
-bot = Bot(token=bot_token)
+broadcast_concurrency = int(os.getenv(BROADCAST_CONCURRENCY_KEY, DEFAULT_CONCURRENCY))
+# Telegram's limit is per bot, so with fan-out the workers split it between themselves
+broadcast_global_rate = float(os.getenv(BROADCAST_GLOBAL_RATE_KEY, TELEGRAM_GLOBAL_RATE))
+fanout_workers = int(os.getenv(FANOUT_WORKERS_KEY, 1))
+# One pooled connection per concurrent sender, the default pool holds just one
+bot = Bot(
+    token=bot_token,
+    base_url=os.getenv(TELEGRAM_BASE_URL_KEY, 'https://api.telegram.org/bot'),
+    request=HTTPXRequest(connection_pool_size=broadcast_concurrency),
+)
 
-# Configure logger
+# Configure logger; LOG_LEVEL=DEBUG brings back the verbose logs
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all types of logs
+configure_logging()
 
-table = dynamodb.Table(TABLE_NAME)  # DynamoDB table name
+subscription_store = create_subscription_store()
+delivery_journal = create_delivery_journal(metrics=metrics)
 
-def get_filename_with_cyrillic_month():
-    months_uk = {
-        '01': 'січня', '02': 'лютого', '03': 'березня', '04': 'квітня',
-        '05': 'травня', '06': 'червня', '07': 'липня', '08': 'серпня',
-        '09': 'вересня', '10': 'жовтня', '11': 'листопада', '12': 'грудня'
-    }
-    today = datetime.now()
-    day = today.strftime('%d').lstrip('0')
-    day_with_leading_zero = today.strftime('%d')
-    month_number = today.strftime('%m')
-    month_name = months_uk[month_number]
-    filename = f"{month_number}-{day_with_leading_zero} ({day} {month_name}).txt"
-    return filename.lower()
-
-async def fetch_subscribed_users():
-    # Fetch all users with their subscription status for stoic and parent articles
-    response = table.scan(
-        ProjectionExpression=f"{CHAT_ID_KEY}, {IS_SUBSCRIBED_TO_STOIC_KEY}, {IS_SUBSCRIBED_TO_PARENT_KEY}"
-    )
-    return [
-        (
-            item[CHAT_ID_KEY],
-            [
-                S3_PREFIX_STOIC if item.get(IS_SUBSCRIBED_TO_STOIC_KEY, False) else None,
-                S3_PREFIX_PARENT if item.get(IS_SUBSCRIBED_TO_PARENT_KEY, False) else None
-            ]
-        )
-        for item in response['Items']
-        if item.get(IS_SUBSCRIBED_TO_STOIC_KEY, False) or item.get(IS_SUBSCRIBED_TO_PARENT_KEY, False)
-    ]
-
-
-async def send_message():
+async def fetch_subscribed_users(topics=TOPICS, shards=None):
+    """
+    Yields (user_id, prefix) for every active subscription, read from the per-topic subscriber index.
+    `shards` restricts it to a part of the index when the broadcast is fanned out.
+    """
+    for topic in topics:
+        async for user_id in subscription_store.iter_subscribers(topic, shards):
+            yield user_id, TOPIC_PREFIXES[topic]
+
+
+async def iter_chats(chats):
+    for chat in chats:
+        yield chat
+
+
+async def plan_deliveries(scheduler, catch_up=False):
+    """
+    Puts every active subscription into the scheduler, at the chat's own delivery time when it picked one.
+    Subscriptions that ended since the previous plan are dropped from it.
+    """
+    preferences = {}
+    async for chat_id, delivery_time, timezone in subscription_store.iter_delivery_times():
+        preferences[str(chat_id)] = (delivery_time, timezone)
+
+    keys = []
+    async for user_id, prefix in fetch_subscribed_users():
+        scheduler.plan(user_id, prefix, preferences.get(str(user_id)), catch_up)
+        keys.append((str(user_id), prefix))
+    scheduler.keep_only(keys)
+    logger.info(f"Planned {len(keys)} deliveries, {len(preferences)} chats with their own time")
+
+
+async def plan_due(scheduler, since, now):
+    """
+    Puts the deliveries that fall due in (since, now] into the scheduler without reading every subscriber:
+    chats with their own time come from the ScheduledChats index, and the topic indexes are only read while
+    the default delivery window is open.
+    """
+    preferences = {}
+    async for chat_id, delivery_time, timezone in subscription_store.iter_delivery_times():
+        preferences[str(chat_id)] = (delivery_time, timezone)
+
+    planned = 0
+    due_chats = [chat_id for chat_id, preference in preferences.items()
+                 if scheduler.next_delivery(chat_id, preference, after=since)[1] <= now]
+    topics = await asyncio.gather(*(subscription_store.subscribed_topics_async(chat_id) for chat_id in due_chats))
+    for chat_id, chat_topics in zip(due_chats, topics):
+        for topic in chat_topics:
+            scheduler.plan(chat_id, TOPIC_PREFIXES[topic], preferences[chat_id], after=since)
+            planned += 1
+
+    default_window = scheduler.default_due_between(since, now)
+    if default_window:
+        async for user_id, prefix in fetch_subscribed_users():
+            if str(user_id) not in preferences:
+                scheduler.plan(user_id, prefix, after=since)
+                planned += 1
+    logger.info(f"Planned {planned} deliveries, {len(due_chats)} of {len(preferences)} chats with their own time "
+                f"due, default window {'open' if default_window else 'closed'}")
+
+
+def is_permanent_failure(error):
+    """The chat can never receive messages again: the bot was blocked/kicked or the chat is gone."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and 'chat not found' in str(error).lower()
+
+
+async def build_messages(subscribed_users, day, progress, delivered=frozenset(), blocked=frozenset(), deadline=None):
+    """
+    Yields (chat_id, text, prefix) for every subscribed user and article type, skipping what the
+    journal says was already delivered today and chats that blocked the bot.
+    """
+    async for user_id, prefix in metrics.timed_iter('scan', subscribed_users):
+        if deadline and time.monotonic() > deadline:
+            logger.warning("Close to the lambda timeout, leaving the rest for the next run")
+            progress['complete'] = False
+            return
+
+        if str(user_id) in blocked or (str(user_id), prefix) in delivered:
+            progress['skipped'] += 1
+            continue
+
+        try:
+            # Every article is fetched and rendered once, then served from the cache; a miss, and the
+            # backoff of its retries, waits in the executor so the send workers keep going meanwhile
+            message = await content_cache.get_article_async(prefix, day)
+        except Exception as e:
+            metrics.increment('fetchErrors')
+            logger.error(f"Failed to retrieve file for {user_id} with prefix {prefix}: {e}")
+            continue
+
+        yield user_id, message, prefix
+
+
+async def send_message(deadline=None, shards=None, global_rate=None, client=None, subscribers=None, day=None,
+                       journal_cache=None):
+    """
+    Broadcasts today's articles. Safe to rerun: deliveries are journaled by (date, chat_id, prefix),
+    so a rerun after a timeout resumes where the previous run stopped.
+
+    A fan-out worker passes its `shards` of the subscriber index and its share of the global rate.
+    A long-running process passes its DeliveryClient, so the broadcast and the bot's replies share one rate limit.
+    A scheduled bucket passes its (chat_id, prefix) `subscribers`, their `day` and a `journal_cache` dict,
+    which keeps the journal of a date in memory between buckets.
+    """
     global bot
 
-    filename = get_filename_with_cyrillic_month()
-    logger.info("Filename to search - " + filename)
+    day = day or datetime.now()
+    date_key = day.strftime('%Y-%m-%d')
+    logger.info("Filename to search - " + get_filename_with_cyrillic_month(day))
 
-    # Assume fetch_subscribed_users returns a list of tuples (user_id, list of prefixes)
-    subscribed_users = await fetch_subscribed_users()
+    if journal_cache is not None and date_key in journal_cache:
+        delivered, blocked = journal_cache[date_key]
+    else:
+        delivered, blocked = await asyncio.gather(
+            delivery_journal.load_delivered(date_key), delivery_journal.load_blocked())
+        if journal_cache is not None:
+            journal_cache[date_key] = (delivered, blocked)
+    logger.info(f"Journal: {len(delivered)} deliveries already done on {date_key}, {len(blocked)} blocked chats")
+    progress = {'skipped': 0, 'blocked': 0, 'complete': True}
 
-    for user_id, prefixes in subscribed_users:
-        for prefix in filter(None, prefixes):  # This filters out any None values in the list of prefixes
-            try:
-                # Define the emoji to prepend
-                emoji_to_use = STOIC_EMOJI if prefix == S3_PREFIX_STOIC else PARENT_EMOJI
+    async def on_delivered(message):
+        chat_id, _, prefix = message
+        delivered.add((str(chat_id), prefix))
+        await delivery_journal.record_delivered(date_key, chat_id, prefix)
 
-                # Construct the full S3 key for the file
-                key = f"{prefix}{filename}"
-                response = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-                message = emoji_to_use + " " + response['Body'].read().decode('utf-8')
-                
-                logger.info(f"Sending article with {prefix} type...")
+    async def on_failed(message, error):
+        if is_permanent_failure(error):
+            progress['blocked'] += 1
+            blocked.add(str(message[0]))
+            await delivery_journal.record_blocked(message[0], str(error))
 
-                # Send the message using Telegram Bot
-                await bot.send_message(chat_id=user_id, text=message, parse_mode='HTML')
-            except Exception as e:
-                logger.error(f"Failed to retrieve/send file for {user_id} with prefix {prefix}: {e}")
+    if subscribers is None:
+        subscribers = fetch_subscribed_users(shards=shards)
+    elif not hasattr(subscribers, '__aiter__'):
+        subscribers = iter_chats(subscribers)
 
+    # Users are streamed straight from the index, so sending starts with the first page
+    broadcaster = Broadcaster(bot, concurrency=broadcast_concurrency, global_rate=global_rate or broadcast_global_rate,
+                              on_delivered=on_delivered, on_failed=on_failed, client=client, metrics=metrics,
+                              deadline=deadline)
+    try:
+        stats = await broadcaster.run(
+            build_messages(subscribers, day, progress, delivered, blocked, deadline))
+    finally:
+        await delivery_journal.flush()
+    metrics.increment('skipped', progress['skipped'])
+    metrics.increment('blocked', progress['blocked'])
+    metrics.increment('deferred', stats.deferred)
+    metrics.increment('callbackErrors', stats.callback_errors)
+    if stats.deferred:
+        progress['complete'] = False
+    return dict(stats.as_dict(), **progress)
+
+
+def merge_stats(results):
+    """Adds up the stats of several send_message() calls."""
+    total = {'sent': 0, 'retried': 0, 'dropped': 0, 'deferred': 0, 'callbackErrors': 0, 'skipped': 0, 'blocked': 0,
+             'complete': True}
+    for result in results:
+        for key in ('sent', 'retried', 'dropped', 'deferred', 'callbackErrors', 'skipped', 'blocked'):
+            total[key] += result[key]
+        total['complete'] = total['complete'] and result['complete']
+    return total
+
+
+async def send_scheduled(deliveries, client=None, journal_cache=None, deadline=None):
+    """Sends a released bucket of deliveries, each chat the article of its own local day."""
+    results = []
+    for day, chats in sorted(group_by_day(deliveries).items()):
+        results.append(await send_message(deadline, client=client, subscribers=chats,
+                                          day=datetime.combine(day, datetime.min.time()), journal_cache=journal_cache))
+    if journal_cache:
+        # Only the dates of the current buckets are needed again
+        for date_key in sorted(journal_cache)[:-3]:
+            del journal_cache[date_key]
+    return merge_stats(results)
+
+
+async def send_due(deadline=None, now=None):
+    """
+    One run of the scheduled mode: sends every delivery that fell due within the lookback, at each chat's
+    own time, also when that was just before midnight. Whatever the journal has for the chat's day is
+    skipped, so overlapping runs do not send twice. `now` is for tests, the current time by default.
+    """
+    now = time.time() if now is None else now
+    lookback = float(os.getenv(SCHEDULE_LOOKBACK_SECONDS_KEY, DEFAULT_SCHEDULE_LOOKBACK_SECONDS))
+    scheduler = DeliveryScheduler(lambda: now)
+    await plan_due(scheduler, now - lookback, now)
+    due = scheduler.release_due()
+    logger.info(f"{len(due)} deliveries due")
+    return await send_scheduled(due, deadline=deadline)
+
+
+def worker_events(workers, shards=INDEX_SHARDS, global_rate=None, deadline_at=None):
+    """
+    Splits the index shards round-robin between `workers` and gives each an equal part of the global rate.
+    `deadline_at` (epoch seconds) is when the workers have to stop, derived from the coordinator's own timeout.
+    """
+    groups = [list(range(shards))[worker::workers] for worker in range(min(workers, shards))]
+    rate = (global_rate or broadcast_global_rate) / len(groups)
+    events = [{'mode': 'worker', 'shards': group, 'globalRate': rate} for group in groups]
+    if deadline_at is not None:
+        for event in events:
+            event['deadlineAt'] = deadline_at
+    return events
+
+
+def aggregate_results(results, elapsed):
+    """Adds up the stats the workers returned; a worker that crashed counts as incomplete."""
+    total = {'sent': 0, 'retried': 0, 'dropped': 0, 'deferred': 0, 'callbackErrors': 0, 'skipped': 0, 'blocked': 0,
+             'complete': True, 'workerErrors': 0}
+    for result in results:
+        if 'error' in result:
+            logger.error(f"Worker for shards {result.get('shards')} failed: {result['error']}")
+            total['workerErrors'] += 1
+            total['complete'] = False
+            continue
+        for key in ('sent', 'retried', 'dropped', 'deferred', 'callbackErrors', 'skipped', 'blocked'):
+            total[key] += result.get(key, 0)
+        total['complete'] = total['complete'] and result.get('complete', True)
+
+    total['workers'] = len(results)
+    total['elapsedSeconds'] = round(elapsed, 3)
+    total['messagesPerSecond'] = round(total['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+    return total
+
+
+def invoke_worker(lambda_client, function_name, event):
+    """Runs one worker as a synchronous invocation of this same lambda and returns its stats."""
+    try:
+        response = lambda_client.invoke(FunctionName=function_name, Payload=json.dumps(event).encode('utf-8'))
+        payload = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            return {'shards': event['shards'], 'error': payload.get('errorMessage', response['FunctionError'])}
+        return json.loads(payload['body'])
+    except Exception as e:
+        return {'shards': event['shards'], 'error': str(e)}
+
+
+def run_coordinator(workers, dispatch, global_rate=None, deadline_at=None):
+    """
+    Fans the broadcast out to `workers` workers, one group of index shards each, and aggregates their
+    stats. `dispatch(events)` runs the worker events in parallel and returns their results in order.
+    """
+    events = worker_events(workers, global_rate=global_rate, deadline_at=deadline_at)
+    logger.info(f"Dispatching {len(events)} workers: {[event['shards'] for event in events]}")
+    started = time.monotonic()
+    with metrics.timer('fanout'):
+        results = dispatch(events)
+    stats = aggregate_results(results, time.monotonic() - started)
+    # Workers emit their own sent/retried counters, the coordinator only adds what it saw itself
+    metrics.increment('workers', stats['workers'])
+    metrics.increment('workerErrors', stats['workerErrors'])
+    logger.info(f"Fan-out finished: {stats}")
+    return stats
+
+
+def lambda_dispatcher(function_name, timeout):
+    """
+    Invokes the workers in parallel and waits up to `timeout` seconds for them. botocore must neither give up
+    on a long worker after its default 60 s read timeout nor retry it, which would run the shards twice.
+    """
+    from botocore.config import Config
+
+    lambda_client = boto3.client('lambda', config=Config(read_timeout=timeout, retries={'total_max_attempts': 1}))
+
+    def dispatch(events):
+        with ThreadPoolExecutor(max_workers=len(events)) as pool:
+            return list(pool.map(lambda event: invoke_worker(lambda_client, function_name, event), events))
+    return dispatch
 
 
 def lambda_handler(event, context):
-    asyncio.run(send_message())
+    """
+    Without a `mode` the scheduled run broadcasts by itself, or coordinates FANOUT_WORKERS workers
+    when that is above 1. `{"mode": "worker", "shards": [...], "globalRate": ...}` sends one part.
+    `{"mode": "scheduled"}`, run every few minutes, sends what fell due at the chats' own delivery times.
+    A worker stops at the coordinator's `deadlineAt` when that comes before its own timeout.
+    """
+    event = event if isinstance(event, dict) else {}
+    log_payload("Event", event)
+    mode = event.get('mode') or ('coordinator' if fanout_workers > 1 else 'single')
+
+    try:
+        if mode == 'coordinator':
+            workers = int(event.get('workers', fanout_workers))
+            remaining = context.get_remaining_time_in_millis() / 1000
+            deadline_at = time.time() + remaining - WORKER_DEADLINE_MARGIN_SECONDS
+            stats = run_coordinator(workers, lambda_dispatcher(context.function_name, remaining),
+                                    deadline_at=deadline_at)
+        else:
+            deadline = None
+            if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+                deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS
+            if event.get('deadlineAt'):
+                # Wall clock, the coordinator ran in another container
+                coordinator_deadline = time.monotonic() + float(event['deadlineAt']) - time.time() - DEADLINE_MARGIN_SECONDS
+                deadline = min(deadline, coordinator_deadline) if deadline else coordinator_deadline
+            if mode == 'scheduled':
+                stats = asyncio.run(send_due(deadline))
+            else:
+                stats = asyncio.run(send_message(deadline, event.get('shards'), event.get('globalRate')))
+            if mode == 'worker':
+                stats['shards'] = event['shards']
+            if not stats['complete']:
+                metrics.increment('incompleteRuns')
+    finally:
+        metrics.emit({'Mode': mode})
+
     return {
         'statusCode': 200,
-        'body': 'Message sent successfully'
+        'body': json.dumps(stats)
     }
 
 def main():
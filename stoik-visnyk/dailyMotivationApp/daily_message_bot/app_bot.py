@@ -1,74 +1,146 @@
+from __future__ import annotations  # Type hints below must not force the telegram import
+
 import os
+import sys
 import logging
 import json
 import asyncio
-from datetime import datetime
-from telegram import Update, Bot
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, Updater
-
-# Initialize DynamoDB client
-import boto3
-
-# Constants for attribute keys
-IS_SUBSCRIBED_TO_KEY = 'IsSubscribedTo'
-IS_SUBSCRIBED_TO_STOIC_KEY = 'IsSubscribedToStoic'
-IS_SUBSCRIBED_TO_PARENT_KEY = 'IsSubscribedToParent'
+import re
+from datetime import date
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+# Shared modules come from the SharedLayer in lambda, locally they live next to this folder
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+if os.path.isdir(SHARED_DIR):
+    sys.path.append(SHARED_DIR)
+
+from articles import (
+    S3_PREFIX_STOIC, S3_PREFIX_PARENT, STOIC_EMOJI, PARENT_EMOJI, ARTICLE_EMOJIS, MONTHS_UK,
+    get_filename_with_cyrillic_month,
+)
+from delivery_schedule import DEFAULT_DELIVERY_TIME, DEFAULT_TIMEZONE, parse_delivery_time, parse_timezone
+from idempotency import RecentIds
+from metrics import Metrics, configure_logging, log_payload
+from subscription_store import create_subscription_store
 
 TELEGRAM_TOKEN_KEY = 'TELEGRAM_TOKEN'
-CHAT_ID_KEY = 'ChatId'
-TABLE_NAME = 'UserPreferences'
+TELEGRAM_BASE_URL_KEY = 'TELEGRAM_BASE_URL'
 BUCKET_NAME = 'daily-motivation-messages'
-S3_PREFIX_STOIC = 'stoic/'
-S3_PREFIX_PARENT = 'parent/'
 S3_WELCOME_TEXT_FILE = 'message_start.txt'
 
-STOIC_EMOJI = '📖'
-PARENT_EMOJI = '👶🏻'
-
-# Configure logger
+# Configure logger; LOG_LEVEL=DEBUG brings back the verbose logs
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all types of logs
+configure_logging()
 
-dynamodb = boto3.resource('dynamodb')
-s3_client = boto3.client('s3')
-table = dynamodb.Table(TABLE_NAME)
-my_queue = asyncio.Queue()
+# Stage timings and counters of the current invocation, emitted as one EMF record at its end
+metrics = Metrics('Bot')
 
 # Bot Configs
 bot_token = os.getenv(TELEGRAM_TOKEN_KEY)
-bot = Bot(token=bot_token)
 
-# Create the Application and pass it your bot's token.
+# Everything below is created on first use and then kept for the lifetime of the container,
+# so warm invocations skip the boto3/telegram imports, client creation and application.initialize()
 application = None
+application_initialized = False
+event_loop = None
+content_cache = None
+subscription_store = None
+delivery_journal = None
+delivery_client = None
+search_index = None
+
+# Updates already accepted by this container, so Telegram's retries of a slow update are dropped
+recent_updates = RecentIds()
+# Updates whose handler raised during the current invocation, filled by the error handler:
+# update_id -> whether a redelivery could succeed (timeouts, flood control, AWS throttling)
+failed_updates = {}
+# Updates whose handler already flipped a subscription: a redelivery would flip it back
+toggled_updates = set()
+
+
+class UpdateFailed(Exception):
+    def __init__(self, message, update_id=None, retryable=False):
+        super().__init__(message)
+        self.update_id = update_id
+        self.retryable = retryable
+
+
+def get_content_cache():
+    """Articles and the welcome text cache, shared by every invocation of this container."""
+    global content_cache
+    if content_cache is None:
+        import boto3
+        from article_bundle import load_bundle
+        from content_cache import ContentCache
+        content_cache = ContentCache(boto3.client('s3'), BUCKET_NAME, bundle=load_bundle(), metrics=metrics)
+    return content_cache
+
+
+def get_search_index():
+    """The memory-mapped search index of the shared layer, or None when it was not built."""
+    global search_index
+    if search_index is None:
+        from article_search import load_index
+        search_index = load_index()
+    return search_index
+
+
+def get_subscription_store():
+    global subscription_store
+    if subscription_store is None:
+        subscription_store = create_subscription_store()
+    return subscription_store
+
+
+def get_delivery_journal():
+    global delivery_journal
+    if delivery_journal is None:
+        from delivery_journal import create_delivery_journal
+        delivery_journal = create_delivery_journal(metrics=metrics)
+    return delivery_journal
+
+
+async def clear_blocked(chat_id):
+    """The chat talks to the bot again, so the broadcast may message it again if it had blocked the bot."""
+    try:
+        with metrics.timer('dynamodb'):
+            await get_delivery_journal().clear_blocked(chat_id)
+    except Exception as e:
+        logger.error(f"Failed to clear the blocked mark of {chat_id}: {e}")
 
-def get_filename_with_cyrillic_month():
-    months_uk = {
-        '01': 'січня', '02': 'лютого', '03': 'березня', '04': 'квітня',
-        '05': 'травня', '06': 'червня', '07': 'липня', '08': 'серпня',
-        '09': 'вересня', '10': 'жовтня', '11': 'листопада', '12': 'грудня'
-    }
-    today = datetime.now()
-    day = today.strftime('%d').lstrip('0')
-    day_with_leading_zero = today.strftime('%d')
-    month_number = today.strftime('%m')
-    month_name = months_uk[month_number]
-    filename = f"{month_number}-{day_with_leading_zero} ({day} {month_name}).txt"
-    return filename.lower()
-
-async def send_message_with_article(bot, chat_id, prefix):
-    # Define the emoji to prepend
-    emoji_to_use = STOIC_EMOJI if prefix == S3_PREFIX_STOIC else PARENT_EMOJI
-
-    filename = get_filename_with_cyrillic_month()
+
+def get_delivery_client(bot):
+    """Retries flood-controlled and timed out sends; its rate adapts to 429s across invocations."""
+    global delivery_client
+    if delivery_client is None or delivery_client.bot is not bot:
+        from delivery import DeliveryClient
+        delivery_client = DeliveryClient(bot, metrics=metrics)
+    return delivery_client
+
+
+def get_event_loop():
+    """One loop per container: the application's HTTP connection pool is bound to it."""
+    global event_loop
+    if event_loop is None or event_loop.is_closed():
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+    return event_loop
+
+async def send_message_with_article(bot, chat_id, prefix, day=None):
+    filename = get_filename_with_cyrillic_month(day)
     logger.info("Filename to search - " + filename)
     try:
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=prefix + filename)
-        # Read the message content and prepend the emoji with a newline
-        message = emoji_to_use + " " + response['Body'].read().decode('utf-8')
-        await bot.send_message(chat_id=chat_id, text=message, parse_mode='HTML')
+        # Article text with the emoji prepended, fetched from S3 only when not cached yet
+        message = await get_content_cache().get_article_async(prefix, day)
+        await get_delivery_client(bot).send(chat_id, message, parse_mode='HTML')
     except Exception as e:
+        # Re-raised as is, the error handler tells a RetryAfter or a throttled S3 read from a permanent failure
         logger.error(f"Failed to retrieve/send file with prefix {prefix}: {e}")
-        raise Exception(f"Failed to retrieve/send file with prefix {prefix}: {e}")
+        raise
 
 
 def extract_user_or_chat_info(update):
@@ -86,12 +158,9 @@ def extract_user_or_chat_info(update):
 
 async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    # Update the database to set IsSubscribed to False
-    table.update_item(
-        Key={CHAT_ID_KEY : str(chat_id)},
-        UpdateExpression=f'SET {IS_SUBSCRIBED_TO_STOIC_KEY} = :val, {IS_SUBSCRIBED_TO_PARENT_KEY} = :val',
-        ExpressionAttributeValues={':val': False}
-    )
+    # Update the database to set IsSubscribed to False and drop the chat from every topic index
+    with metrics.timer('dynamodb'):
+        await get_subscription_store().unsubscribe_all_async(chat_id)
     await context.bot.send_message(chat_id=chat_id, text='Тепер ви не будете отримувати статті провісника :(')
 
 async def subscribe_stoic(update, context):
@@ -100,7 +169,8 @@ async def subscribe_stoic(update, context):
     user_name, chat_name = extract_user_or_chat_info(update)
 
     # Toggle subscription status and pass relevant info
-    response = toggle_subscription(chat_id, 'stoic', user_name, chat_name)
+    response = await toggle_subscription(chat_id, 'stoic', user_name, chat_name)
+    toggled_updates.add(update.update_id)
     action = 'підписані на' if response else 'відписані від'
     
     # Prepare response message
@@ -121,7 +191,8 @@ async def subscribe_parent(update, context):
     user_name, chat_name = extract_user_or_chat_info(update)
 
     # Toggle subscription status and pass relevant info
-    response = toggle_subscription(chat_id, 'parent', user_name, chat_name)
+    response = await toggle_subscription(chat_id, 'parent', user_name, chat_name)
+    toggled_updates.add(update.update_id)
     action = 'підписані на' if response else 'відписані від'
     
     # Prepare response message
@@ -136,99 +207,264 @@ async def subscribe_parent(update, context):
         await send_message_with_article(context.bot, chat_id, S3_PREFIX_PARENT)
 
 
-def toggle_subscription(user_id, article_type, username=None, chatname=None):
-    """Toggle the subscription status in the DynamoDB."""
-    attr_name = f'{IS_SUBSCRIBED_TO_KEY}{article_type.capitalize()}'
-    # Retrieve current subscription status
-    current_data = table.get_item(Key={CHAT_ID_KEY : str(user_id)})
-    current_status = current_data.get('Item', {}).get(attr_name, False)
-    new_status = not current_status
+DELIVERY_TIME_USAGE = (
+    "Вкажіть час у форматі /time 08:30 або разом з часовим поясом: /time 08:30 Europe/Kyiv. "
+    "/time default повертає стандартний час."
+)
+
+
+async def set_delivery_time(update, context):
+    """/time HH:MM [time zone] picks the chat's delivery time, /time default resets it, /time alone shows it."""
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    store = get_subscription_store()
+
+    try:
+        if not args:
+            with metrics.timer('dynamodb'):
+                current = await store.get_delivery_time_async(chat_id)
+            delivery_time, timezone = current or (DEFAULT_DELIVERY_TIME, DEFAULT_TIMEZONE)
+            message = f"Статті надходять о {delivery_time} ({timezone}). {DELIVERY_TIME_USAGE}"
+        elif args[0].lower() == 'default':
+            with metrics.timer('dynamodb'):
+                await store.set_delivery_time_async(chat_id, None, None)
+            message = f"Статті надходитимуть у стандартний час, близько {DEFAULT_DELIVERY_TIME} ({DEFAULT_TIMEZONE})."
+        else:
+            delivery_time = parse_delivery_time(args[0])
+            timezone = parse_timezone(args[1]) if len(args) > 1 else DEFAULT_TIMEZONE
+            with metrics.timer('dynamodb'):
+                await store.set_delivery_time_async(chat_id, delivery_time, timezone)
+            message = f"Тепер статті надходитимуть о {delivery_time} ({timezone})."
+    except ValueError:
+        message = DELIVERY_TIME_USAGE
+
+    await context.bot.send_message(chat_id=chat_id, text=message)
+
+
+SEARCH_USAGE = "Вкажіть слова для пошуку, наприклад: /search гнів і спокій"
+# /stoic_0316 and /parent_0316 from the search results send the article of that day
+READ_ARTICLE_COMMAND = re.compile(r'^/(stoic|parent)_(\d{2})(\d{2})(?:@\w+)?$')
 
-    update_expression = f"SET ChatName = :chatName, {attr_name} = :val"
-    expression_attribute_values = {':val': new_status, ':chatName': ''}
-    
-    if username:
-        expression_attribute_values[':chatName'] = username
-    elif chatname:
-        expression_attribute_values[':chatName'] = chatname
-
-    # Update the subscription status
-    table.update_item(
-        Key={CHAT_ID_KEY: str(user_id)},
-        UpdateExpression=update_expression,
-        ExpressionAttributeValues=expression_attribute_values
-    )
-    return new_status
+
+def format_search_results(query, results):
+    lines = [f"Знайдено за запитом «{query}»:"]
+    for result in results:
+        topic = result.prefix.rstrip('/')
+        lines.append(
+            f"\n{ARTICLE_EMOJIS.get(result.prefix, PARENT_EMOJI)} {result.day.day} {MONTHS_UK[f'{result.day.month:02d}']}"
+            f" — {result.title}\n/{topic}_{result.day:%m%d}"
+        )
+    return "\n".join(lines)
+
+
+async def search_articles(update, context):
+    """/search <words> lists the best matching days of both books, each with a command that sends it."""
+    chat_id = update.effective_chat.id
+    query = " ".join(context.args or []).strip()
+    index = get_search_index()
+
+    if not query:
+        message = SEARCH_USAGE
+    elif index is None:
+        message = "Пошук зараз недоступний, спробуйте пізніше."
+    else:
+        with metrics.timer('search'):
+            results = index.search(query)
+        message = format_search_results(query, results) if results else f"За запитом «{query}» нічого не знайдено."
+
+    await context.bot.send_message(chat_id=chat_id, text=message)
+
+
+async def read_article(update, context):
+    """Sends the article behind a /stoic_MMDD or /parent_MMDD command of the search results."""
+    match = READ_ARTICLE_COMMAND.match(update.effective_message.text.strip())
+    try:
+        # A leap year, so the articles of Feb 29 can be read too
+        day = date(2000, int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=SEARCH_USAGE)
+        return
+    await send_message_with_article(context.bot, update.effective_chat.id, f"{match.group(1)}/", day)
+
+
+async def toggle_subscription(user_id, article_type, username=None, chatname=None):
+    """Toggle the subscription status in the subscription store, as one atomic update."""
+    with metrics.timer('dynamodb'):
+        subscribed = await get_subscription_store().toggle_subscription_async(
+            user_id, article_type, username or chatname or '')
+    if subscribed:
+        await clear_blocked(user_id)
+    return subscribed
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         logger.debug("Update with /start command")
-        
+        await clear_blocked(update.effective_chat.id)
+
         # Get the welcome message from S3
-        welcome_message = get_welcome_message()
+        welcome_message = await get_welcome_message()
         
         """Sends a message when the command /start is issued."""
         await context.bot.send_message(chat_id=update.effective_chat.id, text=welcome_message)
     except Exception as e:
         logger.error(e)
 
-def configure_bot():
+def configure_bot(connection_pool_size=None):
     global application  # Declare that we'll use the global variable
     if application:
         logger.debug("Application already configured, skipping configuration")
         return
     
     logger.debug("Configuring bot...")
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
 
     # Create the Application and pass it your bot's token.
-    application = ApplicationBuilder().token(bot_token).build()
+    builder = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .base_url(os.getenv(TELEGRAM_BASE_URL_KEY, 'https://api.telegram.org/bot'))
+    )
+    if connection_pool_size:
+        # A long-running process also broadcasts through this bot, one connection per concurrent sender
+        builder = builder.connection_pool_size(connection_pool_size)
+    application = builder.build()
 
     # Add handlers for commands
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("stoic", subscribe_stoic))
     application.add_handler(CommandHandler("parent", subscribe_parent))
     application.add_handler(CommandHandler("unsubscribe_from_all", unsubscribe))
+    application.add_handler(CommandHandler("time", set_delivery_time))
+    application.add_handler(CommandHandler("search", search_articles))
+    application.add_handler(MessageHandler(filters.Regex(READ_ARTICLE_COMMAND), read_article))
+    application.add_error_handler(record_failed_update)
     
     logger.debug("Configured.")
 
+async def record_failed_update(update, context):
+    """Error handler: logs the failure and remembers the update, so the webhook and batch mode can report it."""
+    from aws_retry import is_retryable
+    from delivery import retry_delay
+
+    logger.error(f"Failed to handle update: {context.error}")
+    if update is not None and getattr(update, 'update_id', None) is not None:
+        retryable = retry_delay(context.error, 0) is not None or is_retryable(context.error)
+        if retryable and update.update_id in toggled_updates:
+            logger.warning(f"Not redelivering update {update.update_id}, its subscription toggle already ran")
+            retryable = False
+        failed_updates[update.update_id] = retryable
+
+async def ensure_initialized(application):
+    global application_initialized
+    if not application_initialized:
+        # Only on a cold start: fetches the bot info and opens the HTTP connection pool
+        logger.debug("Initializing application...")
+        await application.initialize()
+        application_initialized = True
+
 async def process_update(application, update_json):
     """Process the incoming update."""
+    from telegram import Update
 
-    logger.debug("Initializing application...")
-    await application.initialize()
+    await ensure_initialized(application)
     logger.debug("Handle update...")
     update = Update.de_json(update_json, application.bot)
     await application.process_update(update)
 
-def get_welcome_message():
-    # Create a boto3 client for S3
-    global s3_client, bucket_name
-    object_key = 'message_start.txt'
+async def handle_update(application, update_json):
+    """
+    Processes the update unless this container has already accepted the same `update_id`.
+    Returns False for a dropped duplicate and raises UpdateFailed when a handler failed.
+    """
+    update_id = update_json.get('update_id')
+    if update_id is not None and not recent_updates.add(update_id):
+        logger.info(f"Skipping duplicate update {update_id}")
+        metrics.increment('duplicateUpdates')
+        return False
 
     try:
-        # Fetch the welcome message from S3
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=object_key)
-        # Read the content of the file
-        message_content = response['Body'].read().decode('utf-8')
-        return message_content
+        with metrics.timer('update'):
+            await process_update(application, update_json)
+    except Exception:
+        if update_id not in toggled_updates:
+            recent_updates.discard(update_id)
+        metrics.increment('failedUpdates')
+        raise
+    finally:
+        toggled_updates.discard(update_id)
+    metrics.increment('updates')
+    if update_id in failed_updates:
+        metrics.increment('failedUpdates')
+        retryable = failed_updates.pop(update_id)
+        if retryable:
+            # Let the retry through, the first attempt did not finish its work
+            recent_updates.discard(update_id)
+        raise UpdateFailed(f"Handler failed for update {update_id}", update_id, retryable)
+    return True
+
+async def process_batch(application, records):
+    """
+    Handles SQS-style `Records` concurrently. Returns the identifiers of the records that failed,
+    in the shape of a lambda partial batch response.
+    """
+    await ensure_initialized(application)
+
+    async def handle_record(record):
+        return await handle_update(application, json.loads(record['body']))
+
+    results = await asyncio.gather(*(handle_record(record) for record in records), return_exceptions=True)
+
+    failures = []
+    for index, (record, result) in enumerate(zip(records, results)):
+        if isinstance(result, UpdateFailed) and not result.retryable:
+            # As in the webhook: redelivering would fail the same way, or repeat a toggle that already ran
+            logger.error(f"Dropped update {result.update_id} of record {index}: {result}")
+            metrics.increment('droppedUpdates')
+        elif isinstance(result, BaseException):
+            logger.error(f"Record {index} of the batch failed: {result}")
+            failures.append({'itemIdentifier': record.get('messageId', str(index))})
+    skipped = sum(1 for result in results if result is False)
+    logger.info(f"Batch of {len(records)} updates: {len(failures)} failed, {skipped} duplicates skipped")
+    return failures
+
+async def get_welcome_message():
+    try:
+        # Fetch the welcome message from S3, or from memory on warm invocations
+        return await get_content_cache().get_text_async(S3_WELCOME_TEXT_FILE)
     except Exception as e:
         print(f"Failed to retrieve the welcome message: {e}")
         # Return a default message in case of an error
         return "Welcome to our Telegram bot! Type /help to get started."
     
 def lambda_handler(event, context):
-    print(event)
+    log_payload("Event", event)
     try:
         configure_bot()
+
+        if 'Records' in event:
+            # Batch mode, e.g. updates buffered in SQS: report per-item failures so only those are retried
+            failures = get_event_loop().run_until_complete(process_batch(application, event['Records']))
+            return {'batchItemFailures': failures}
+
         update = event.get('body')
         if(update):
             # Process the incoming update from Telegram webhook
             body=json.loads(event['body'])
-            print(body)
 
             logger.debug("Starting loop...")
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(process_update(application, body))
+            try:
+                get_event_loop().run_until_complete(handle_update(application, body))
+            except UpdateFailed as e:
+                if e.retryable:
+                    # A timeout or flood control: a non-2xx answer makes Telegram deliver the update again
+                    logger.warning(f"Update {e.update_id} failed transiently, asking Telegram to redeliver it")
+                    return {
+                        'statusCode': 503,
+                        'body': json.dumps(f'Update {e.update_id} failed, retry later')
+                    }
+                # Redelivering would fail the same way or flip a subscription back, so the update is dropped - loudly
+                logger.error(f"Dropped update {e.update_id}: {e}")
+                metrics.increment('droppedUpdates')
             logger.debug("Loop ended!")
 
         else:
@@ -241,7 +477,10 @@ def lambda_handler(event, context):
     
     except Exception as e:
         logger.error("Error in lambda_handler: %s", str(e))
+        metrics.increment('handlerErrors')
         return {
             'statusCode': 500,
             'body': '[BotLambda]: Internal Server Error. ' + str(e)
-        }
\ No newline at end of file
+        }
+    finally:
+        metrics.emit()
\ No newline at end of file
@@ -0,0 +1,204 @@
+#
+# In-memory stand-in for a boto3 DynamoDB `Table` resource.
+#
+# Implements the subset of the API the lambdas use, including scan pagination
+# (`LastEvaluatedKey`/`ExclusiveStartKey`), parallel scan segments and equality
+# queries against sparse secondary indexes, so the subscriber streaming can be
+# exercised without AWS:
+#
+#   table = FakeTable('ChatId', page_size=100, latency=0.02)
+#   table.put_item(Item={'ChatId': '1', 'IsSubscribedToStoic': True})
+#
+# `error_rate` injects throttling: the request raises a ClientError with ProvisionedThroughputExceeded,
+# as when it outlasted boto3's own retries, and is counted in `error_count`.
+#
+
+import random
+import re
+import threading
+import time
+import zlib
+
+from botocore.exceptions import ClientError
+
+
+class FakeDynamoDB:
+    """Mimics `boto3.resource('dynamodb')` by handing out FakeTable instances."""
+
+    def __init__(self, **table_options):
+        self.table_options = table_options
+        self.tables = {}
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(**self.table_options)
+        return self.tables[name]
+
+
+class FakeTable:
+    """
+    `page_size` plays the role of DynamoDB's 1 MB page limit: a scan returns at most
+    that many items and a LastEvaluatedKey to continue from.
+    """
+
+    def __init__(self, hash_key='ChatId', page_size=100, latency=0.0, range_key=None, error_rate=0.0, seed=None):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.items = {}
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        with self._lock:
+            self.request_count += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise ClientError({
+                'Error': {'Code': 'ProvisionedThroughputExceededException',
+                          'Message': 'The level of configured provisioned throughput for the table was exceeded.'},
+                'ResponseMetadata': {'HTTPStatusCode': 400},
+            }, operation)
+
+    def _key(self, mapping):
+        """Internal key of an item: the hash key value, or a (hash, range) tuple."""
+        if self.range_key:
+            return mapping[self.hash_key], mapping[self.range_key]
+        return mapping[self.hash_key]
+
+    def _key_attributes(self, item):
+        names = [self.hash_key] + ([self.range_key] if self.range_key else [])
+        return {name: item[name] for name in names}
+
+    @staticmethod
+    def _project(item, projection):
+        if not projection:
+            return dict(item)
+        names = [name.strip() for name in projection.split(',')]
+        return {name: item[name] for name in names if name in item}
+
+    def put_item(self, Item, **kwargs):
+        self._request('PutItem')
+        with self._lock:
+            self.items[self._key(Item)] = dict(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        self._request('DeleteItem')
+        with self._lock:
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _FakeBatchWriter(self)
+
+    def get_item(self, Key, ProjectionExpression=None, **kwargs):
+        self._request('GetItem')
+        item = self.items.get(self._key(Key))
+        return {'Item': self._project(item, ProjectionExpression)} if item else {}
+
+    @staticmethod
+    def _matches(item, condition, values):
+        """Evaluates `a OR b` conditions built from attribute_(not_)exists(name) and `name = :value`."""
+        for term in condition.split(' OR '):
+            term = term.strip()
+            function = re.fullmatch(r'(attribute_exists|attribute_not_exists)\((\w+)\)', term)
+            if function:
+                exists = function.group(2) in item
+                if exists == (function.group(1) == 'attribute_exists'):
+                    return True
+            else:
+                name, value = (part.strip() for part in term.split('='))
+                if name in item and item[name] == values[value]:
+                    return True
+        return False
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ConditionExpression=None, **kwargs):
+        self._request('UpdateItem')
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            if ConditionExpression and not self._matches(self.items.get(self._key(Key), {}), ConditionExpression, values):
+                raise ClientError(
+                    {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}},
+                    'UpdateItem')
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            for action, body in re.findall(r'(SET|REMOVE)\s+(.*?)(?=\s+(?:SET|REMOVE)\s|$)', UpdateExpression):
+                for clause in body.split(','):
+                    if action == 'SET':
+                        name, value = (part.strip() for part in clause.split('='))
+                        item[name] = values[value]
+                    else:
+                        item.pop(clause.strip(), None)
+            return {'Attributes': dict(item)}
+
+    def _page(self, keys, projection, limit, extra_key=None):
+        page_size = min(limit or self.page_size, self.page_size)
+        page = keys[:page_size]
+        response = {
+            'Items': [self._project(self.items[key], projection) for key in page],
+            'Count': len(page),
+        }
+        if len(keys) > page_size:
+            response['LastEvaluatedKey'] = dict(extra_key or {}, **self._key_attributes(self.items[page[-1]]))
+        return response
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, IndexName=None,
+              ProjectionExpression=None, ExclusiveStartKey=None, Limit=None, **kwargs):
+        """Supports `Name = :value` key conditions; items without `Name` are not indexed (sparse index)."""
+        self._request('Query')
+        name, value = (part.strip() for part in KeyConditionExpression.split('='))
+        expected = ExpressionAttributeValues[value]
+        with self._lock:
+            keys = sorted(key for key, item in self.items.items() if name in item and item[name] == expected)
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            keys = [key for key in keys if key > start]
+        return self._page(keys, ProjectionExpression, Limit, {name: expected})
+
+    def scan(self, ProjectionExpression=None, Segment=None, TotalSegments=None,
+             ExclusiveStartKey=None, Limit=None, **kwargs):
+        self._request('Scan')
+        with self._lock:
+            keys = sorted(self.items)
+        if TotalSegments:
+            keys = [key for key in keys if zlib.crc32(str(key).encode()) % TotalSegments == Segment]
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            keys = [key for key in keys if key > start]
+        return self._page(keys, ProjectionExpression, Limit)
+
+
+class _FakeBatchWriter:
+    """Counts one request per 25 buffered puts, like BatchWriteItem."""
+
+    def __init__(self, table):
+        self.table = table
+        self.items = []
+
+    def put_item(self, Item):
+        self.items.append(dict(Item))
+        if len(self.items) == 25:
+            self.flush()
+
+    def flush(self):
+        if not self.items:
+            return
+        self.table._request('BatchWriteItem')
+        with self.table._lock:
+            for item in self.items:
+                self.table.items[self.table._key(item)] = item
+        self.items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
@@ -0,0 +1,141 @@
+#
+# Stand-ins for a boto3 S3 client.
+#
+# Support the calls the lambdas and the publish script make, including conditional GETs with
+# IfNoneMatch and paged listings, so they can be exercised without AWS:
+#
+#   s3 = FakeS3Client(latency=0.03)
+#   s3.put_object(Bucket='daily-motivation-messages', Key='message_start.txt', Body='Hi!')
+#
+# `error_rate` injects throttling: the request raises a ClientError with a 503 SlowDown, as when it
+# outlasted boto3's own retries, and is counted in `error_count`.
+#
+# FilesystemS3Client keeps the objects as files under <root>/<bucket>/<key>, so they survive
+# between runs and can be inspected:
+#
+#   s3 = FilesystemS3Client('/tmp/local-s3')
+#
+
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3Client:
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.objects = {}
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        with self._lock:
+            self.request_count += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise ClientError({
+                'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'},
+                'ResponseMetadata': {'HTTPStatusCode': 503},
+            }, operation)
+
+    @staticmethod
+    def _error(code, message, operation):
+        return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+    @staticmethod
+    def _etag(data):
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    # Storage, overridden by FilesystemS3Client
+    def _store(self, bucket, key, data):
+        with self._lock:
+            self.objects[(bucket, key)] = (data, self._etag(data))
+
+    def _load(self, bucket, key):
+        """(data, etag), None when there is no such object."""
+        return self.objects.get((bucket, key))
+
+    def _keys(self, bucket):
+        with self._lock:
+            return [key for (b, key) in self.objects if b == bucket]
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._request('PutObject')
+        data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        self._store(Bucket, Key, data)
+        return {'ETag': self._etag(data)}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self._request('GetObject')
+        stored = self._load(Bucket, Key)
+        if stored is None:
+            raise self._error('NoSuchKey', 'The specified key does not exist.', 'GetObject')
+        data, etag = stored
+        if IfNoneMatch == etag:
+            raise self._error('304', 'Not Modified', 'GetObject')
+        return {'Body': io.BytesIO(data), 'ETag': etag, 'ContentLength': len(data)}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        """Keys in lexicographic order, paged like S3 with the last key as the continuation token."""
+        self._request('ListObjectsV2')
+        keys = sorted(key for key in self._keys(Bucket) if key.startswith(Prefix) and key > (ContinuationToken or ''))
+        page = keys[:MaxKeys]
+        contents = []
+        for key in page:
+            data, etag = self._load(Bucket, key)
+            contents.append({'Key': key, 'ETag': etag, 'Size': len(data)})
+        response = {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+
+class FilesystemS3Client(FakeS3Client):
+    """FakeS3Client that keeps every bucket in a folder under `root`."""
+
+    def __init__(self, root, latency=0.0, error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _store(self, bucket, key, data):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def _load(self, bucket, key):
+        try:
+            with open(self._path(bucket, key), 'rb') as file:
+                data = file.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        return data, self._etag(data)
+
+    def _keys(self, bucket):
+        bucket_dir = os.path.join(self.root, bucket)
+        keys = []
+        for directory, _, filenames in os.walk(bucket_dir):
+            relative = os.path.relpath(directory, bucket_dir)
+            for filename in filenames:
+                if '.tmp-' in filename:
+                    continue  # a put in progress
+                keys.append(filename if relative == '.' else '/'.join(relative.split(os.sep) + [filename]))
+        return keys
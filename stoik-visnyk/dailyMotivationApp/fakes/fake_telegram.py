@@ -0,0 +1,191 @@
+#
+# Minimal local stand-in for the Telegram Bot API.
+#
+# Point a python-telegram-bot `Bot` at it with `base_url=server.base_url` (or set the
+# TELEGRAM_BASE_URL env variable for the lambdas) and every sendMessage call is recorded
+# in memory instead of reaching real chats. Useful for load-testing the broadcast locally:
+#
+#   python fake_telegram.py --port 8081 --latency 0.05 --rate-limit 20
+#   TELEGRAM_BASE_URL=http://127.0.0.1:8081/bot TELEGRAM_TOKEN=fake python app_daily_message.py
+#
+# With --rate-limit it answers sendMessage calls above that many per second with a 429 and
+# `retry_after`, like Telegram's flood control; --error-rate answers that share of them with a 502.
+#
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+
+class _Server(ThreadingHTTPServer):
+    # Several broadcast workers open a pool of connections each, the default backlog of 5 drops them
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class FakeTelegramServer:
+    """Threaded HTTP server that answers the Bot API methods the app uses."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, blocked_chats=(), rate_limit=None, retry_after=1,
+                 error_rate=0.0, seed=None):
+        self.latency = latency
+        # Chats that answer 403 like a user who blocked the bot
+        self.blocked_chats = set(blocked_chats)
+        # Accepted sendMessage calls per second before answering 429
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.flood_errors = 0
+        # Share of sendMessage calls answered with 502 Bad Gateway
+        self.error_rate = error_rate
+        self.server_errors = 0
+        self._random = random.Random(seed)
+        self._window = []
+        self.messages = []
+        # Updates handed out by getUpdates, for running a polling bot against the fake
+        self.updates = []
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _flooded(self):
+        """Counts the call into a sliding one-second window; True when it goes over the rate limit."""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._window and self._window[0] <= now - 1:
+                self._window.pop(0)
+            if len(self._window) >= self.rate_limit:
+                self.flood_errors += 1
+                return True
+            self._window.append(now)
+        return False
+
+    def handle(self, method, params):
+        """Returns (http_status, response_json) for a Bot API call."""
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            if chat_id in self.blocked_chats:
+                return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+            if self.error_rate and self._random.random() < self.error_rate:
+                with self._lock:
+                    self.server_errors += 1
+                return 502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+            if self._flooded():
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f'Too Many Requests: retry after {self.retry_after}',
+                             'parameters': {'retry_after': self.retry_after}}
+            with self._lock:
+                self.messages.append({'chat_id': chat_id, 'text': params.get('text'), 'at': time.monotonic()})
+                message_id = len(self.messages)
+            return 200, {'ok': True, 'result': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'from': BOT_USER,
+                'text': params.get('text'),
+            }}
+
+        if method == 'getUpdates':
+            # Long polling: waits up to `timeout` seconds for updates from push_update()
+            offset = int(params.get('offset') or 0)
+            deadline = time.monotonic() + float(params.get('timeout') or 0)
+            while True:
+                with self._lock:
+                    pending = [update for update in self.updates if update['update_id'] >= offset]
+                if pending or time.monotonic() >= deadline:
+                    return 200, {'ok': True, 'result': pending}
+                time.sleep(0.05)
+
+        # Everything else (setWebhook, deleteWebhook, ...) just succeeds
+        return 200, {'ok': True, 'result': True}
+
+    def push_update(self, update):
+        """Queues an update for the next getUpdates call."""
+        with self._lock:
+            self.updates.append(update)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length).decode('utf-8')
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(raw or '{}')
+                else:
+                    params = dict(parse_qsl(raw))
+                method = self.path.rsplit('/', 1)[-1]
+
+                status, body = server.handle(method, params)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass  # Keep the output clean during load tests
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local fake Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    parser.add_argument('--rate-limit', type=int, help='Answer 429 above this many messages per second')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of messages answered with 502')
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(args.host, args.port, args.latency, rate_limit=args.rate_limit,
+                                retry_after=args.retry_after, error_rate=args.error_rate)
+    print(f"Fake Telegram API listening on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Received {len(server.messages)} messages, answered {server.flood_errors} with 429")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#
+# Runs the fanned-out daily broadcast on one machine: the coordinator hands the worker events to
+# a process pool instead of invoking the lambda, and every worker process sends through the fake
+# Telegram API, reads subscribers from a SQLite store and journals into a SQLite journal.
+#
+# Usage:
+#   python local_fanout.py --subscribers 2000 --workers 4 --global-rate 400
+#   python local_fanout.py --subscribers 2000 --workers 1 --global-rate 400   # baseline
+#
+# The fake API does not enforce Telegram's limits, so --global-rate can be raised to see how far
+# the workers scale; with the real 30 msg/s limit the workers only split the same budget.
+#
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'fakes'), os.path.join(APP_DIR, 'daily_message')]
+
+from article_bundle import ARTICLE_BUNDLE_PATH_KEY, write_bundle
+from subscription_store import TOPICS, TOPIC_PREFIXES, SQLiteSubscriptionStore
+
+
+def prepare(workdir, subscribers):
+    """Creates the subscriber store, a bundle with today's articles and the env the workers read."""
+    store_path = os.path.join(workdir, 'subscriptions.db')
+    store = SQLiteSubscriptionStore(store_path)
+    for chat_id in range(1, subscribers + 1):
+        for topic in TOPICS:
+            store.set_subscription(chat_id, topic, True, f"chat {chat_id}")
+    store.close()
+
+    today = datetime.now()
+    bundle_path = os.path.join(workdir, 'articles.bundle')
+    write_bundle(bundle_path, {
+        TOPIC_PREFIXES[topic]: {(today.month, today.day): f"Local fan-out test article ({topic})"} for topic in TOPICS
+    })
+
+    os.environ['SUBSCRIPTION_STORE'] = f"sqlite:///{store_path}"
+    os.environ['DELIVERY_JOURNAL'] = f"sqlite:///{os.path.join(workdir, 'journal.db')}"
+    os.environ[ARTICLE_BUNDLE_PATH_KEY] = bundle_path
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-central-1')
+    os.environ.setdefault('TELEGRAM_TOKEN', '123:fake')
+
+
+def run_worker(event):
+    """Process pool entry point: one worker invocation of the daily message lambda."""
+    import app_daily_message
+    return json.loads(app_daily_message.lambda_handler(event, None)['body'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the fanned-out broadcast locally')
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--global-rate', type=float, default=30, help='Messages per second shared by all workers')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake Telegram response latency in seconds')
+    parser.add_argument('--workdir', help='Keep the SQLite files here instead of a temporary folder')
+    args = parser.parse_args()
+
+    from fake_telegram import FakeTelegramServer
+
+    with tempfile.TemporaryDirectory() as tmp, FakeTelegramServer(latency=args.latency) as server:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        started = time.monotonic()
+        prepare(workdir, args.subscribers)
+        print(f"Prepared {args.subscribers} subscribers in {time.monotonic() - started:.1f}s")
+        os.environ['TELEGRAM_BASE_URL'] = server.base_url
+
+        import app_daily_message
+
+        # Fresh interpreters, so every worker builds its own bot and stores like a lambda would
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            def dispatch(events):
+                return list(pool.map(run_worker, events))
+            stats = app_daily_message.run_coordinator(args.workers, dispatch, args.global_rate)
+
+        stats['received'] = len(server.messages)
+        print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
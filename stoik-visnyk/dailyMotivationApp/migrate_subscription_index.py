@@ -0,0 +1,173 @@
+#
+# Backfills the per-topic subscriber index from the existing UserPreferences table.
+#
+# Usage:
+#   python migrate_subscription_index.py --create-indexes   # add the <Topic>Subscribers/ScheduledChats GSIs, then backfill
+#   python migrate_subscription_index.py --dry-run          # only report what would change
+#   python migrate_subscription_index.py --sqlite bot.db    # copy subscriptions into a local SQLite store
+#
+# The backfill is idempotent: it sets `<Topic>Shard` on subscribed chats that miss it and
+# removes it from chats that are no longer subscribed, so it is safe to run more than once.
+#
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared'))
+
+from dynamodb_scan import scan_items
+from subscription_store import (
+    TOPICS, TABLE_NAME, CHAT_ID_KEY, CHAT_NAME_KEY, DELIVERY_TIME_KEY, TIME_ZONE_KEY, SCHEDULE_SHARD_KEY,
+    SCHEDULE_INDEX_NAME, INDEX_SHARDS, SQLiteSubscriptionStore, chat_shard, index_name, shard_attribute,
+    subscribed_attribute,
+)
+
+
+def index_definitions():
+    """(name, shard attribute, projection) of every sparse GSI the stores query."""
+    definitions = [(index_name(topic), shard_attribute(topic), {'ProjectionType': 'KEYS_ONLY'}) for topic in TOPICS]
+    definitions.append((SCHEDULE_INDEX_NAME, SCHEDULE_SHARD_KEY, {
+        'ProjectionType': 'INCLUDE', 'NonKeyAttributes': [DELIVERY_TIME_KEY, TIME_ZONE_KEY],
+    }))
+    return definitions
+
+
+def create_indexes(table):
+    """Adds the missing sparse GSIs; DynamoDB allows one index creation per update."""
+    client = table.meta.client
+    description = client.describe_table(TableName=table.name)['Table']
+    existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+    provisioned = description.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST'
+
+    for name, shard_key, projection in index_definitions():
+        if name in existing:
+            print(f"Index {name} already exists")
+            continue
+
+        index = {
+            'IndexName': name,
+            'KeySchema': [
+                {'AttributeName': shard_key, 'KeyType': 'HASH'},
+                {'AttributeName': CHAT_ID_KEY, 'KeyType': 'RANGE'},
+            ],
+            'Projection': projection,
+        }
+        if provisioned:
+            index['ProvisionedThroughput'] = {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+
+        print(f"Creating index {name}...")
+        client.update_table(
+            TableName=table.name,
+            AttributeDefinitions=[
+                {'AttributeName': shard_key, 'AttributeType': 'N'},
+                {'AttributeName': CHAT_ID_KEY, 'AttributeType': 'S'},
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': index}],
+        )
+        wait_for_index(client, table.name, name)
+
+
+def wait_for_index(client, table_name, name):
+    while True:
+        description = client.describe_table(TableName=table_name)['Table']
+        statuses = {index['IndexName']: index['IndexStatus'] for index in description.get('GlobalSecondaryIndexes', [])}
+        if statuses.get(name) == 'ACTIVE':
+            print(f"Index {name} is active")
+            return
+        time.sleep(10)
+
+
+def index_update(item):
+    """Returns the UpdateExpression that brings the item's shard attributes in line, or None."""
+    assignments, removals = [], []
+    for topic in TOPICS:
+        subscribed = item.get(subscribed_attribute(topic), False)
+        shard = item.get(shard_attribute(topic))
+        if subscribed and shard != chat_shard(item[CHAT_ID_KEY]):
+            assignments.append(f"{shard_attribute(topic)} = :{topic}")
+        elif not subscribed and shard is not None:
+            removals.append(shard_attribute(topic))
+
+    expression = ''
+    if assignments:
+        expression += 'SET ' + ', '.join(assignments)
+    if removals:
+        expression += ' REMOVE ' + ', '.join(removals)
+    return expression.strip() or None
+
+
+def apply_update(table, item, expression):
+    values = {f":{topic}": chat_shard(item[CHAT_ID_KEY]) for topic in TOPICS if f":{topic}" in expression}
+    kwargs = {'Key': {CHAT_ID_KEY: item[CHAT_ID_KEY]}, 'UpdateExpression': expression}
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    table.update_item(**kwargs)
+
+
+async def backfill(table, segments, dry_run, workers):
+    projection = ', '.join([CHAT_ID_KEY] + [subscribed_attribute(t) for t in TOPICS] + [shard_attribute(t) for t in TOPICS])
+    loop = asyncio.get_running_loop()
+    scanned = updated = 0
+    pending = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        async for item in scan_items(table, total_segments=segments, ProjectionExpression=projection):
+            scanned += 1
+            expression = index_update(item)
+            if not expression:
+                continue
+            updated += 1
+            if dry_run:
+                print(f"{item[CHAT_ID_KEY]}: {expression}")
+            else:
+                pending.append(loop.run_in_executor(executor, apply_update, table, item, expression))
+        await asyncio.gather(*pending)
+
+    print(f"Scanned {scanned} chats, {'would update' if dry_run else 'updated'} {updated}")
+
+
+async def export_to_sqlite(table, segments, path):
+    store = SQLiteSubscriptionStore(path)
+    projection = ', '.join([CHAT_ID_KEY, CHAT_NAME_KEY, DELIVERY_TIME_KEY, TIME_ZONE_KEY] +
+                           [subscribed_attribute(t) for t in TOPICS])
+    copied = 0
+    async for item in scan_items(table, total_segments=segments, ProjectionExpression=projection):
+        for topic in TOPICS:
+            store.set_subscription(item[CHAT_ID_KEY], topic, item.get(subscribed_attribute(topic), False),
+                                   item.get(CHAT_NAME_KEY, ''))
+        if item.get(DELIVERY_TIME_KEY):
+            store.set_delivery_time(item[CHAT_ID_KEY], item[DELIVERY_TIME_KEY], item[TIME_ZONE_KEY])
+        copied += 1
+    store.close()
+    print(f"Copied {copied} chats into {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the per-topic subscriber index')
+    parser.add_argument('--table', default=TABLE_NAME)
+    parser.add_argument('--segments', type=int, default=4, help='Parallel scan segments')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent update requests')
+    parser.add_argument('--create-indexes', action='store_true', help='Create missing GSIs first')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--sqlite', help='Copy subscriptions into this SQLite database instead')
+    args = parser.parse_args()
+
+    import boto3
+    table = boto3.resource('dynamodb').Table(args.table)
+
+    if args.sqlite:
+        asyncio.run(export_to_sqlite(table, args.segments, args.sqlite))
+        return
+
+    if args.create_indexes and not args.dry_run:
+        create_indexes(table)
+    print(f"Backfilling {INDEX_SHARDS} shards per topic for {', '.join(TOPICS)}...")
+    asyncio.run(backfill(table, args.segments, args.dry_run, args.workers))
+
+
+if __name__ == '__main__':
+    main()
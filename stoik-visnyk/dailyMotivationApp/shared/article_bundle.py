@@ -0,0 +1,111 @@
+#
+# Compact, memory-mappable bundle of all daily articles.
+#
+# Layout (little-endian):
+#   header   b'SVAB', version u16, topic count u16, days u16
+#   topics   per topic: prefix length u8 + prefix (e.g. b'stoic/')
+#   index    per topic, per day of a leap year: offset u32, length u32 (0, 0 when missing)
+#   data     UTF-8 article texts
+#
+# The day index is the day of year in a leap year (Feb 29 is day 59), so every MM-DD has a
+# fixed slot and a lookup is two integer reads plus one slice of the mapped file.
+#
+
+import mmap
+import os
+import struct
+from datetime import date
+
+MAGIC = b'SVAB'
+VERSION = 1
+DAYS = 366
+BUNDLE_FILENAME = 'articles.bundle'
+ARTICLE_BUNDLE_PATH_KEY = 'ARTICLE_BUNDLE_PATH'
+
+_HEADER = struct.Struct('<4sHHH')
+_ENTRY = struct.Struct('<II')
+
+
+def day_of_year(month, day):
+    """0-based slot of MM-DD in a leap year."""
+    return (date(2000, month, day) - date(2000, 1, 1)).days
+
+
+def write_bundle(path, articles):
+    """
+    Writes `articles`, a {prefix: {(month, day): text}} mapping, as a bundle.
+    Returns the size of the written file.
+    """
+    prefixes = sorted(articles)
+    topics = b''.join(struct.pack('<B', len(p.encode())) + p.encode() for p in prefixes)
+    index_offset = _HEADER.size + len(topics)
+    data_offset = index_offset + len(prefixes) * DAYS * _ENTRY.size
+
+    index = bytearray(len(prefixes) * DAYS * _ENTRY.size)
+    data = bytearray()
+    for topic_number, prefix in enumerate(prefixes):
+        for (month, day), text in articles[prefix].items():
+            body = text.encode('utf-8')
+            slot = topic_number * DAYS + day_of_year(month, day)
+            _ENTRY.pack_into(index, slot * _ENTRY.size, data_offset + len(data), len(body))
+            data += body
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, len(prefixes), DAYS))
+        file.write(topics)
+        file.write(index)
+        file.write(data)
+    os.replace(tmp_path, path)
+    return data_offset + len(data)
+
+
+class ArticleBundle:
+    """Read-only view over a bundle file; the OS pages in only the articles that are read."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, topic_count, days = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or days != DAYS:
+            raise ValueError(f"{path} is not a version {VERSION} article bundle")
+
+        position = _HEADER.size
+        self._topics = {}
+        for topic_number in range(topic_count):
+            length = self._map[position]
+            prefix = self._map[position + 1:position + 1 + length].decode()
+            self._topics[prefix] = topic_number
+            position += 1 + length
+        self._index_offset = position
+
+    @property
+    def prefixes(self):
+        return tuple(self._topics)
+
+    def get(self, prefix, day):
+        """Article text of `prefix` for the given date, or None when the bundle does not have it."""
+        topic_number = self._topics.get(prefix)
+        if topic_number is None:
+            return None
+        slot = topic_number * DAYS + day_of_year(day.month, day.day)
+        offset, length = _ENTRY.unpack_from(self._map, self._index_offset + slot * _ENTRY.size)
+        if not length:
+            return None
+        return self._map[offset:offset + length].decode('utf-8')
+
+    def close(self):
+        self._map.close()
+
+
+def load_bundle(path=None):
+    """
+    Opens the bundle at `path`, ARTICLE_BUNDLE_PATH or next to this module (where the lambda layer
+    puts it). Returns None when there is no bundle, so callers fall back to S3.
+    """
+    path = path or os.getenv(ARTICLE_BUNDLE_PATH_KEY) or os.path.join(os.path.dirname(os.path.abspath(__file__)), BUNDLE_FILENAME)
+    if not os.path.isfile(path):
+        return None
+    return ArticleBundle(path)
@@ -0,0 +1,281 @@
+#
+# Full-text search over the daily articles: a compact inverted index built offline from daily_articles
+# (build_search_index.py) and memory-mapped by the bot, so a query reads no S3 object.
+#
+# Words are normalized the same way when building and when searching: HTML tags are dropped, the text is
+# case-folded, stress marks and apostrophes removed (дев’ять = девять), ґ folded into г and the Russian
+# letters a reader may type on a wrong layout mapped to their Ukrainian twins (ы -> и, э -> е, ё -> е).
+# Stop words are skipped and a light suffix stripper reduces the inflected forms of a word to one stem
+# (мудрість, мудрості, мудрістю -> мудр). A query word without an exact stem also matches the stems it is a
+# prefix of. Matches are ranked by the number of query words they contain, then by BM25.
+#
+# Layout (little-endian):
+#   header    b'SVSI', version u16, topic count u16, document count u16, term count u32, average length f32
+#   topics    per topic: prefix length u8 + prefix (e.g. b'stoic/')
+#   documents per document: topic number u8, day of year u16 (article_bundle slot), length u16,
+#             title offset u32, title length u16
+#   terms     per term, sorted by stem: stem offset u32, stem length u8, postings offset u32, document count u16
+#   postings  per term and document: document number u16, term frequency u8
+#   strings   UTF-8 stems and titles
+#
+
+import math
+import mmap
+import os
+import re
+import struct
+from collections import namedtuple
+from datetime import date, timedelta
+
+from article_bundle import day_of_year
+
+MAGIC = b'SVSI'
+VERSION = 1
+INDEX_FILENAME = 'articles.index'
+SEARCH_INDEX_PATH_KEY = 'SEARCH_INDEX_PATH'
+
+DEFAULT_LIMIT = 5
+MIN_STEM_LENGTH = 3
+MAX_PREFIX_TERMS = 32
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_HEADER = struct.Struct('<4sHHHIf')
+_DOCUMENT = struct.Struct('<BHHIH')
+_TERM = struct.Struct('<IBIH')
+_POSTING = struct.Struct('<HB')
+
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'[0-9a-zа-щьюяєіїґ]+')
+_BOLD = re.compile(r'<b>(.*?)</b>', re.S)
+_FOLD = str.maketrans({
+    '\u0301': None, '’': None, 'ʼ': None, "'": None, '`': None, '‘': None,
+    'ґ': 'г', 'ы': 'и', 'э': 'е', 'ё': 'е', 'ъ': None,
+})
+
+STOP_WORDS = frozenset((
+    'а', 'аби', 'але', 'б', 'би', 'бо', 'був', 'була', 'були', 'було', 'бути', 'в', 'вам', 'вас', 'ви', 'від',
+    'він', 'вона', 'вони', 'воно', 'все', 'всі', 'де', 'для', 'до', 'його', 'її', 'з', 'за', 'зі', 'і', 'із',
+    'й', 'їх', 'к', 'коли', 'ледь', 'ми', 'між', 'мене', 'мені', 'на', 'над', 'нам', 'нас', 'не', 'неї', 'ні',
+    'ніж', 'нього', 'о', 'об', 'по', 'під', 'при', 'про', 'саме', 'так', 'також', 'там', 'та', 'те', 'теж',
+    'ти', 'то', 'тому', 'той', 'ту', 'тут', 'у', 'хоча', 'це', 'цей', 'ці', 'цього', 'чи', 'що', 'щоб', 'я',
+    'як', 'який', 'яка', 'яке', 'які', 'якщо',
+))
+
+# Inflectional endings, longest first so that -ами wins over -и
+_SUFFIXES = tuple(sorted((
+    'ування', 'ювання', 'ання', 'яння', 'ення', 'іння', 'ість', 'ості', 'істю',
+    'ати', 'яти', 'ити', 'іти', 'ути', 'ать', 'ять', 'ють', 'уть', 'ить', 'ємо', 'имо', 'емо', 'ете', 'ите',
+    'ала', 'ало', 'али', 'ила', 'ило', 'или', 'ував', 'ював', 'ла', 'ло', 'ли', 'ть', 'ю', 'є', 'е',
+    'ого', 'ому', 'ими', 'іми', 'ої', 'ою', 'ею', 'єю', 'их', 'іх', 'им', 'ім', 'ий', 'ій', 'ая', 'яя',
+    'ами', 'ями', 'ах', 'ях', 'ам', 'ям', 'ів', 'їв', 'ей', 'ом', 'ем', 'єм', 'а', 'я', 'у', 'і', 'ї', 'о',
+    'и', 'ь',
+), key=len, reverse=True))
+_REFLEXIVE = ('ся', 'сь')
+
+SearchResult = namedtuple('SearchResult', 'prefix day title score')
+
+
+def normalize(text):
+    """Case-folded text without tags, stress marks and apostrophes, with ґ/ы/э/ё folded."""
+    return _TAG.sub(' ', text).casefold().translate(_FOLD)
+
+
+def stem(word):
+    """Strips one reflexive and one inflectional ending while at least MIN_STEM_LENGTH letters stay."""
+    for ending in _REFLEXIVE:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            word = word[:-len(ending)]
+            break
+    for ending in _SUFFIXES:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Stems of the words of `text` that are not stop words, in order."""
+    return [stem(word) for word in _WORD.findall(normalize(text)) if word not in STOP_WORDS]
+
+
+def article_title(text):
+    """The bold line after the date, e.g. `Контроль і вибір`; all-caps titles are capitalized."""
+    lines = [_TAG.sub('', line).strip() for line in _BOLD.findall(text)]
+    lines = [line for line in lines if line]
+    title = lines[1] if len(lines) > 1 else (lines[0] if lines else '')
+    return title.capitalize() if title.isupper() else title
+
+
+def write_index(path, articles):
+    """
+    Writes the index of `articles`, a {prefix: {(month, day): text}} mapping as for write_bundle.
+    Returns (document count, term count, file size).
+    """
+    prefixes = sorted(articles)
+    documents = []
+    postings = {}
+    for topic_number, prefix in enumerate(prefixes):
+        for (month, day), text in sorted(articles[prefix].items()):
+            document_number = len(documents)
+            terms = tokenize(text)
+            documents.append((topic_number, day_of_year(month, day), len(terms), article_title(text)))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((document_number, min(count, 255)))
+
+    strings = bytearray()
+    document_table = bytearray()
+    for topic_number, slot, length, title in documents:
+        encoded = title.encode('utf-8')[:0xFFFF]
+        document_table += _DOCUMENT.pack(topic_number, slot, min(length, 0xFFFF), len(strings), len(encoded))
+        strings += encoded
+
+    term_table = bytearray()
+    posting_data = bytearray()
+    for term in sorted(postings):
+        encoded = term.encode('utf-8')[:255]
+        term_table += _TERM.pack(len(strings), len(encoded), len(posting_data), len(postings[term]))
+        strings += encoded
+        for entry in postings[term]:
+            posting_data += _POSTING.pack(*entry)
+
+    topics = b''.join(struct.pack('<B', len(p.encode())) + p.encode() for p in prefixes)
+    average_length = sum(document[2] for document in documents) / max(len(documents), 1)
+    # Offsets in the tables are relative to their section, the reader adds the section starts
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, len(prefixes), len(documents), len(postings), average_length))
+        file.write(topics)
+        file.write(document_table)
+        file.write(term_table)
+        file.write(posting_data)
+        file.write(strings)
+        size = file.tell()
+    os.replace(tmp_path, path)
+    return len(documents), len(postings), size
+
+
+def slot_to_day(slot):
+    """Date in the leap year 2000 of an article_bundle day slot, so Feb 29 exists."""
+    return date(2000, 1, 1) + timedelta(days=slot)
+
+
+class SearchIndex:
+    """Read-only view over an index file; a query binary-searches the mapped term table."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, topic_count, self.document_count, self.term_count, self.average_length = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} search index")
+
+        position = _HEADER.size
+        self.prefixes = []
+        for _ in range(topic_count):
+            length = self._map[position]
+            self.prefixes.append(self._map[position + 1:position + 1 + length].decode())
+            position += 1 + length
+        self._documents_offset = position
+        self._terms_offset = self._documents_offset + self.document_count * _DOCUMENT.size
+        self._postings_offset = self._terms_offset + self.term_count * _TERM.size
+        total_postings = 0
+        if self.term_count:
+            _, _, last_offset, last_count = self._term_entry(self.term_count - 1)
+            total_postings = last_offset + last_count * _POSTING.size
+        self._strings_offset = self._postings_offset + total_postings
+
+    def _term_entry(self, number):
+        return _TERM.unpack_from(self._map, self._terms_offset + number * _TERM.size)
+
+    def _string(self, offset, length):
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _term(self, number):
+        offset, length, _, _ = self._term_entry(number)
+        return self._string(offset, length)
+
+    def _lower_bound(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _matching_terms(self, term):
+        """Numbers of the index terms for one query stem: the exact one, else the ones it prefixes."""
+        number = self._lower_bound(term)
+        if number < self.term_count and self._term(number) == term:
+            return [number]
+        if len(term) < MIN_STEM_LENGTH:
+            return []
+        numbers = []
+        while number < self.term_count and len(numbers) < MAX_PREFIX_TERMS and self._term(number).startswith(term):
+            numbers.append(number)
+            number += 1
+        return numbers
+
+    def _postings(self, number):
+        _, _, offset, count = self._term_entry(number)
+        start = self._postings_offset + offset
+        return _POSTING.iter_unpack(self._map[start:start + count * _POSTING.size]), count
+
+    def _document(self, number):
+        return _DOCUMENT.unpack_from(self._map, self._documents_offset + number * _DOCUMENT.size)
+
+    def search(self, query, limit=DEFAULT_LIMIT, prefixes=None):
+        """
+        Best `limit` articles for `query` as SearchResult(prefix, day, title, score), `day` being a date
+        in the leap year 2000. `prefixes` restricts the topics.
+        """
+        scores = {}
+        matched = {}
+        for word_number, term in enumerate(dict.fromkeys(tokenize(query))):
+            word_scores = {}
+            for number in self._matching_terms(term):
+                entries, count = self._postings(number)
+                idf = math.log(1 + (self.document_count - count + 0.5) / (count + 0.5))
+                for document_number, frequency in entries:
+                    length = self._document(document_number)[2]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    # Prefix matches of one query word count once, with their best term
+                    word_scores[document_number] = max(word_scores.get(document_number, 0.0), score)
+            for document_number, score in word_scores.items():
+                scores[document_number] = scores.get(document_number, 0.0) + score
+                matched[document_number] = matched.get(document_number, 0) + 1
+
+        results = []
+        for document_number in sorted(scores, key=lambda n: (matched[n], scores[n]), reverse=True):
+            topic_number, slot, _, title_offset, title_length = self._document(document_number)
+            prefix = self.prefixes[topic_number]
+            if prefixes and prefix not in prefixes:
+                continue
+            results.append(SearchResult(prefix, slot_to_day(slot), self._string(title_offset, title_length),
+                                        round(scores[document_number], 3)))
+            if len(results) >= limit:
+                break
+        return results
+
+    def close(self):
+        self._map.close()
+
+
+def load_index(path=None):
+    """
+    Opens the index at `path`, SEARCH_INDEX_PATH or next to this module (where the lambda layer puts it).
+    Returns None when there is no index.
+    """
+    path = path or os.getenv(SEARCH_INDEX_PATH_KEY) or os.path.join(os.path.dirname(os.path.abspath(__file__)), INDEX_FILENAME)
+    if not os.path.isfile(path):
+        return None
+    return SearchIndex(path)
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+S3_PREFIX_STOIC = 'stoic/'
+S3_PREFIX_PARENT = 'parent/'
+ARTICLE_PREFIXES = (S3_PREFIX_STOIC, S3_PREFIX_PARENT)
+
+STOIC_EMOJI = '📖'
+PARENT_EMOJI = '👶🏻'
+ARTICLE_EMOJIS = {S3_PREFIX_STOIC: STOIC_EMOJI, S3_PREFIX_PARENT: PARENT_EMOJI}
+
+MONTHS_UK = {
+    '01': 'січня', '02': 'лютого', '03': 'березня', '04': 'квітня',
+    '05': 'травня', '06': 'червня', '07': 'липня', '08': 'серпня',
+    '09': 'вересня', '10': 'жовтня', '11': 'листопада', '12': 'грудня'
+}
+
+
+def get_filename_with_cyrillic_month(day=None):
+    """Article file name for the given date (today by default), e.g. `03-09 (9 березня).txt`."""
+    today = day or datetime.now()
+    day_number = today.strftime('%d').lstrip('0')
+    day_with_leading_zero = today.strftime('%d')
+    month_number = today.strftime('%m')
+    month_name = MONTHS_UK[month_number]
+    filename = f"{month_number}-{day_with_leading_zero} ({day_number} {month_name}).txt"
+    return filename.lower()
+
+
+def render_article(prefix, text):
+    """Prepends the emoji of the article type, the way articles are sent to chats."""
+    return ARTICLE_EMOJIS.get(prefix, PARENT_EMOJI) + " " + text
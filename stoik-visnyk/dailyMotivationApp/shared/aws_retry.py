@@ -0,0 +1,58 @@
+#
+# Retries of throttled and failed AWS calls, on top of the few boto3 makes by itself.
+#
+# A DynamoDB ProvisionedThroughputExceeded or an S3 SlowDown/5xx that outlasts boto3's own retries
+# reaches us as a ClientError. On the broadcast's paths that would lose a page of subscribers, a
+# batch of the journal or an article, so those calls are wrapped with `with_retries`:
+#
+#   query = with_retries(table.query)
+#   response = query(KeyConditionExpression=...)
+#
+
+import functools
+import logging
+import time
+
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.1   # seconds before the first retry, doubled for every next one
+MAX_DELAY = 2.0
+
+RETRYABLE_CODES = frozenset({
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'SlowDown',
+    'InternalServerError',
+    'InternalError',
+    'ServiceUnavailable',
+})
+
+logger = logging.getLogger()
+
+
+def is_retryable(error):
+    """Throttling or a 5xx of an AWS call, which the same call can get past a little later."""
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    if response.get('Error', {}).get('Code') in RETRYABLE_CODES:
+        return True
+    return response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+
+def with_retries(operation, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Wraps a blocking call, so retryable errors are tried again with exponential backoff."""
+
+    @functools.wraps(operation)
+    def call(*args, **kwargs):
+        for attempt in range(max_attempts):
+            try:
+                return operation(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt + 1 == max_attempts:
+                    raise
+                delay = min(max_delay, base_delay * 2 ** attempt)
+                logger.warning(f"Retrying {getattr(operation, '__name__', 'AWS call')} in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    return call
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+
+from delivery import DeliveryClient, SENT, DROPPED
+from rate_limiter import TELEGRAM_GLOBAL_RATE
+
+DEFAULT_CONCURRENCY = 20
+
+logger = logging.getLogger()
+
+
+class BroadcastStats:
+    """Counters for a single broadcast run."""
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.callback_errors = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def messages_per_second(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'deferred': self.deferred,
+            'callbackErrors': self.callback_errors,
+            'elapsedSeconds': round(self.elapsed, 3),
+            'messagesPerSecond': round(self.messages_per_second, 2),
+        }
+
+
+class Broadcaster:
+    """
+    Sends many messages with bounded concurrency while staying inside Telegram's limits.
+
+    Messages are `(chat_id, text)` tuples, optionally with extra items the callbacks need,
+    coming from a regular or an async iterable, so the sender can start while the list of
+    recipients is still being produced. `on_delivered(message)` is awaited after every delivery
+    and `on_failed(message, error)` once a message is dropped; an error they raise is logged and
+    counted, the worker carries on with the next message.
+
+    Transient failures are put back into the queue after their backoff, so a worker moves on to
+    other chats instead of sleeping on a flood-controlled one. With a `deadline` (time.monotonic())
+    a retry whose backoff, or a flood-control pause that, would end after it is not waited for: the
+    message is counted as deferred and, never journaled as delivered, left to the next run.
+    """
+
+    def __init__(self, bot, concurrency=DEFAULT_CONCURRENCY, global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_limiter=None, parse_mode='HTML', on_delivered=None, on_failed=None, client=None,
+                 metrics=None, deadline=None):
+        self.client = client or DeliveryClient(bot, global_rate, chat_limiter, metrics=metrics)
+        self.deadline = deadline
+        self.concurrency = concurrency
+        self.parse_mode = parse_mode
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self._retries = set()
+
+    async def _requeue(self, queue, message, attempt, delay):
+        await asyncio.sleep(delay)
+        await queue.put((message, attempt))
+
+    def _past_deadline(self, at):
+        return self.deadline is not None and at > self.deadline
+
+    async def _callback(self, stats, callback, message, *args):
+        # A journal write that fails must not take the worker down, run() would then wait for it forever
+        try:
+            await callback(message, *args)
+        except Exception as e:
+            stats.callback_errors += 1
+            logger.error(f"{callback.__name__} failed for {message[0]}: {e}")
+
+    async def _send(self, queue, message, attempt, stats):
+        chat_id, text = message[0], message[1]
+        if self._past_deadline(self.client.rate_limiter.paused_until):
+            # A flood-control pause outlasts the run, sending would first sleep past the deadline
+            stats.deferred += 1
+            return
+        result = await self.client.attempt(chat_id, text, attempt, parse_mode=self.parse_mode)
+
+        if result.outcome == SENT:
+            stats.sent += 1
+            if self.on_delivered:
+                await self._callback(stats, self.on_delivered, message)
+        elif result.outcome == DROPPED:
+            stats.dropped += 1
+            if self.on_failed:
+                await self._callback(stats, self.on_failed, message, result.error)
+        elif self._past_deadline(time.monotonic() + result.delay):
+            # Retrying sooner than the backoff would only fail again, so the chat waits for the next run
+            stats.deferred += 1
+            logger.warning(f"Deferring message to {chat_id}: its retry in {result.delay:.1f}s is past the deadline")
+        else:
+            stats.retried += 1
+            retry = asyncio.create_task(self._requeue(queue, message, attempt + 1, result.delay))
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+
+    async def _worker(self, queue, stats):
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await self._send(queue, item[0], item[1], stats)
+            finally:
+                queue.task_done()
+
+    async def run(self, messages):
+        """Send every message and return the BroadcastStats of the run."""
+        stats = BroadcastStats()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue, stats)) for _ in range(self.concurrency)]
+
+        try:
+            if hasattr(messages, '__aiter__'):
+                async for message in messages:
+                    await queue.put((message, 0))
+            else:
+                for message in messages:
+                    await queue.put((message, 0))
+        finally:
+            # Retries waiting for their backoff still have to go through the queue
+            while True:
+                await queue.join()
+                if not self._retries:
+                    break
+                await asyncio.wait(set(self._retries))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+        stats.finished_at = time.monotonic()
+        logger.info(
+            f"Broadcast finished: {stats.sent} sent, {stats.retried} retried, {stats.dropped} dropped, "
+            f"{stats.deferred} deferred, {stats.callback_errors} callback errors "
+            f"in {stats.elapsed:.2f}s ({stats.messages_per_second:.1f} msg/s, "
+            f"global rate now {self.client.rate_limiter.rate:.0f} msg/s)"
+        )
+        return stats
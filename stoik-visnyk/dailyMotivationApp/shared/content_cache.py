@@ -0,0 +1,136 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from articles import get_filename_with_cyrillic_month, render_article
+from aws_retry import with_retries
+from metrics import Metrics
+
+DEFAULT_TTL_SECONDS = 300
+MAX_ENTRIES = 64
+
+logger = logging.getLogger()
+
+
+class _Entry:
+    __slots__ = ('text', 'etag', 'checked_at', 'rendered')
+
+    def __init__(self, text, etag, checked_at):
+        self.text = text
+        self.etag = etag
+        self.checked_at = checked_at
+        self.rendered = None
+
+
+class ContentCache:
+    """
+    Keeps S3 objects in memory between reads and between warm lambda invocations.
+
+    Within `ttl` seconds an object is served straight from memory. After that it is revalidated
+    with a conditional GET (If-None-Match), which only transfers the body when the ETag changed.
+    Articles found in the optional ArticleBundle are served from it without any network call.
+    """
+
+    def __init__(self, s3_client, bucket, ttl=DEFAULT_TTL_SECONDS, clock=time.monotonic, bundle=None, metrics=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.ttl = ttl
+        self.bundle = bundle
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bundle_articles = {}
+        self.metrics = metrics or Metrics('content')
+        self.hits = 0
+        self.revalidations = 0
+        self.fetches = 0
+
+    def _load(self, key):
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry and now - entry.checked_at < self.ttl:
+            self.hits += 1
+            self.metrics.increment('cacheHits')
+            return entry
+
+        request = {'Bucket': self.bucket, 'Key': key}
+        if entry:
+            request['IfNoneMatch'] = entry.etag
+        try:
+            with self.metrics.timer('fetch'):
+                response = with_retries(self.s3_client.get_object)(**request)
+                body = response['Body'].read().decode('utf-8')
+        except ClientError as e:
+            if entry and e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                self.revalidations += 1
+                self.metrics.increment('cacheRevalidations')
+                entry.checked_at = now
+                return entry
+            raise
+
+        self.fetches += 1
+        self.metrics.increment('s3Fetches')
+        entry = _Entry(body, response.get('ETag'), now)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > MAX_ENTRIES:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_text(self, key):
+        """Returns the decoded object body."""
+        return self._load(key).text
+
+    def _bundle_article(self, prefix, day):
+        if self.bundle is None:
+            return None
+        day = day or datetime.now()
+        key = (prefix, day.month, day.day)
+        if key not in self._bundle_articles:
+            with self.metrics.timer('fetch'):
+                text = self.bundle.get(prefix, day)
+            self._bundle_articles[key] = self._render(prefix, text) if text is not None else None
+        return self._bundle_articles[key]
+
+    def get_article(self, prefix, day=None):
+        """Returns the article of the given type and day, already prefixed with its emoji."""
+        rendered = self._bundle_article(prefix, day)
+        if rendered is not None:
+            return rendered
+
+        entry = self._load(f"{prefix}{get_filename_with_cyrillic_month(day)}")
+        if entry.rendered is None:
+            entry.rendered = self._render(prefix, entry.text)
+        return entry.rendered
+
+    def _render(self, prefix, text):
+        with self.metrics.timer('render'):
+            return render_article(prefix, text)
+
+    def _is_fresh(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and self._clock() - entry.checked_at < self.ttl
+
+    async def _in_executor(self, key, method, *args):
+        # Fresh entries are plain dict lookups; only S3 round-trips are moved off the event loop
+        if self._is_fresh(key):
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(method, *args))
+
+    async def get_text_async(self, key):
+        return await self._in_executor(key, self.get_text, key)
+
+    async def get_article_async(self, prefix, day=None):
+        rendered = self._bundle_article(prefix, day)
+        if rendered is not None:
+            return rendered
+        key = f"{prefix}{get_filename_with_cyrillic_month(day)}"
+        return await self._in_executor(key, self.get_article, prefix, day)
+
+    def clear(self):
+        self._entries.clear()
+        self._bundle_articles.clear()
@@ -0,0 +1,114 @@
+#
+# Delivery client shared by the daily broadcast and the bot's replies.
+#
+# Every send waits for the per-chat and the global rate limiters. Failures are sorted into:
+#   flood control (429 RetryAfter) - retried after the requested pause; the global rate is halved
+#   transient (timeouts, connection errors) - retried with exponential backoff
+#   permanent (blocked bot, bad request, anything else) - dropped
+# After a 429 the global rate grows back step by step while no new 429 arrives.
+#
+
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, InvalidToken, NetworkError, RetryAfter
+
+from metrics import Metrics
+from rate_limiter import AdaptiveRateLimiter, ChatRateLimiter, TELEGRAM_GLOBAL_RATE
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1.0   # seconds before the first retry of a transient error, doubled for every next one
+MAX_DELAY = 30.0
+
+SENT = 'sent'
+RETRY = 'retry'
+DROPPED = 'dropped'
+
+logger = logging.getLogger()
+
+# Outcome of one send attempt; `delay` is set for RETRY, `error` for RETRY and DROPPED
+Attempt = namedtuple('Attempt', 'outcome delay error')
+
+
+class DeliveryStats:
+    """Counters over the lifetime of a DeliveryClient."""
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.flood_waits = 0
+
+    def as_dict(self):
+        return {'sent': self.sent, 'retried': self.retried, 'dropped': self.dropped, 'floodWaits': self.flood_waits}
+
+
+def retry_delay(error, attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Seconds to wait before retrying after `error`, None when retrying cannot help."""
+    if isinstance(error, RetryAfter):
+        return float(error.retry_after)
+    # BadRequest and Forbidden are NetworkErrors too in python-telegram-bot, so they go first
+    if isinstance(error, (BadRequest, Forbidden, ChatMigrated, InvalidToken)):
+        return None
+    if isinstance(error, NetworkError):  # TimedOut included
+        return min(max_delay, base_delay * 2 ** attempt)
+    return None
+
+
+class DeliveryClient:
+    """Sends messages through the rate limiters and decides what to do with every failure."""
+
+    def __init__(self, bot, global_rate=TELEGRAM_GLOBAL_RATE, chat_limiter=None, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, metrics=None):
+        self.bot = bot
+        self.rate_limiter = AdaptiveRateLimiter(global_rate)
+        self.chat_limiter = chat_limiter or ChatRateLimiter()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = DeliveryStats()
+        self.metrics = metrics or Metrics('delivery')
+
+    async def attempt(self, chat_id, text, attempt=0, **kwargs):
+        """Tries to send once; `attempt` counts the earlier tries of the same message. Returns an Attempt."""
+        await self.chat_limiter.acquire(chat_id)
+        await self.rate_limiter.acquire()
+        started = time.perf_counter()
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except Exception as e:
+            self.metrics.observe('send', time.perf_counter() - started)
+            if isinstance(e, RetryAfter):
+                self.stats.flood_waits += 1
+                self.metrics.increment('floodWaits')
+                self.rate_limiter.on_flood(e.retry_after)
+
+            delay = retry_delay(e, attempt, self.base_delay, self.max_delay)
+            if delay is not None and attempt + 1 < self.max_attempts:
+                self.stats.retried += 1
+                self.metrics.increment('retried')
+                logger.warning(f"Retrying message to {chat_id} in {delay:.1f}s: {e}")
+                return Attempt(RETRY, delay, e)
+
+            self.stats.dropped += 1
+            self.metrics.increment('dropped')
+            logger.error(f"Failed to send message to {chat_id}: {e}")
+            return Attempt(DROPPED, None, e)
+
+        self.metrics.observe('send', time.perf_counter() - started)
+        self.rate_limiter.on_success()
+        self.stats.sent += 1
+        self.metrics.increment('sent')
+        return Attempt(SENT, None, None)
+
+    async def send(self, chat_id, text, **kwargs):
+        """Sends one message, waiting out the retries inline. Raises the last error if it is dropped."""
+        for attempt in range(self.max_attempts):
+            result = await self.attempt(chat_id, text, attempt, **kwargs)
+            if result.outcome == SENT:
+                return
+            if result.outcome == DROPPED:
+                raise result.error
+            await asyncio.sleep(result.delay)
@@ -0,0 +1,209 @@
+#
+# Journal of delivered daily articles, so an interrupted broadcast can be resumed.
+#
+# A delivery is keyed by (date, chat_id, prefix). A rerun for the same date loads the
+# deliveries once and skips them, so nobody gets the article twice. Chats that cannot be
+# reached (bot blocked, chat deleted) are marked blocked and skipped by every later run,
+# until the chat talks to the bot again and the bot clears the mark.
+#
+# Deliveries are buffered and written in batches; at most one unflushed batch can be
+# re-sent if the process dies between two flushes.
+#
+
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+import time
+
+from aws_retry import with_retries
+from dynamodb_scan import read_pages
+from metrics import Metrics
+
+DELIVERY_JOURNAL_KEY = 'DELIVERY_JOURNAL'
+JOURNAL_TABLE_NAME = 'DeliveryJournal'
+DATE_KEY = 'Date'
+DELIVERY_KEY = 'Delivery'
+BLOCKED_PARTITION = 'blocked'
+EXPIRES_AT_KEY = 'ExpiresAt'
+
+BATCH_SIZE = 25  # DynamoDB BatchWriteItem limit
+DELIVERY_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+class DeliveryJournal:
+    """Buffers records in memory and hands them to `_write` in batches."""
+
+    def __init__(self, batch_size=BATCH_SIZE, metrics=None):
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics('journal')
+        self._deliveries = []
+        self._blocked = []
+
+    async def load_delivered(self, date):
+        """Set of (chat_id, prefix) already delivered on `date` (a 'YYYY-MM-DD' string)."""
+        raise NotImplementedError
+
+    async def load_blocked(self):
+        """Set of chat ids that must not be messaged any more."""
+        raise NotImplementedError
+
+    def _write(self, deliveries, blocked):
+        raise NotImplementedError
+
+    def _delete_blocked(self, chat_id):
+        raise NotImplementedError
+
+    async def _flush_in_executor(self):
+        deliveries, self._deliveries = self._deliveries, []
+        blocked, self._blocked = self._blocked, []
+        if deliveries or blocked:
+            # The journal is the broadcast's only database write, timed as the `dynamodb` stage.
+            # Writes are puts of whole items, so a throttled batch is simply written again.
+            with self.metrics.timer('dynamodb'):
+                await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(with_retries(self._write), deliveries, blocked))
+            self.metrics.increment('journalWrites', len(deliveries) + len(blocked))
+
+    async def record_delivered(self, date, chat_id, prefix):
+        self._deliveries.append((date, str(chat_id), prefix))
+        if len(self._deliveries) >= self.batch_size:
+            await self._flush_in_executor()
+
+    async def record_blocked(self, chat_id, reason):
+        self._blocked.append((str(chat_id), reason))
+        if len(self._blocked) >= self.batch_size:
+            await self._flush_in_executor()
+
+    async def clear_blocked(self, chat_id):
+        """Lets the broadcast message the chat again, e.g. after it unblocked the bot and sent /start."""
+        chat_id = str(chat_id)
+        self._blocked = [entry for entry in self._blocked if entry[0] != chat_id]
+        await asyncio.get_running_loop().run_in_executor(None, self._delete_blocked, chat_id)
+
+    async def flush(self):
+        await self._flush_in_executor()
+
+
+def delivery_id(chat_id, prefix):
+    return f"{chat_id}#{prefix}"
+
+
+class DynamoDeliveryJournal(DeliveryJournal):
+    """
+    `DeliveryJournal` table: partition key Date (S), sort key Delivery (S, `<chat_id>#<prefix>`).
+    Blocked chats live in the `blocked` partition. Daily items expire through the ExpiresAt TTL.
+    """
+
+    def __init__(self, table, batch_size=BATCH_SIZE, metrics=None):
+        super().__init__(batch_size, metrics)
+        self.table = table
+
+    async def _query_partition(self, partition):
+        request = {
+            'KeyConditionExpression': f'{DATE_KEY} = :date',
+            'ExpressionAttributeValues': {':date': partition},
+            'ProjectionExpression': DELIVERY_KEY,
+        }
+        async for item in read_pages(self.table.query, [request]):
+            yield item[DELIVERY_KEY]
+
+    async def load_delivered(self, date):
+        delivered = set()
+        async for delivery in self._query_partition(date):
+            chat_id, prefix = delivery.split('#', 1)
+            delivered.add((chat_id, prefix))
+        return delivered
+
+    async def load_blocked(self):
+        return {chat_id async for chat_id in self._query_partition(BLOCKED_PARTITION)}
+
+    def _write(self, deliveries, blocked):
+        now = int(time.time())
+        with self.table.batch_writer(overwrite_by_pkeys=[DATE_KEY, DELIVERY_KEY]) as writer:
+            for date, chat_id, prefix in deliveries:
+                writer.put_item(Item={
+                    DATE_KEY: date,
+                    DELIVERY_KEY: delivery_id(chat_id, prefix),
+                    'DeliveredAt': now,
+                    EXPIRES_AT_KEY: now + DELIVERY_RETENTION_SECONDS,
+                })
+            for chat_id, reason in blocked:
+                writer.put_item(Item={
+                    DATE_KEY: BLOCKED_PARTITION,
+                    DELIVERY_KEY: chat_id,
+                    'Reason': reason,
+                    'BlockedAt': now,
+                })
+
+    def _delete_blocked(self, chat_id):
+        self.table.delete_item(Key={DATE_KEY: BLOCKED_PARTITION, DELIVERY_KEY: chat_id})
+
+
+class SQLiteDeliveryJournal(DeliveryJournal):
+    """Local journal for tests and self-hosting."""
+
+    def __init__(self, path, batch_size=BATCH_SIZE, metrics=None):
+        super().__init__(batch_size, metrics)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                "date TEXT NOT NULL, chat_id TEXT NOT NULL, prefix TEXT NOT NULL, delivered_at INTEGER NOT NULL, "
+                "PRIMARY KEY (date, chat_id, prefix))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS blocked_chats ("
+                "chat_id TEXT PRIMARY KEY, reason TEXT NOT NULL, blocked_at INTEGER NOT NULL)"
+            )
+
+    def _select(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    async def load_delivered(self, date):
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, self._select, "SELECT chat_id, prefix FROM deliveries WHERE date = ?", (date,))
+        return set(rows)
+
+    async def load_blocked(self):
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, self._select, "SELECT chat_id FROM blocked_chats")
+        return {chat_id for (chat_id,) in rows}
+
+    def _write(self, deliveries, blocked):
+        now = int(time.time())
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO deliveries (date, chat_id, prefix, delivered_at) VALUES (?, ?, ?, ?)",
+                [(date, chat_id, prefix, now) for date, chat_id, prefix in deliveries]
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO blocked_chats (chat_id, reason, blocked_at) VALUES (?, ?, ?)",
+                [(chat_id, reason, now) for chat_id, reason in blocked]
+            )
+
+    def _delete_blocked(self, chat_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM blocked_chats WHERE chat_id = ?", (chat_id,))
+
+    def close(self):
+        self._connection.close()
+
+
+def create_delivery_journal(table=None, metrics=None):
+    """
+    Builds the journal configured by the DELIVERY_JOURNAL env variable:
+    `sqlite:///path/to/journal.db` for the SQLite backend, the DynamoDB `DeliveryJournal` table otherwise.
+    """
+    location = os.getenv(DELIVERY_JOURNAL_KEY, '')
+    if location.startswith('sqlite:///'):
+        return SQLiteDeliveryJournal(location[len('sqlite:///'):], metrics=metrics)
+
+    if table is None:
+        import boto3
+        table = boto3.resource('dynamodb').Table(JOURNAL_TABLE_NAME)
+    return DynamoDeliveryJournal(table, metrics=metrics)
@@ -0,0 +1,193 @@
+#
+# Per-chat delivery times of the daily articles.
+#
+# A chat can pick a local time and time zone with the bot's /time command. Chats without one get the
+# default time plus an offset inside DEFAULT_SPREAD_SECONDS taken from a hash of the chat id, so they
+# arrive spread over that window instead of in one burst.
+#
+# Pending deliveries sit in a hashed timing wheel with one slot per TICK_SECONDS over a day; an entry
+# goes into the slot of its due tick. advance(now) visits only the slots passed since the previous call,
+# so a tick costs the size of its bucket, not the number of chats.
+#
+
+import zlib
+from collections import namedtuple
+from datetime import datetime, time as day_time, timedelta
+from operator import itemgetter
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+TICK_SECONDS = 60
+WHEEL_SLOTS = 24 * 60
+DEFAULT_DELIVERY_TIME = '07:00'  # the lambda's cron(0 4 * * ? *) in Kyiv summer time
+DEFAULT_TIMEZONE = 'Europe/Kyiv'
+DEFAULT_SPREAD_SECONDS = 3600
+
+# `day` is the chat's local date, the day of the article and of its journal entry
+Delivery = namedtuple('Delivery', 'chat_id prefix day at')
+
+
+def parse_delivery_time(value):
+    """Normalizes `8:30`/`08:30` to `08:30`; raises ValueError for anything else."""
+    hour, minute = (int(part) for part in value.strip().split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Not a time of day: {value}")
+    return f'{hour:02d}:{minute:02d}'
+
+
+def parse_timezone(name):
+    """Returns the canonical IANA name, e.g. `Europe/Kyiv`; raises ValueError for unknown zones."""
+    try:
+        return ZoneInfo(name.strip()).key
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def local_instant(day, delivery_time, timezone):
+    """POSIX timestamp of `HH:MM` on `day` in `timezone`."""
+    hour, minute = (int(part) for part in delivery_time.split(':'))
+    return datetime.combine(day, day_time(hour, minute), tzinfo=ZoneInfo(timezone)).timestamp()
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel: `slots` buckets of `tick` seconds. Entries further away than one turn share
+    a slot with nearer ones and stay there until their own tick comes round.
+    """
+
+    def __init__(self, tick=TICK_SECONDS, slots=WHEEL_SLOTS, now=0.0):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._current = int(now // tick)  # the last tick already released
+        self._overdue = []
+        self._size = 0
+
+    def schedule(self, item, at):
+        """Adds `item` due at timestamp `at`; anything already due goes out with the next advance()."""
+        due = int(at // self.tick)
+        if due <= self._current:
+            self._overdue.append((due, item))
+        else:
+            self._slots[due % len(self._slots)].append((due, item))
+        self._size += 1
+
+    def advance(self, now):
+        """Releases the items whose tick is at or before `now`, in due order."""
+        target = int(now // self.tick)
+        released, self._overdue = self._overdue, []
+        # After a pause longer than one turn every slot is visited once
+        last = min(target, self._current + len(self._slots))
+        for tick in range(self._current + 1, last + 1):
+            index = tick % len(self._slots)
+            slot = self._slots[index]
+            if slot:
+                self._slots[index] = [entry for entry in slot if entry[0] > target]
+                released.extend(entry for entry in slot if entry[0] <= target)
+        self._current = max(self._current, target)
+        self._size -= len(released)
+        released.sort(key=itemgetter(0))
+        return [item for _, item in released]
+
+    def next_tick_at(self):
+        """Timestamp at which advance() can release the next bucket."""
+        return (self._current + 1) * self.tick
+
+    def __len__(self):
+        return self._size
+
+
+class DeliveryScheduler:
+    """
+    Keeps the next delivery of every (chat, prefix) in a TimingWheel. plan() adds or updates chats,
+    release_due() takes the due bucket out and schedules the same chats again for their next day.
+
+    `clock` returns a POSIX timestamp, so tests can drive the scheduler with a fake clock.
+    """
+
+    def __init__(self, clock, tick=TICK_SECONDS, default_time=DEFAULT_DELIVERY_TIME,
+                 default_timezone=DEFAULT_TIMEZONE, spread=DEFAULT_SPREAD_SECONDS):
+        self._clock = clock
+        self.wheel = TimingWheel(tick, now=clock())
+        self.default_time = default_time
+        self.default_timezone = default_timezone
+        self.spread = spread
+        # (chat_id, prefix) -> (due timestamp, preference); wheel entries that no longer match are stale
+        self._pending = {}
+
+    def _preference(self, chat_id, preference):
+        if preference:
+            return preference[0], preference[1], 0
+        return self.default_time, self.default_timezone, zlib.crc32(str(chat_id).encode()) % max(self.spread, 1)
+
+    def next_delivery(self, chat_id, preference=None, after=None, catch_up=False):
+        """
+        (local day, timestamp) of the chat's first delivery after `after` (now by default). With `catch_up`
+        the delivery of `after`'s local day is returned even when its time has passed, e.g. when the process
+        started late. A run that has to catch up across midnight passes an earlier `after` instead.
+        """
+        delivery_time, timezone, offset = self._preference(chat_id, preference)
+        after = self._clock() if after is None else after
+        day = datetime.fromtimestamp(after, ZoneInfo(timezone)).date()
+        if catch_up:
+            return day, local_instant(day, delivery_time, timezone) + offset
+        # Start a day early: pushed by its spread offset, the previous day's delivery can still be ahead
+        day -= timedelta(days=1)
+        at = local_instant(day, delivery_time, timezone) + offset
+        while at <= after:
+            day += timedelta(days=1)
+            at = local_instant(day, delivery_time, timezone) + offset
+        return day, at
+
+    def default_due_between(self, since, until):
+        """Whether a chat without its own time can fall due in (since, until]: the default window overlaps it."""
+        day = datetime.fromtimestamp(since, ZoneInfo(self.default_timezone)).date() - timedelta(days=1)
+        while True:
+            start = local_instant(day, self.default_time, self.default_timezone)
+            if start > until:
+                return False
+            if start + self.spread > since:
+                return True
+            day += timedelta(days=1)
+
+    def plan(self, chat_id, prefix, preference=None, catch_up=False, after=None):
+        """
+        Schedules the chat unless it is already pending with the same `(HH:MM, zone)` preference.
+        `catch_up` and `after` are passed on to next_delivery().
+        """
+        key = (str(chat_id), prefix)
+        preference = tuple(preference) if preference else None
+        pending = self._pending.get(key)
+        if pending and pending[1] == preference:
+            return
+        day, at = self.next_delivery(chat_id, preference, after, catch_up)
+        self._pending[key] = (at, preference)
+        self.wheel.schedule(Delivery(key[0], prefix, day, at), at)
+
+    def keep_only(self, keys):
+        """Forgets the pending deliveries of (chat_id, prefix) pairs that are not in `keys` any more."""
+        for key in set(self._pending) - set(keys):
+            del self._pending[key]
+
+    def release_due(self):
+        """Returns the due deliveries and schedules each of those chats for its next day."""
+        due = []
+        for delivery in self.wheel.advance(self._clock()):
+            key = (delivery.chat_id, delivery.prefix)
+            pending = self._pending.get(key)
+            if pending is None or pending[0] != delivery.at:
+                continue  # unsubscribed or rescheduled since
+            due.append(delivery)
+            day, at = self.next_delivery(delivery.chat_id, pending[1], after=delivery.at)
+            self._pending[key] = (at, pending[1])
+            self.wheel.schedule(Delivery(delivery.chat_id, delivery.prefix, day, at), at)
+        return due
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def group_by_day(deliveries):
+    """{local day: [(chat_id, prefix), ...]} of a released bucket."""
+    groups = {}
+    for delivery in deliveries:
+        groups.setdefault(delivery.day, []).append((delivery.chat_id, delivery.prefix))
+    return groups
@@ -0,0 +1,69 @@
+import asyncio
+import functools
+
+from aws_retry import with_retries
+
+_REQUEST_DONE = object()
+
+
+async def read_pages(operation, requests):
+    """
+    Async generator over the items returned by a paginated DynamoDB operation (`table.scan` or
+    `table.query`) for each of the given request kwargs.
+
+    Every request follows `LastEvaluatedKey` in its own executor thread, all of them in parallel,
+    and items are yielded as soon as a page arrives. A throttled page is requested again.
+    """
+    operation = with_retries(operation)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=len(requests) * 2)
+
+    async def read_request(kwargs):
+        kwargs = dict(kwargs)
+        try:
+            while True:
+                response = await loop.run_in_executor(None, functools.partial(operation, **kwargs))
+                await queue.put(response.get('Items', []))
+                last_key = response.get('LastEvaluatedKey')
+                if not last_key:
+                    break
+                kwargs['ExclusiveStartKey'] = last_key
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_REQUEST_DONE)
+
+    tasks = [asyncio.create_task(read_request(kwargs)) for kwargs in requests]
+    running = len(tasks)
+    try:
+        while running:
+            page = await queue.get()
+            if page is _REQUEST_DONE:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                for item in page:
+                    yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def scan_items(table, total_segments=1, **scan_kwargs):
+    """
+    Async generator over every item of a DynamoDB table.
+
+    Follows `LastEvaluatedKey` until the table is exhausted, so nothing is lost above the 1 MB page
+    limit. With `total_segments > 1` the table is read as a parallel scan (`Segment`/`TotalSegments`).
+    Items are yielded page by page, so the caller can start working while the rest of the table is
+    still being read.
+    """
+    if total_segments > 1:
+        requests = [dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+                    for segment in range(total_segments)]
+    else:
+        requests = [scan_kwargs]
+
+    async for item in read_pages(table.scan, requests):
+        yield item
@@ -0,0 +1,43 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = 600
+MAX_ENTRIES = 10000
+
+
+class RecentIds:
+    """
+    Short-lived memory of ids that were already accepted, e.g. Telegram `update_id`s.
+
+    Telegram re-delivers an update when the webhook answers too slowly, so the same id may
+    arrive again while the first delivery is still running or shortly after it finished.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._seen = OrderedDict()
+
+    def _expire(self, now):
+        while self._seen:
+            oldest_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def add(self, item_id):
+        """Remembers the id; returns False if it was already seen within the TTL."""
+        now = self._clock()
+        self._expire(now)
+        if item_id in self._seen:
+            return False
+        self._seen[item_id] = now
+        return True
+
+    def discard(self, item_id):
+        """Forgets the id, so a retry of a failed item is processed again."""
+        self._seen.pop(item_id, None)
+
+    def __len__(self):
+        return len(self._seen)
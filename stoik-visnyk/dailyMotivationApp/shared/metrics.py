@@ -0,0 +1,191 @@
+#
+# Per-invocation metrics of both lambdas, written as one CloudWatch embedded metric format (EMF) record.
+#
+# Stages (scan, fetch, render, send, dynamodb, search) are timed into fixed-bucket latency histograms and
+# events are counted; emit() prints a single JSON line at the end of the invocation, which CloudWatch
+# turns into metrics without a log line per message. The EMF metrics are the counters and the
+# p50/p95/p99/total of every stage; the bucket counts ride along as a plain property for Logs Insights.
+#
+# The log level comes from LOG_LEVEL (INFO by default). Request payloads are logged through
+# log_payload(), which only logs a LOG_SAMPLE_RATE share of them unless DEBUG is on.
+#
+
+import bisect
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_LEVEL_KEY = 'LOG_LEVEL'
+LOG_SAMPLE_RATE_KEY = 'LOG_SAMPLE_RATE'
+DEFAULT_LOG_LEVEL = 'INFO'
+DEFAULT_LOG_SAMPLE_RATE = 0.01
+
+METRICS_NAMESPACE = 'DailyMotivation'
+
+# Upper bounds of the histogram buckets in milliseconds; the last bucket is open-ended
+BUCKET_BOUNDS_MILLIS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+PERCENTILES = (('P50', 0.50), ('P95', 0.95), ('P99', 0.99))
+
+logger = logging.getLogger()
+
+
+def configure_logging(level=None):
+    """Sets the root logger to `level`, LOG_LEVEL or INFO, in that order."""
+    level = level or os.getenv(LOG_LEVEL_KEY, DEFAULT_LOG_LEVEL)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    # httpx logs every request at INFO, that is a line per sent message
+    if not logger.isEnabledFor(logging.DEBUG):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+def log_payload(label, payload, sample_rate=None):
+    """Logs a request payload always at DEBUG, otherwise for a LOG_SAMPLE_RATE share of the calls."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{label}: {payload}")
+        return
+    if sample_rate is None:
+        sample_rate = float(os.getenv(LOG_SAMPLE_RATE_KEY, DEFAULT_LOG_SAMPLE_RATE))
+    if sample_rate > 0 and random.random() < sample_rate:
+        logger.info(f"{label} (sampled): {payload}")
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, so its size does not grow with the number of observations."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS_MILLIS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, millis):
+        self.counts[bisect.bisect_left(self.bounds, millis)] += 1
+        self.count += 1
+        self.total += millis
+        self.max = max(self.max, millis)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the percentile, capped by the largest observation."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self):
+        """Non-empty buckets as {upper bound: count}, `inf` for the open-ended one."""
+        return {
+            str(self.bounds[index]) if index < len(self.bounds) else 'inf': count
+            for index, count in enumerate(self.counts) if count
+        }
+
+
+class Metrics:
+    """
+    Counters and stage histograms of one lambda, collected until emit(). Safe to use from the
+    executor threads the storage calls run in.
+    """
+
+    def __init__(self, service, namespace=METRICS_NAMESPACE, clock=time.perf_counter, stream=None):
+        self.service = service
+        self.namespace = namespace
+        self._clock = clock
+        self._stream = stream
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the block into the `stage` histogram, also when it raises."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.observe(stage, self._clock() - started)
+
+    async def timed_iter(self, stage, iterable):
+        """
+        Async generator passing `iterable` through and recording the total time spent waiting
+        for its items as one `stage` observation.
+        """
+        waited = 0.0
+        iterator = iterable.__aiter__()
+        try:
+            while True:
+                started = self._clock()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    waited += self._clock() - started
+                yield item
+        finally:
+            self.observe(stage, waited)
+
+    def record(self, dimensions=None):
+        """The EMF document of everything collected so far."""
+        dimensions = dict({'Service': self.service}, **(dimensions or {}))
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {stage: histogram for stage, histogram in self.histograms.items() if histogram.count}
+
+        definitions = [{'Name': name, 'Unit': 'Count'} for name in counters]
+        document = dict(dimensions, **counters)
+        latencies = {}
+        for stage, histogram in histograms.items():
+            values = {f'{stage}{suffix}Millis': round(histogram.percentile(fraction), 3)
+                      for suffix, fraction in PERCENTILES}
+            values[f'{stage}TotalMillis'] = round(histogram.total, 3)
+            definitions.extend({'Name': name, 'Unit': 'Milliseconds'} for name in values)
+            document.update(values)
+            latencies[stage] = {'count': histogram.count, 'maxMillis': round(histogram.max, 3),
+                                'buckets': histogram.buckets()}
+
+        document['Latencies'] = latencies
+        document['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': self.namespace,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': definitions,
+            }],
+        }
+        return document
+
+    def emit(self, dimensions=None):
+        """Writes the record as one line to stdout, where CloudWatch picks it up, and starts over."""
+        document = self.record(dimensions)
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps(document, separators=(',', ':'), ensure_ascii=False) + '\n')
+        stream.flush()
+        self.reset()
+        return document
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+# Telegram Bot API limits (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this)
+TELEGRAM_GLOBAL_RATE = 30        # messages per second across all chats
+TELEGRAM_PRIVATE_CHAT_RATE = 1   # messages per second to a single private chat
+TELEGRAM_GROUP_CHAT_RATE = 20 / 60  # messages per second to a single group
+# Chats ChatRateLimiter tracks before it forgets the ones whose next slot has passed
+CHAT_SLOTS_PRUNE_AT = 10000
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = None
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def set_rate(self, rate):
+        """Change the refill rate on the fly, keeping the tokens collected so far."""
+        self._refill()
+        self.rate = float(rate)
+
+    async def acquire(self, tokens=1):
+        # The lock keeps waiters in FIFO order, so one slow chat cannot starve the others
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """
+    Spaces out messages to the same chat according to Telegram's per-chat limits. A chat whose next
+    slot has passed can send right away, so it is forgotten once the table grows, which keeps a
+    long-running bot from holding one entry per chat it ever messaged.
+    """
+
+    def __init__(self, private_rate=TELEGRAM_PRIVATE_CHAT_RATE, group_rate=TELEGRAM_GROUP_CHAT_RATE,
+                 clock=time.monotonic, prune_at=CHAT_SLOTS_PRUNE_AT):
+        self.private_interval = 1 / private_rate
+        self.group_interval = 1 / group_rate
+        self._clock = clock
+        self._next_slot = {}
+        self._min_prune_at = self._prune_at = prune_at
+
+    def _interval(self, chat_id):
+        # Group and channel ids are negative, private chats are positive
+        return self.group_interval if int(chat_id) < 0 else self.private_interval
+
+    def _prune(self, now):
+        self._next_slot = {chat_id: slot for chat_id, slot in self._next_slot.items() if slot > now}
+        # Scanning again only after the table has doubled keeps acquire() O(1) amortized
+        self._prune_at = max(self._min_prune_at, 2 * len(self._next_slot))
+
+    async def acquire(self, chat_id):
+        now = self._clock()
+        if len(self._next_slot) >= self._prune_at:
+            self._prune(now)
+        slot = max(now, self._next_slot.get(chat_id, now))
+        self._next_slot[chat_id] = slot + self._interval(chat_id)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AdaptiveRateLimiter:
+    """
+    Global limiter that backs off on flood control (AIMD): a 429 halves the rate and pauses every
+    sender for the requested time, then each `recovery_interval` without another 429 adds `step`
+    messages per second back, up to `max_rate`.
+    """
+
+    def __init__(self, max_rate=TELEGRAM_GLOBAL_RATE, min_rate=1, step=1, recovery_interval=1.0,
+                 clock=time.monotonic):
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min(min_rate, max_rate))
+        self.step = step
+        self.recovery_interval = recovery_interval
+        self.bucket = TokenBucket(max_rate, clock=clock)
+        self.paused_until = 0.0
+        self._clock = clock
+        self._changed_at = clock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def on_flood(self, retry_after):
+        now = self._clock()
+        # The other in-flight sends get the same 429, only the first one of a pause slows us down
+        if now >= self.paused_until:
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self._changed_at = self.paused_until
+
+    def on_success(self):
+        now = self._clock()
+        if self.bucket.rate < self.max_rate and now - self._changed_at >= self.recovery_interval:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.step))
+            self._changed_at = now
+
+    async def acquire(self):
+        pause = self.paused_until - self._clock()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.bucket.acquire()
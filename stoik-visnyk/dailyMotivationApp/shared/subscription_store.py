@@ -0,0 +1,407 @@
+#
+# Where chat subscriptions live.
+#
+# Every topic keeps a sparse index of its active subscribers, so a broadcast reads
+# only the chats that should receive it instead of scanning all users:
+#   - DynamoDB: the `<Topic>Shard` attribute exists only while a chat is subscribed and is the
+#     hash key of the `<Topic>Subscribers` GSI (range key ChatId). Items without it never reach the index.
+#   - SQLite: partial indexes `WHERE is_subscribed_to_<topic> = 1`.
+#
+# Chats that picked their own delivery time (the bot's /time command) are indexed the same way:
+# `ScheduleShard` is the hash key of the `ScheduledChats` GSI, which also projects DeliveryTime and TimeZone.
+#
+# Use migrate_subscription_index.py to create the GSIs and backfill the shard attributes.
+#
+
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+import zlib
+
+from articles import S3_PREFIX_STOIC, S3_PREFIX_PARENT
+from dynamodb_scan import read_pages
+
+TOPIC_STOIC = 'stoic'
+TOPIC_PARENT = 'parent'
+TOPICS = (TOPIC_STOIC, TOPIC_PARENT)
+TOPIC_PREFIXES = {TOPIC_STOIC: S3_PREFIX_STOIC, TOPIC_PARENT: S3_PREFIX_PARENT}
+
+SUBSCRIPTION_STORE_KEY = 'SUBSCRIPTION_STORE'
+TABLE_NAME = 'UserPreferences'
+CHAT_ID_KEY = 'ChatId'
+CHAT_NAME_KEY = 'ChatName'
+IS_SUBSCRIBED_TO_KEY = 'IsSubscribedTo'
+DELIVERY_TIME_KEY = 'DeliveryTime'
+TIME_ZONE_KEY = 'TimeZone'
+SCHEDULE_SHARD_KEY = 'ScheduleShard'
+SCHEDULE_INDEX_NAME = 'ScheduledChats'
+
+# Index partitions per topic, queried in parallel during a broadcast
+INDEX_SHARDS = 8
+PAGE_SIZE = 500
+
+
+def subscribed_attribute(topic):
+    """`IsSubscribedToStoic` for `stoic`, the attribute the bot has always used."""
+    return f'{IS_SUBSCRIBED_TO_KEY}{topic.capitalize()}'
+
+
+def shard_attribute(topic):
+    return f'{topic.capitalize()}Shard'
+
+
+def index_name(topic):
+    return f'{topic.capitalize()}Subscribers'
+
+
+def chat_shard(chat_id, shards=INDEX_SHARDS):
+    return zlib.crc32(str(chat_id).encode()) % shards
+
+
+class SubscriptionStore:
+    """Interface shared by the DynamoDB and SQLite backends."""
+
+    def get_subscription(self, chat_id, topic):
+        raise NotImplementedError
+
+    def set_subscription(self, chat_id, topic, subscribed, chat_name=''):
+        raise NotImplementedError
+
+    def unsubscribe_all(self, chat_id):
+        """Drops the chat from every topic, returns False if the chat is not known."""
+        raise NotImplementedError
+
+    def subscribed_topics(self, chat_id):
+        """Topics the chat is subscribed to."""
+        return [topic for topic in TOPICS if self.get_subscription(chat_id, topic)]
+
+    def toggle_subscription(self, chat_id, topic, chat_name=''):
+        """Flips the subscription to `topic` and returns the new status."""
+        new_status = not self.get_subscription(chat_id, topic)
+        self.set_subscription(chat_id, topic, new_status, chat_name)
+        return new_status
+
+    def get_delivery_time(self, chat_id):
+        """The chat's (`HH:MM`, time zone name), or None when it gets the default delivery time."""
+        raise NotImplementedError
+
+    def set_delivery_time(self, chat_id, delivery_time, timezone):
+        """Stores the chat's local delivery time; `delivery_time=None` goes back to the default."""
+        raise NotImplementedError
+
+    async def iter_delivery_times(self, shards=None):
+        """Async generator over (chat_id, `HH:MM`, time zone name) of the chats that picked a time."""
+        raise NotImplementedError
+        yield
+
+    async def iter_subscribers(self, topic, shards=None):
+        """
+        Async generator over chat ids subscribed to `topic`. `shards` limits it to the chats whose
+        chat_shard() is in the list, which is how a broadcast is split between workers.
+        """
+        raise NotImplementedError
+        yield
+
+    # Async variants for bot handlers: the blocking call runs in the loop's executor,
+    # so concurrent updates do not wait for each other's database round-trips
+
+    async def _in_executor(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(method, *args))
+
+    async def toggle_subscription_async(self, chat_id, topic, chat_name=''):
+        return await self._in_executor(self.toggle_subscription, chat_id, topic, chat_name)
+
+    async def subscribed_topics_async(self, chat_id):
+        return await self._in_executor(self.subscribed_topics, chat_id)
+
+    async def unsubscribe_all_async(self, chat_id):
+        return await self._in_executor(self.unsubscribe_all, chat_id)
+
+    async def get_delivery_time_async(self, chat_id):
+        return await self._in_executor(self.get_delivery_time, chat_id)
+
+    async def set_delivery_time_async(self, chat_id, delivery_time, timezone):
+        return await self._in_executor(self.set_delivery_time, chat_id, delivery_time, timezone)
+
+
+class DynamoSubscriptionStore(SubscriptionStore):
+
+    def __init__(self, table, shards=INDEX_SHARDS):
+        self.table = table
+        self.shards = shards
+
+    def get_subscription(self, chat_id, topic):
+        attr_name = subscribed_attribute(topic)
+        response = self.table.get_item(Key={CHAT_ID_KEY: str(chat_id)}, ProjectionExpression=attr_name)
+        return bool(response.get('Item', {}).get(attr_name, False))
+
+    def set_subscription(self, chat_id, topic, subscribed, chat_name=''):
+        attr_name = subscribed_attribute(topic)
+        values = {':val': subscribed, ':chatName': chat_name or ''}
+        update_expression = f"SET {CHAT_NAME_KEY} = :chatName, {attr_name} = :val"
+        if subscribed:
+            update_expression += f", {shard_attribute(topic)} = :shard"
+            values[':shard'] = chat_shard(chat_id, self.shards)
+        else:
+            update_expression += f" REMOVE {shard_attribute(topic)}"
+
+        self.table.update_item(
+            Key={CHAT_ID_KEY: str(chat_id)},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+
+    def _conditional_set(self, chat_id, topic, subscribed, chat_name):
+        """Writes `subscribed` only if the chat currently has the opposite status, in one request."""
+        attr_name = subscribed_attribute(topic)
+        values = {':val': subscribed, ':chatName': chat_name or '', ':current': not subscribed}
+        update_expression = f"SET {CHAT_NAME_KEY} = :chatName, {attr_name} = :val"
+        if subscribed:
+            update_expression += f", {shard_attribute(topic)} = :shard"
+            values[':shard'] = chat_shard(chat_id, self.shards)
+            condition = f"attribute_not_exists({attr_name}) OR {attr_name} = :current"
+        else:
+            update_expression += f" REMOVE {shard_attribute(topic)}"
+            condition = f"{attr_name} = :current"
+
+        try:
+            self.table.update_item(
+                Key={CHAT_ID_KEY: str(chat_id)},
+                UpdateExpression=update_expression,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def toggle_subscription(self, chat_id, topic, chat_name=''):
+        """
+        Atomic toggle without a read: tries to subscribe on the condition that the chat is not
+        subscribed yet, and only if that condition fails unsubscribes on the condition that it is.
+        Subscribing, the common case, costs one round-trip, and concurrent toggles cannot lose updates.
+        """
+        for _ in range(3):
+            if self._conditional_set(chat_id, topic, True, chat_name):
+                return True
+            if self._conditional_set(chat_id, topic, False, chat_name):
+                return False
+        raise RuntimeError(f"Subscription of {chat_id} to {topic} keeps changing concurrently")
+
+    def unsubscribe_all(self, chat_id):
+        assignments = ', '.join(f'{subscribed_attribute(topic)} = :val' for topic in TOPICS)
+        removals = ', '.join(shard_attribute(topic) for topic in TOPICS)
+        # One conditional request: an unknown chat gets no item created for it
+        try:
+            self.table.update_item(
+                Key={CHAT_ID_KEY: str(chat_id)},
+                UpdateExpression=f'SET {assignments} REMOVE {removals}',
+                ConditionExpression=f'attribute_exists({CHAT_ID_KEY})',
+                ExpressionAttributeValues={':val': False}
+            )
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    async def iter_subscribers(self, topic, shards=None):
+        requests = [
+            {
+                'IndexName': index_name(topic),
+                'KeyConditionExpression': f'{shard_attribute(topic)} = :shard',
+                'ExpressionAttributeValues': {':shard': shard},
+                'ProjectionExpression': CHAT_ID_KEY,
+            }
+            for shard in (range(self.shards) if shards is None else shards)
+        ]
+        async for item in read_pages(self.table.query, requests):
+            yield item[CHAT_ID_KEY]
+
+    def subscribed_topics(self, chat_id):
+        # One read for all topics
+        response = self.table.get_item(Key={CHAT_ID_KEY: str(chat_id)},
+                                       ProjectionExpression=', '.join(subscribed_attribute(topic) for topic in TOPICS))
+        item = response.get('Item', {})
+        return [topic for topic in TOPICS if item.get(subscribed_attribute(topic))]
+
+    def get_delivery_time(self, chat_id):
+        response = self.table.get_item(Key={CHAT_ID_KEY: str(chat_id)},
+                                       ProjectionExpression=f'{DELIVERY_TIME_KEY}, {TIME_ZONE_KEY}')
+        item = response.get('Item', {})
+        if not item.get(DELIVERY_TIME_KEY):
+            return None
+        return item[DELIVERY_TIME_KEY], item[TIME_ZONE_KEY]
+
+    def set_delivery_time(self, chat_id, delivery_time, timezone):
+        if delivery_time is None:
+            self.table.update_item(
+                Key={CHAT_ID_KEY: str(chat_id)},
+                UpdateExpression=f'REMOVE {DELIVERY_TIME_KEY}, {TIME_ZONE_KEY}, {SCHEDULE_SHARD_KEY}'
+            )
+            return
+        self.table.update_item(
+            Key={CHAT_ID_KEY: str(chat_id)},
+            UpdateExpression=f'SET {DELIVERY_TIME_KEY} = :time, {TIME_ZONE_KEY} = :zone, {SCHEDULE_SHARD_KEY} = :shard',
+            ExpressionAttributeValues={':time': delivery_time, ':zone': timezone,
+                                       ':shard': chat_shard(chat_id, self.shards)}
+        )
+
+    async def iter_delivery_times(self, shards=None):
+        requests = [
+            {
+                'IndexName': SCHEDULE_INDEX_NAME,
+                'KeyConditionExpression': f'{SCHEDULE_SHARD_KEY} = :shard',
+                'ExpressionAttributeValues': {':shard': shard},
+                'ProjectionExpression': f'{CHAT_ID_KEY}, {DELIVERY_TIME_KEY}, {TIME_ZONE_KEY}',
+            }
+            for shard in (range(self.shards) if shards is None else shards)
+        ]
+        async for item in read_pages(self.table.query, requests):
+            yield item[CHAT_ID_KEY], item[DELIVERY_TIME_KEY], item[TIME_ZONE_KEY]
+
+
+class SQLiteSubscriptionStore(SubscriptionStore):
+    """Local backend for tests and self-hosting; safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._create_schema()
+
+    @staticmethod
+    def _column(topic):
+        if topic not in TOPICS:
+            raise ValueError(f"Unknown topic: {topic}")
+        return f'is_subscribed_to_{topic}'
+
+    def _create_schema(self):
+        columns = ', '.join(f'{self._column(topic)} INTEGER NOT NULL DEFAULT 0' for topic in TOPICS)
+        with self._lock:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS user_preferences ("
+                f"chat_id TEXT PRIMARY KEY, chat_name TEXT NOT NULL DEFAULT '', {columns})"
+            )
+            for topic in TOPICS:
+                column = self._column(topic)
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {topic}_subscribers "
+                    f"ON user_preferences (chat_id) WHERE {column} = 1"
+                )
+            # Databases created before delivery times existed get the columns added
+            existing = {row[1] for row in self._connection.execute("PRAGMA table_info(user_preferences)")}
+            for column in ('delivery_time', 'time_zone'):
+                if column not in existing:
+                    self._connection.execute(f"ALTER TABLE user_preferences ADD COLUMN {column} TEXT")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS scheduled_chats "
+                "ON user_preferences (chat_id) WHERE delivery_time IS NOT NULL"
+            )
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def get_subscription(self, chat_id, topic):
+        rows = self._execute(
+            f"SELECT {self._column(topic)} FROM user_preferences WHERE chat_id = ?", (str(chat_id),))
+        return bool(rows and rows[0][0])
+
+    def set_subscription(self, chat_id, topic, subscribed, chat_name=''):
+        column = self._column(topic)
+        self._execute(
+            f"INSERT INTO user_preferences (chat_id, chat_name, {column}) VALUES (?, ?, ?) "
+            f"ON CONFLICT (chat_id) DO UPDATE SET chat_name = excluded.chat_name, {column} = excluded.{column}",
+            (str(chat_id), chat_name or '', int(bool(subscribed)))
+        )
+
+    def toggle_subscription(self, chat_id, topic, chat_name=''):
+        """Flips the status inside one write transaction and returns the new value."""
+        column = self._column(topic)
+        with self._lock:
+            with self._connection:
+                self._connection.execute('BEGIN IMMEDIATE')
+                self._connection.execute(
+                    f"INSERT INTO user_preferences (chat_id, chat_name, {column}) VALUES (?, ?, 1) "
+                    f"ON CONFLICT (chat_id) DO UPDATE SET chat_name = excluded.chat_name, {column} = 1 - {column}",
+                    (str(chat_id), chat_name or '')
+                )
+                row = self._connection.execute(
+                    f"SELECT {column} FROM user_preferences WHERE chat_id = ?", (str(chat_id),)).fetchone()
+        return bool(row[0])
+
+    def unsubscribe_all(self, chat_id):
+        assignments = ', '.join(f'{self._column(topic)} = 0' for topic in TOPICS)
+        with self._lock:
+            cursor = self._connection.execute(
+                f"UPDATE user_preferences SET {assignments} WHERE chat_id = ?", (str(chat_id),))
+            return cursor.rowcount > 0
+
+    def _page(self, topic, after):
+        return self._execute(
+            f"SELECT chat_id FROM user_preferences INDEXED BY {topic}_subscribers "
+            f"WHERE {self._column(topic)} = 1 AND chat_id > ? ORDER BY chat_id LIMIT ?",
+            (after, PAGE_SIZE)
+        )
+
+    async def iter_subscribers(self, topic, shards=None):
+        loop = asyncio.get_running_loop()
+        wanted = None if shards is None else set(shards)
+        after = ''
+        while True:
+            rows = await loop.run_in_executor(None, self._page, topic, after)
+            for (chat_id,) in rows:
+                if wanted is None or chat_shard(chat_id) in wanted:
+                    yield chat_id
+            if len(rows) < PAGE_SIZE:
+                return
+            after = rows[-1][0]
+
+    def get_delivery_time(self, chat_id):
+        rows = self._execute(
+            "SELECT delivery_time, time_zone FROM user_preferences WHERE chat_id = ?", (str(chat_id),))
+        if not rows or rows[0][0] is None:
+            return None
+        return rows[0]
+
+    def set_delivery_time(self, chat_id, delivery_time, timezone):
+        self._execute(
+            "INSERT INTO user_preferences (chat_id, delivery_time, time_zone) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET delivery_time = excluded.delivery_time, time_zone = excluded.time_zone",
+            (str(chat_id), delivery_time, timezone if delivery_time is not None else None)
+        )
+
+    async def iter_delivery_times(self, shards=None):
+        rows = await asyncio.get_running_loop().run_in_executor(
+            None, self._execute,
+            "SELECT chat_id, delivery_time, time_zone FROM user_preferences INDEXED BY scheduled_chats "
+            "WHERE delivery_time IS NOT NULL"
+        )
+        wanted = None if shards is None else set(shards)
+        for chat_id, delivery_time, timezone in rows:
+            if wanted is None or chat_shard(chat_id) in wanted:
+                yield chat_id, delivery_time, timezone
+
+    def close(self):
+        self._connection.close()
+
+
+def create_subscription_store(table=None):
+    """
+    Builds the store configured by the SUBSCRIPTION_STORE env variable:
+    `sqlite:///path/to/db.sqlite` for the SQLite backend, DynamoDB `UserPreferences` otherwise.
+    """
+    location = os.getenv(SUBSCRIPTION_STORE_KEY, '')
+    if location.startswith('sqlite:///'):
+        return SQLiteSubscriptionStore(location[len('sqlite:///'):])
+
+    if table is None:
+        import boto3
+        table = boto3.resource('dynamodb').Table(TABLE_NAME)
+    return DynamoSubscriptionStore(table)
@@ -0,0 +1,148 @@
+#
+# The delivery scheduler and the lambda's scheduled mode, driven by a fake clock.
+#
+#   dailyMotivationApp$ python -m pytest tests
+#
+
+import asyncio
+import importlib
+import os
+import sys
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [os.path.join(APP_DIR, 'shared'), os.path.join(APP_DIR, 'daily_message')]
+
+from delivery_schedule import DeliveryScheduler, local_instant
+
+KYIV = 'Europe/Kyiv'
+DAY = date(2024, 3, 9)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def kyiv(day, delivery_time):
+    return local_instant(day, delivery_time, KYIV)
+
+
+def test_bucket_is_released_at_its_minute():
+    clock = FakeClock(kyiv(DAY, '08:00'))
+    scheduler = DeliveryScheduler(clock)
+    scheduler.plan(1, 'stoic/', ('08:30', KYIV))
+
+    clock.now = kyiv(DAY, '08:30') - 1
+    assert scheduler.release_due() == []
+
+    clock.now = kyiv(DAY, '08:30')
+    [delivery] = scheduler.release_due()
+    assert (delivery.chat_id, delivery.prefix, delivery.day) == ('1', 'stoic/', DAY)
+    # Planned again for the next day
+    assert scheduler.next_delivery(1, ('08:30', KYIV), after=clock.now) == (DAY + timedelta(days=1),
+                                                                             kyiv(DAY + timedelta(days=1), '08:30'))
+    assert len(scheduler) == 1
+
+
+def test_default_chats_are_spread_over_the_window():
+    clock = FakeClock(kyiv(DAY, '06:00'))
+    scheduler = DeliveryScheduler(clock)
+    for chat_id in range(1, 1001):
+        scheduler.plan(chat_id, 'stoic/')
+
+    per_minute = Counter()
+    while clock.now < kyiv(DAY, '08:00'):
+        clock.now += 60
+        for delivery in scheduler.release_due():
+            assert kyiv(DAY, '07:00') <= delivery.at < kyiv(DAY, '08:00')
+            per_minute[clock.now] += 1
+    assert sum(per_minute.values()) == 1000
+    assert max(per_minute.values()) < 50  # about 17 a minute, not one burst of 1000
+
+
+def test_next_delivery_just_before_midnight_is_caught_up_after_it():
+    clock = FakeClock(kyiv(DAY + timedelta(days=1), '00:02'))
+    scheduler = DeliveryScheduler(clock)
+    since = clock.now - 1800
+
+    day, at = scheduler.next_delivery(1, ('23:55', KYIV), after=since)
+    assert (day, at) == (DAY, kyiv(DAY, '23:55'))
+    assert at <= clock.now
+
+
+def test_default_window():
+    scheduler = DeliveryScheduler(FakeClock(kyiv(DAY, '00:00')))
+    assert scheduler.default_due_between(kyiv(DAY, '06:40'), kyiv(DAY, '07:10'))
+    assert scheduler.default_due_between(kyiv(DAY, '07:50'), kyiv(DAY, '08:20'))
+    assert not scheduler.default_due_between(kyiv(DAY, '08:00'), kyiv(DAY, '08:30'))
+    assert not scheduler.default_due_between(kyiv(DAY, '23:32'), kyiv(DAY + timedelta(days=1), '00:02'))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """app_daily_message on SQLite stores, with send_scheduled recording what it was asked to send."""
+    monkeypatch.setenv('TELEGRAM_TOKEN', '123:fake')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'eu-central-1')
+    monkeypatch.setenv('SUBSCRIPTION_STORE', f"sqlite:///{tmp_path / 'bot.db'}")
+    monkeypatch.setenv('DELIVERY_JOURNAL', f"sqlite:///{tmp_path / 'journal.db'}")
+    monkeypatch.setenv('ARTICLE_BUNDLE_PATH', str(tmp_path / 'no.bundle'))
+    module = importlib.import_module('app_daily_message')
+
+    from delivery_journal import create_delivery_journal
+    from subscription_store import create_subscription_store
+    monkeypatch.setattr(module, 'subscription_store', create_subscription_store())
+    monkeypatch.setattr(module, 'delivery_journal', create_delivery_journal())
+
+    sent = []
+
+    async def send_scheduled(deliveries, client=None, journal_cache=None, deadline=None):
+        sent.extend(deliveries)
+        return {}
+    monkeypatch.setattr(module, 'send_scheduled', send_scheduled)
+
+    scans = []
+    fetch_subscribed_users = module.fetch_subscribed_users
+
+    def counting_fetch(*args, **kwargs):
+        scans.append(1)
+        return fetch_subscribed_users(*args, **kwargs)
+    monkeypatch.setattr(module, 'fetch_subscribed_users', counting_fetch)
+
+    module.sent, module.scans = sent, scans
+    return module
+
+
+def test_scheduled_run_after_midnight_sends_the_delivery_just_before_it(app):
+    store = app.subscription_store
+    store.set_subscription(1, 'stoic', True)
+    store.set_delivery_time(1, '23:55', KYIV)
+    store.set_subscription(2, 'parent', True)  # default time
+    store.set_delivery_time(3, '23:55', KYIV)  # not subscribed to anything
+
+    asyncio.run(app.send_due(now=kyiv(DAY, '23:47')))
+    assert app.sent == []
+
+    asyncio.run(app.send_due(now=kyiv(DAY + timedelta(days=1), '00:02')))
+    assert [(d.chat_id, d.prefix, d.day) for d in app.sent] == [('1', app.TOPIC_PREFIXES['stoic'], DAY)]
+    # Outside the default window no run reads the subscriber indexes
+    assert app.scans == []
+
+
+def test_scheduled_run_reads_the_subscribers_only_in_the_default_window(app):
+    app.subscription_store.set_subscription(2, 'parent', True)
+    # The chat's own minute inside the default window
+    _, at = DeliveryScheduler(FakeClock(0)).next_delivery(2, after=kyiv(DAY, '06:00'))
+
+    asyncio.run(app.send_due(now=at - app.DEFAULT_SCHEDULE_LOOKBACK_SECONDS - 3600))
+    assert app.scans == [] and app.sent == []
+
+    asyncio.run(app.send_due(now=at))
+    assert len(app.scans) == 1
+    assert [(d.chat_id, d.prefix, d.day, d.at) for d in app.sent] == [('2', app.TOPIC_PREFIXES['parent'], DAY, at)]
@@ -0,0 +1,152 @@
+#
+# Publishes daily_articles/<topic>/*.txt to the bucket the lambdas read (`<topic>/<file>` keys), and the
+# welcome text the bot sends on /start (daily_articles/message_start.txt, at the root of the bucket).
+#
+# One listing per topic (and one for the welcome text) gives the remote ETags (the MD5 of the object for plain uploads), which are
+# compared with the MD5 of the local files; only new and changed articles are uploaded, in parallel
+# over one pooled client. A republish without changes costs one list request per topic.
+#
+#   python publish_articles.py --dry-run                  # only report what would change
+#   python publish_articles.py                            # upload to daily-motivation-messages
+#   python publish_articles.py --local-store /tmp/s3      # against a folder instead of S3
+#
+# Objects that exist only in the bucket are reported and left alone.
+#
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from build_article_bundle import ARTICLE_FILENAME
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BUCKET_NAME = 'daily-motivation-messages'
+CONTENT_TYPE = 'text/plain; charset=utf-8'
+DEFAULT_WORKERS = 16
+# Files at the root of daily_articles published under their own name, as the bot's S3_WELCOME_TEXT_FILE
+ROOT_FILES = ('message_start.txt',)
+
+
+def file_md5(path):
+    with open(path, 'rb') as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+def local_articles(articles_dir):
+    """{key: (path, md5)} for every article file of every topic folder and the ROOT_FILES."""
+    articles = {}
+    for filename in ROOT_FILES:
+        path = os.path.join(articles_dir, filename)
+        if os.path.isfile(path):
+            articles[filename] = (path, file_md5(path))
+    for topic in sorted(os.listdir(articles_dir)):
+        topic_dir = os.path.join(articles_dir, topic)
+        if not os.path.isdir(topic_dir):
+            continue
+        for filename in os.listdir(topic_dir):
+            if not ARTICLE_FILENAME.match(filename):
+                continue
+            path = os.path.join(topic_dir, filename)
+            articles[f"{topic}/{filename}"] = (path, file_md5(path))
+    return articles
+
+
+def remote_etags(s3_client, bucket, prefix):
+    """{key: etag without quotes} of every object under `prefix`, 1000 keys per request."""
+    etags = {}
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        for item in response.get('Contents', []):
+            etags[item['Key']] = item['ETag'].strip('"')
+        if not response.get('IsTruncated'):
+            return etags
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def plan(local, remote):
+    """Splits the keys into new, changed, unchanged and remote-only ones."""
+    new, changed, unchanged = [], [], []
+    for key, (_, md5) in sorted(local.items()):
+        if key not in remote:
+            new.append(key)
+        elif remote[key] != md5:
+            # Multipart uploads have `<md5>-<parts>` ETags, those are re-uploaded once as a single part
+            changed.append(key)
+        else:
+            unchanged.append(key)
+    remote_only = sorted(set(remote) - set(local))
+    return new, changed, unchanged, remote_only
+
+
+def upload(s3_client, bucket, key, path):
+    with open(path, 'rb') as file:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=file.read(), ContentType=CONTENT_TYPE)
+    return key
+
+
+def publish(s3_client, bucket, articles_dir, workers=DEFAULT_WORKERS, dry_run=False):
+    """Uploads what changed and returns the counts, the keys of every group are printed."""
+    started = time.perf_counter()
+    local = local_articles(articles_dir)
+    # A topic folder is listed by its prefix, a root file by its own key
+    prefixes = sorted({key.split('/', 1)[0] + '/' if '/' in key else key for key in local})
+
+    remote = {}
+    for prefix in prefixes:
+        remote.update(remote_etags(s3_client, bucket, prefix))
+    new, changed, unchanged, remote_only = plan(local, remote)
+
+    for label, keys in (('new', new), ('changed', changed), ('only in bucket', remote_only)):
+        for key in keys:
+            print(f"{label}: {key}")
+
+    to_upload = new + changed
+    if to_upload and not dry_run:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for key in pool.map(lambda key: upload(s3_client, bucket, key, local[key][0]), to_upload):
+                print(f"Uploaded: s3://{bucket}/{key}")
+
+    report = {
+        'new': len(new),
+        'changed': len(changed),
+        'unchanged': len(unchanged),
+        'remoteOnly': len(remote_only),
+        'uploaded': 0 if dry_run else len(to_upload),
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    print(f"{'Would upload' if dry_run else 'Uploaded'} {len(to_upload)} of {len(local)} files "
+          f"({len(new)} new, {len(changed)} changed), {len(unchanged)} unchanged, "
+          f"{len(remote_only)} only in the bucket, {report['seconds']}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload new and changed daily articles and the welcome text to S3')
+    parser.add_argument('--articles', default=os.path.join(SCRIPT_DIR, 'daily_articles'))
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Parallel uploads')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be uploaded')
+    parser.add_argument('--local-store', help='Publish into this folder (<folder>/<bucket>/<key>) instead of S3')
+    args = parser.parse_args()
+
+    if args.local_store:
+        sys.path.append(os.path.join(SCRIPT_DIR, 'dailyMotivationApp', 'fakes'))
+        from fake_s3 import FilesystemS3Client
+        s3_client = FilesystemS3Client(args.local_store)
+    else:
+        import boto3
+        from botocore.config import Config
+        # One connection per upload thread, the default pool holds 10
+        s3_client = boto3.client('s3', config=Config(max_pool_connections=max(10, args.workers)))
+
+    publish(s3_client, args.bucket, args.articles, args.workers, args.dry_run)
+    if hasattr(s3_client, 'request_count'):
+        print(f"Requests: {s3_client.request_count}")
+
+
+if __name__ == "__main__":
+    main()